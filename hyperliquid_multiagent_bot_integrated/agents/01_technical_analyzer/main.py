@@ -5,9 +5,16 @@ from typing import Dict, Any
 from shared.hyperliquid_data import fetch_ohlcv_hyperliquid
 from shared.models import TechnicalSnapshot, ServiceStatus
 from shared.logging_config import setup_logger
+from shared.serialization import install_codecs
+from shared import metrics
+from shared import profiling
+from shared import feature_bus
 from .indicators import compute_indicators
 
 app = FastAPI(title="Technical Analyzer - Hyperliquid")
+install_codecs(app)
+metrics.install_metrics(app, "technical_analyzer")
+profiling.install_profiling(app, "technical_analyzer")
 logger = setup_logger("technical_analyzer")
 
 
@@ -31,13 +38,15 @@ def health() -> ServiceStatus:
 
 @app.post("/analyze", response_model=AnalyzeResponse)
 def analyze(req: AnalyzeRequest):
-    logger.info(f"Analyzing {req.symbol} @ {req.interval}, limit={req.limit}")
-    df = fetch_ohlcv_hyperliquid(req.symbol, req.interval, req.limit)
+    logger.info("Analyzing %s @ %s, limit=%d", req.symbol, req.interval, req.limit)
+    with metrics.span("technical_analyzer", "fetch"):
+        df = fetch_ohlcv_hyperliquid(req.symbol, req.interval, req.limit)
     if df is None or df.empty:
-        logger.warning(f"No data for {req.symbol}")
+        logger.warning("No data for %s", req.symbol)
         raise HTTPException(status_code=400, detail="No data")
 
-    df = compute_indicators(df)
+    with metrics.span("technical_analyzer", "indicators"):
+        df = compute_indicators(df)
     last = df.iloc[-1]
 
     indicators = TechnicalSnapshot(
@@ -47,6 +56,7 @@ def analyze(req: AnalyzeRequest):
         atr=float(last["atr"]),
         pivot=float(last["pivot"]),
     )
+    feature_bus.publish("technical", req.symbol, indicators.dict())
     return AnalyzeResponse(
         ok=True,
         symbol=req.symbol,
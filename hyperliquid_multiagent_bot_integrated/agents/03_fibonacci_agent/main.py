@@ -1,12 +1,19 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 from shared.hyperliquid_data import fetch_ohlcv_hyperliquid
 from shared.models import FibonacciLevels, ServiceStatus
 from shared.logging_config import setup_logger
+from shared.serialization import install_codecs
+from shared import metrics
+from shared import profiling
+from shared import feature_bus
 
 app = FastAPI(title="Fibonacci Agent")
+install_codecs(app)
+metrics.install_metrics(app, "fibonacci_agent")
+profiling.install_profiling(app, "fibonacci_agent")
 logger = setup_logger("fibonacci_agent")
 
 
@@ -27,20 +34,15 @@ def health() -> ServiceStatus:
     return ServiceStatus(ok=True, details={"service": "fibonacci_agent"})
 
 
-@app.post("/analyze", response_model=FibResponse)
-def analyze(req: FibRequest):
-    df = fetch_ohlcv_hyperliquid(req.symbol, req.interval, req.lookback)
-    if df is None or df.empty:
-        logger.warning(f"No data for {req.symbol}")
-        raise HTTPException(status_code=400, detail="No data")
-
+def compute_levels(df) -> Optional[FibonacciLevels]:
+    """Livelli di ritracciamento tra max e min del periodo; None se il range è nullo."""
     high = df["high"].max()
     low = df["low"].min()
     diff = high - low
     if diff == 0:
-        raise HTTPException(status_code=400, detail="Invalid price range")
+        return None
 
-    levels = FibonacciLevels(
+    return FibonacciLevels(
         level_0=float(high),
         level_0236=float(high - 0.236 * diff),
         level_0382=float(high - 0.382 * diff),
@@ -50,4 +52,19 @@ def analyze(req: FibRequest):
         level_1=float(low),
     )
 
+
+@app.post("/analyze", response_model=FibResponse)
+def analyze(req: FibRequest):
+    with metrics.span("fibonacci_agent", "fetch"):
+        df = fetch_ohlcv_hyperliquid(req.symbol, req.interval, req.lookback)
+    if df is None or df.empty:
+        logger.warning("No data for %s", req.symbol)
+        raise HTTPException(status_code=400, detail="No data")
+
+    with metrics.span("fibonacci_agent", "indicators"):
+        levels = compute_levels(df)
+    if levels is None:
+        raise HTTPException(status_code=400, detail="Invalid price range")
+    feature_bus.publish("fibonacci", req.symbol, levels.dict())
+
     return FibResponse(ok=True, symbol=req.symbol, levels=levels)
@@ -5,8 +5,15 @@ from typing import Dict, Any
 from shared.hyperliquid_data import fetch_ohlcv_hyperliquid
 from shared.models import ServiceStatus
 from shared.logging_config import setup_logger
+from shared.serialization import install_codecs
+from shared import metrics
+from shared import profiling
+from shared import feature_bus
 
 app = FastAPI(title="Gann Agent")
+install_codecs(app)
+metrics.install_metrics(app, "gann_agent")
+profiling.install_profiling(app, "gann_agent")
 logger = setup_logger("gann_agent")
 
 
@@ -30,13 +37,15 @@ def health() -> ServiceStatus:
 
 @app.post("/analyze", response_model=GannResponse)
 def analyze(req: GannRequest):
-    df = fetch_ohlcv_hyperliquid(req.symbol, req.interval, req.lookback)
+    with metrics.span("gann_agent", "fetch"):
+        df = fetch_ohlcv_hyperliquid(req.symbol, req.interval, req.lookback)
     if df is None or df.empty:
-        logger.warning(f"No data for {req.symbol}")
+        logger.warning("No data for %s", req.symbol)
         raise HTTPException(status_code=400, detail="No data")
 
     last_price = float(df["close"].iloc[-1])
     # TODO: implementare logica Gann più evoluta
     hint = "gann_placeholder"
+    feature_bus.publish("gann", req.symbol, {"last_price": last_price})
 
     return GannResponse(ok=True, symbol=req.symbol, last_price=last_price, hint=hint)
@@ -5,10 +5,18 @@ import time, json, os
 
 from shared.models import SentimentSnapshot, ServiceStatus
 from shared.logging_config import setup_logger
+from shared.serialization import install_codecs
+from shared import metrics
+from shared import profiling
+from shared import clock
+from shared import feature_bus
 
-DATA_FILE = "/data/sentiment_cache.json"
+DATA_FILE = os.getenv("SENTIMENT_CACHE_FILE", "/data/sentiment_cache.json")
 
 app = FastAPI(title="Sentiment Agent")
+install_codecs(app)
+metrics.install_metrics(app, "sentiment_agent")
+profiling.install_profiling(app, "sentiment_agent")
 logger = setup_logger("sentiment_agent")
 
 
@@ -47,12 +55,15 @@ def health() -> ServiceStatus:
 @app.post("/analyze", response_model=SentimentResponse)
 def analyze(req: SentimentRequest):
     cache = load_cache()
-    now = int(time.time())
+    now = int(clock.now())
     key = req.symbol.upper()
     cached = cache.get(key)
-    if cached and now - cached["ts"] < 600:
-        logger.info(f"Using cached sentiment for {req.symbol}")
+    hit = bool(cached) and now - cached["ts"] < 600
+    metrics.cache_access("sentiment", hit)
+    if hit:
+        logger.info("Using cached sentiment for %s", req.symbol)
         snap = SentimentSnapshot(**cached["sentiment"])
+        feature_bus.publish("sentiment", req.symbol, {"score": snap.score})
         return SentimentResponse(ok=True, symbol=req.symbol, sentiment=snap, cached=True)
 
     # TODO: chiamare API reali per news/sentiment
@@ -60,5 +71,6 @@ def analyze(req: SentimentRequest):
 
     cache[key] = {"ts": now, "sentiment": sentiment.dict()}
     save_cache(cache)
+    feature_bus.publish("sentiment", req.symbol, {"score": sentiment.score})
 
     return SentimentResponse(ok=True, symbol=req.symbol, sentiment=sentiment, cached=False)
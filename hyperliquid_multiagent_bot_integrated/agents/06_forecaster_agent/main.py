@@ -7,8 +7,15 @@ from prophet import Prophet
 from shared.hyperliquid_data import fetch_ohlcv_hyperliquid
 from shared.models import ForecastSnapshot, ServiceStatus
 from shared.logging_config import setup_logger
+from shared.serialization import install_codecs
+from shared import metrics
+from shared import profiling
+from shared import feature_bus
 
 app = FastAPI(title="Forecaster Agent")
+install_codecs(app)
+metrics.install_metrics(app, "forecaster_agent")
+profiling.install_profiling(app, "forecaster_agent")
 logger = setup_logger("forecaster_agent")
 
 
@@ -29,13 +36,8 @@ def health() -> ServiceStatus:
     return ServiceStatus(ok=True, details={"service": "forecaster_agent"})
 
 
-@app.post("/forecast", response_model=ForecastResponse)
-def forecast(req: ForecastRequest):
-    df = fetch_ohlcv_hyperliquid(req.symbol, req.interval, 500)
-    if df is None or df.empty:
-        logger.warning(f"No data for {req.symbol}")
-        raise HTTPException(status_code=400, detail="No data")
-
+def prophet_forecast(df: pd.DataFrame, periods_ahead: int) -> ForecastSnapshot:
+    """Fit di Prophet sulle close e direzione a `periods_ahead` ore."""
     model_df = pd.DataFrame({
         "ds": pd.to_datetime(df["timestamp"], unit="ms"),
         "y": df["close"].astype(float),
@@ -43,10 +45,10 @@ def forecast(req: ForecastRequest):
 
     m = Prophet()
     m.fit(model_df)
-    future = m.make_future_dataframe(periods=req.periods_ahead, freq="H")
+    future = m.make_future_dataframe(periods=periods_ahead, freq="H")
     fcst = m.predict(future)
 
-    last_fcst = fcst.tail(req.periods_ahead)
+    last_fcst = fcst.tail(periods_ahead)
     start_price = float(model_df["y"].iloc[-1])
     end_price = float(last_fcst["yhat"].iloc[-1])
 
@@ -57,5 +59,22 @@ def forecast(req: ForecastRequest):
     else:
         direction = "flat"
 
-    snap = ForecastSnapshot(direction=direction, start_price=start_price, end_price=end_price)
+    return ForecastSnapshot(direction=direction, start_price=start_price, end_price=end_price)
+
+
+@app.post("/forecast", response_model=ForecastResponse)
+def forecast(req: ForecastRequest):
+    with metrics.span("forecaster_agent", "fetch"):
+        df = fetch_ohlcv_hyperliquid(req.symbol, req.interval, 500)
+    if df is None or df.empty:
+        logger.warning("No data for %s", req.symbol)
+        raise HTTPException(status_code=400, detail="No data")
+
+    with metrics.span("forecaster_agent", "indicators"):
+        snap = prophet_forecast(df, req.periods_ahead)
+    feature_bus.publish("forecast", req.symbol, {
+        "direction": {"up": 1.0, "down": -1.0}.get(snap.direction, 0.0),
+        "start_price": snap.start_price,
+        "end_price": snap.end_price,
+    })
     return ForecastResponse(ok=True, symbol=req.symbol, forecast=snap)
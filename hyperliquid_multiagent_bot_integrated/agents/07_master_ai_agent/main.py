@@ -1,15 +1,26 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel
 from typing import Dict, Any, List
-import os, httpx, json
+import os, json
 
-from shared.config import LLM_API_KEY, LLM_BASE_URL
+from shared.config import LLM_API_KEY, LLM_BASE_URL, FEATURE_BUS_MAX_AGE_SECONDS
 from shared.models import AIDecision, ServiceStatus
 from shared.logging_config import setup_logger
+from shared.serialization import install_codecs, read_body
+from shared import metrics
+from shared import profiling
+from shared.http_client import ServiceClient
+from shared import feature_bus
 
 app = FastAPI(title="Master AI Agent")
+install_codecs(app)
+metrics.install_metrics(app, "master_ai_agent")
+profiling.install_profiling(app, "master_ai_agent")
 logger = setup_logger("master_ai_agent")
 
+# Le chiamate LLM sono lente e costose: pochi retry, solo su errori transitori
+http = ServiceClient(timeout=60, retries=2, codec="json")
+
 
 class Context(BaseModel):
     symbol: str
@@ -23,6 +34,37 @@ class Context(BaseModel):
     max_positions: int = 3
 
 
+_CONTEXT_REQUIRED = ("symbol", "technical", "fibonacci", "gann", "sentiment", "forecast",
+                     "current_positions", "equity")
+# sezioni che, se assenti dal context, vengono lette dal feature bus
+_BUS_SECTIONS = ("technical", "fibonacci", "gann", "sentiment", "forecast")
+
+
+def _light_context(data: Any) -> Context:
+    """
+    Validazione leggera del context (hot path): controlla chiavi e scalari
+    senza ricostruire con pydantic tutte le risposte annidate degli agenti.
+    Le sezioni di analisi mancanti o ridotte (strip_section) sono completate dal feature bus.
+    """
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=422, detail="Context deve essere un oggetto")
+    if "symbol" in data:
+        for key in _BUS_SECTIONS:
+            if key not in data:
+                data[key] = feature_bus.read_section(key, data["symbol"], FEATURE_BUS_MAX_AGE_SECONDS)
+            elif isinstance(data[key], dict) and data[key].get("feature_bus"):
+                data[key] = feature_bus.merge_section(key, data[key], FEATURE_BUS_MAX_AGE_SECONDS)
+    missing = [k for k in _CONTEXT_REQUIRED if k not in data]
+    if missing:
+        raise HTTPException(status_code=422, detail=f"Campi mancanti nel context: {missing}")
+    try:
+        data["equity"] = float(data["equity"])
+        data["max_positions"] = int(data.get("max_positions", 3))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=422, detail="equity/max_positions non validi")
+    return Context.construct(**data)
+
+
 class DecisionResponse(BaseModel):
     ok: bool
     decision: AIDecision
@@ -37,7 +79,7 @@ def _safe_parse_decision(raw: str) -> AIDecision:
     try:
         data = json.loads(raw)
     except Exception as e:
-        logger.error(f"JSON parse error: {e} | raw={raw[:200]}")
+        logger.error("JSON parse error: %s | raw=%s", e, raw[:200])
         raise HTTPException(status_code=500, detail="Invalid JSON from LLM")
 
     action = str(data.get("action", "HOLD")).upper()
@@ -67,17 +109,50 @@ def _safe_parse_decision(raw: str) -> AIDecision:
     )
 
 
-@app.post("/decide", response_model=DecisionResponse)
-async def decide(ctx: Context):
+async def _llm_complete(system_prompt: str, user_prompt: str) -> str:
+    """Chiamata al LLM; ritorna il contenuto testuale della risposta.
+    Il replay la sostituisce con un mock deterministico."""
     if not LLM_API_KEY:
         raise HTTPException(status_code=500, detail="Missing LLM_API_KEY")
+    try:
+        r = await http.request(
+            "POST",
+            LLM_BASE_URL,
+            headers={"Authorization": f"Bearer {LLM_API_KEY}"},
+            json={
+                "model": "gpt-5.1",
+                "messages": [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt},
+                ],
+                "temperature": 0.2,
+            },
+        )
+    except Exception as e:
+        logger.error("LLM request error: %s", e)
+        raise HTTPException(status_code=500, detail="LLM request failed")
+
+    if r.status_code != 200:
+        logger.error("LLM error %s | %s", r.status_code, r.text[:300])
+        raise HTTPException(status_code=500, detail="LLM request failed")
+
+    data = r.json()
+    return data["choices"][0]["message"]["content"]
+
 
-    system_prompt_path = os.path.join(os.path.dirname(__file__), "system_prompt.txt")
-    with open(system_prompt_path) as f:
+_SYSTEM_PROMPT_PATH = os.path.join(os.path.dirname(__file__), "system_prompt.txt")
+
+
+@app.post("/decide", response_model=DecisionResponse)
+async def decide(request: Request):
+    data = await read_body(request)
+    ctx = _light_context(data)
+
+    with open(_SYSTEM_PROMPT_PATH) as f:
         system_prompt = f.read()
 
-    payload = ctx.dict()
-    logger.info(f"Requesting decision for {ctx.symbol}, equity={ctx.equity}")
+    payload = data
+    logger.info("Requesting decision for %s, equity=%s", ctx.symbol, ctx.equity)
 
     user_prompt = (
         "Analizza il contesto di mercato seguente e rispondi SOLO in JSON puro.\n"
@@ -92,27 +167,19 @@ async def decide(ctx: Context):
         f"Contesto:\n{json.dumps(payload, ensure_ascii=False, indent=2)}"
     )
 
-    async with httpx.AsyncClient(timeout=60) as client:
-        r = await client.post(
-            LLM_BASE_URL,
-            headers={"Authorization": f"Bearer {LLM_API_KEY}"},
-            json={
-                "model": "gpt-5.1",
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                "temperature": 0.2,
-            },
-        )
-        if r.status_code != 200:
-            logger.error(f"LLM error {r.status_code} | {r.text[:300]}")
-            raise HTTPException(status_code=500, detail="LLM request failed")
-
-        data = r.json()
-
-    content = data["choices"][0]["message"]["content"]
+    with metrics.span("master_ai_agent", "llm"):
+        content = await _llm_complete(system_prompt, user_prompt)
     decision = _safe_parse_decision(content)
-    logger.info(f"Decision for {ctx.symbol}: {decision.action} {decision.side} {decision.size_pct_balance}%")
+    logger.info("Decision for %s: %s %s %s%%", ctx.symbol, decision.action, decision.side, decision.size_pct_balance)
 
     return DecisionResponse(ok=True, decision=decision)
+
+
+@app.get("/http_stats")
+def http_stats() -> Dict[str, Any]:
+    return http.latency_stats()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await http.aclose()
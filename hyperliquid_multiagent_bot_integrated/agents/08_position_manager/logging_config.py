@@ -1,23 +0,0 @@
-import logging
-import sys
-
-
-def setup_logger(name: str) -> logging.Logger:
-    logger = logging.getLogger(name)
-
-    if logger.handlers:
-        return logger  # già configurato
-
-    logger.setLevel(logging.INFO)
-
-    handler = logging.StreamHandler(sys.stdout)
-    formatter = logging.Formatter(
-        "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
-    )
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
-
-    # Evita di propagare al root logger (meno doppioni)
-    logger.propagate = False
-
-    return logger
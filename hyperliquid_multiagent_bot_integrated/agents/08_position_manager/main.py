@@ -1,19 +1,79 @@
+import time
+
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from typing import List, Dict, Any
-import time
+from typing import List, Dict, Any, Optional
 
-from shared.config import HYPERLIQUID_TESTNET
+from shared.config import (
+    HYPERLIQUID_TESTNET, EXCHANGE_BACKEND, SYMBOLS, ACCOUNT_FILLS_STREAM, TRAILING_ENGINE_ENABLED,
+    TRAILING_STATE_DB, EXECUTION_LOG_DB,
+)
 from shared.hyperliquid_trader import HyperliquidTrader
+from shared.async_trader import AsyncHyperliquidTrader
+from shared.execution_log import ExecutionLog
+from shared.trailing_engine import TrailingEngine
+from shared.trailing_store import TrailingStore
 from shared.models import ServiceStatus
 from shared.logging_config import setup_logger
+from shared.serialization import install_codecs
+from shared import metrics
+from shared import profiling
+from shared import clock
 
 logger = setup_logger("position_manager")
 
 app = FastAPI(title="Position Manager – Hyperliquid")
+install_codecs(app)
+metrics.install_metrics(app, "position_manager")
+profiling.install_profiling(app, "position_manager")
 
 # Trader Hyperliquid (usa testnet/mainnet da env)
-trader = HyperliquidTrader(testnet=HYPERLIQUID_TESTNET)
+if EXCHANGE_BACKEND == "fake":
+    from shared.fake_exchange import FakeExchange, FakeInfo, FakeMarket
+
+    market = FakeMarket(symbols=SYMBOLS)
+    trader = HyperliquidTrader(info=FakeInfo(market), exchange=FakeExchange(market), address="fake")
+else:
+    # il fake exchange riparte vuoto: persistere il suo stato non avrebbe senso
+    store = TrailingStore(TRAILING_STATE_DB) if TRAILING_STATE_DB else None
+    trader = HyperliquidTrader(testnet=HYPERLIQUID_TESTNET, store=store,
+                               executions=ExecutionLog(EXECUTION_LOG_DB or None))
+
+# open/close dagli handler async: I/O in thread, passi indipendenti in parallelo
+atrader = AsyncHyperliquidTrader(trader)
+
+# Trailing continuo nel servizio (intervallo breve + eventi prezzo);
+# /tick_trailing resta per l'orchestratore e il replay
+engine = TrailingEngine(trader)
+
+
+def _on_mids(msg: Dict[str, Any]) -> None:
+    trader.prices.put(msg.get("data", {}).get("mids", {}))
+    engine.notify()
+
+
+@app.on_event("startup")
+def start_trailing_engine():
+    # prima gli SL salvati, poi subito un tick: stop nativi verificati prima di servire richieste
+    try:
+        if trader.restore_trailing_state()["restored"]:
+            trader.update_trailing_stops()
+    except Exception as e:
+        logger.error("❌ Ripristino stato trailing fallito: %s", e)
+    if not TRAILING_ENGINE_ENABLED:
+        return
+    if ACCOUNT_FILLS_STREAM and hasattr(trader.info, "subscribe"):
+        # websocket già aperto per i fill: ogni allMids anticipa il tick
+        try:
+            trader.info.subscribe({"type": "allMids"}, _on_mids)
+        except Exception as e:
+            logger.warning("Stream allMids non disponibile, solo intervallo: %s", e)
+    engine.start()
+
+
+@app.on_event("shutdown")
+def stop_trailing_engine():
+    engine.stop()
 
 
 class OpenPositionRequest(BaseModel):
@@ -21,10 +81,12 @@ class OpenPositionRequest(BaseModel):
     side: str          # "long" / "short"
     size_usd: float
     max_risk_pct: float = 2.0   # per ora solo informativo
+    decision_ts: Optional[float] = None  # epoch s della decisione (log di esecuzione)
 
 
 class ClosePositionRequest(BaseModel):
     symbol: str
+    decision_ts: Optional[float] = None
 
 
 class PositionOut(BaseModel):
@@ -48,6 +110,24 @@ class SimpleResponse(BaseModel):
     extra: Dict[str, Any] = {}
 
 
+class BulkOrder(BaseModel):
+    symbol: str
+    action: str                  # "open" / "close"
+    side: Optional[str] = None   # solo open
+    size_usd: float = 0.0        # solo open
+    max_risk_pct: float = 2.0    # come in OpenPositionRequest: solo informativo
+    decision_ts: Optional[float] = None
+
+
+class BulkExecuteRequest(BaseModel):
+    orders: List[BulkOrder]
+
+
+class BulkExecuteResponse(BaseModel):
+    ok: bool
+    results: List[Dict[str, Any]]
+
+
 class TrailingResponse(BaseModel):
     ok: bool
     trailing: List[Dict[str, Any]]
@@ -61,7 +141,7 @@ def health() -> ServiceStatus:
 @app.get("/positions", response_model=PositionsResponse)
 def get_positions() -> PositionsResponse:
     raw_positions = trader.get_open_positions()
-    now = int(time.time())
+    now = int(clock.now())
 
     out: List[PositionOut] = []
     for p in raw_positions:
@@ -88,8 +168,23 @@ def get_positions() -> PositionsResponse:
     return PositionsResponse(ok=True, positions=out)
 
 
+@app.get("/prices")
+def get_prices() -> Dict[str, Any]:
+    """Snapshot dei mid condiviso con gli altri servizi (stessa cache del trailing)."""
+    prices = trader.prices.snapshot()
+    age = trader.prices.age()
+    return {"ok": True, "age_s": None if age is None else round(age, 3), "prices": prices}
+
+
+@app.get("/assets")
+def get_assets() -> Dict[str, Any]:
+    """Metadati d'ordine per symbol (passo size/prezzo, notional minimo, leva max)."""
+    return {"ok": True, "assets": trader.assets.snapshot()}
+
+
 @app.post("/open_position", response_model=SimpleResponse)
-def open_position(req: OpenPositionRequest) -> SimpleResponse:
+async def open_position(req: OpenPositionRequest) -> SimpleResponse:
+    execution = {"decision": req.decision_ts, "received": time.time()}
     symbol = req.symbol.upper()
     side = req.side.lower().strip()
 
@@ -100,37 +195,78 @@ def open_position(req: OpenPositionRequest) -> SimpleResponse:
         raise HTTPException(status_code=400, detail="size_usd deve essere > 0.")
 
     logger.info(
-        f"▶️ Richiesta OPEN {symbol} {side} size={req.size_usd:.2f} USD (max_risk={req.max_risk_pct}%)"
+        "▶️ Richiesta OPEN %s %s size=%.2f USD (max_risk=%s%%)", symbol, side, req.size_usd, req.max_risk_pct
     )
 
     sl_pct = float(req.max_risk_pct) / 100.0
 
-    res = trader.open_position(symbol=symbol, side=side, usd_amount=req.size_usd, sl_pct=sl_pct)
+    with metrics.span("position_manager", "execution"):
+        res = await atrader.open_position(symbol=symbol, side=side, usd_amount=req.size_usd, sl_pct=sl_pct,
+                                          execution=execution)
     if not res.get("ok"):
-        raise HTTPException(status_code=500, detail=f"Errore apertura posizione: {res.get('error')}")
+        # ordine sotto i minimi dell'exchange: errore del chiamante, non del servizio
+        status = 400 if res.get("invalid") else 500
+        raise HTTPException(status_code=status, detail=f"Errore apertura posizione: {res.get('error')}")
 
     return SimpleResponse(ok=True, detail="Position opened", extra={"response": res.get("response")})
 
 
 @app.post("/close_position", response_model=SimpleResponse)
-def close_position(req: ClosePositionRequest) -> SimpleResponse:
+async def close_position(req: ClosePositionRequest) -> SimpleResponse:
+    execution = {"decision": req.decision_ts, "received": time.time()}
     symbol = req.symbol.upper()
-    logger.info(f"▶️ Richiesta CLOSE {symbol}")
+    logger.info("▶️ Richiesta CLOSE %s", symbol)
 
-    res = trader.close_position(symbol)
+    with metrics.span("position_manager", "execution"):
+        res = await atrader.close_position(symbol, execution=execution)
     if not res.get("ok"):
         raise HTTPException(status_code=500, detail=f"Errore chiusura posizione: {res.get('error')}")
 
     return SimpleResponse(ok=True, detail="Position closed", extra={"response": res.get("response")})
 
 
+@app.post("/bulk_execute", response_model=BulkExecuteResponse)
+async def bulk_execute(req: BulkExecuteRequest) -> BulkExecuteResponse:
+    """OPEN/CLOSE di più symbol in un'unica azione bulk sull'exchange; un risultato per ordine."""
+    received = time.time()
+    orders = []
+    for o in req.orders:
+        action = o.action.lower().strip()
+        if action == "open" and o.size_usd <= 0:
+            raise HTTPException(status_code=400, detail=f"size_usd deve essere > 0 ({o.symbol}).")
+        orders.append({"symbol": o.symbol.upper(), "action": action, "side": (o.side or "").lower().strip(),
+                       "size_usd": o.size_usd,
+                       "execution": {"decision": o.decision_ts, "received": received}})
+    logger.info("▶️ Richiesta BULK %d ordini", len(orders))
+
+    with metrics.span("position_manager", "execution"):
+        results = await atrader.bulk_execute(orders)
+    return BulkExecuteResponse(ok=all(r["ok"] for r in results), results=results)
+
+
+@app.get("/execution_stats")
+def execution_stats(symbol: Optional[str] = None, window_s: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Percentili di latenza per fase (decisione -> ricezione -> invio -> ack -> fill, in ms)
+    e dello slippage (bps) degli ultimi ordini; `window_s` limita agli ultimi N secondi.
+    """
+    since = clock.now() - window_s if window_s else None
+    return {"ok": True, **trader.executions.summary(symbol.upper() if symbol else None, since)}
+
+
+@app.get("/executions")
+def executions(limit: int = 50) -> Dict[str, Any]:
+    """Ultimi ordini con i timestamp di ogni fase, prezzo atteso e di fill."""
+    return {"ok": True, "executions": trader.executions.recent(limit)}
+
+
 @app.post("/tick_trailing", response_model=TrailingResponse)
 def tick_trailing() -> TrailingResponse:
-    logger.info("🔁 Tick trailing stops (update_trailing_stops)")
+    logger.debug("🔁 Tick trailing stops (update_trailing_stops)")
     try:
         trailing_info = trader.update_trailing_stops()
     except Exception as e:
-        logger.error(f"❌ Errore in update_trailing_stops: {e}")
+        logger.error("❌ Errore in update_trailing_stops: %s", e)
         raise HTTPException(status_code=500, detail="Errore nel trailing stop")
 
     return TrailingResponse(ok=True, trailing=trailing_info)
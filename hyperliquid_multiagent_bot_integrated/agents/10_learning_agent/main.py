@@ -4,13 +4,23 @@ from typing import Dict, Any, List
 
 from shared.models import TradeRecord, ServiceStatus
 from shared.logging_config import setup_logger
+from shared.decision_journal import DecisionJournal
+from shared import metrics
+from shared import profiling
 
 TRADES_FILE = "/data/trades_history.json"
 SUGGESTIONS_FILE = "/data/strategy_suggestions.json"
+JOURNAL_FILE = "/data/ai_decisions.db"
+
+EVOLUTION_INTERVAL_SECONDS = 48 * 3600
 
 app = FastAPI(title="Learning Agent ProFiT")
+metrics.install_metrics(app, "learning_agent")
+profiling.install_profiling(app, "learning_agent")
 logger = setup_logger("learning_agent")
 
+journal = DecisionJournal(JOURNAL_FILE, readonly=True)
+
 
 @app.get("/health", response_model=ServiceStatus)
 def health() -> ServiceStatus:
@@ -19,7 +29,7 @@ def health() -> ServiceStatus:
 
 async def evolution_loop():
     while True:
-        await asyncio.sleep(48 * 3600)  # 48 ore
+        await asyncio.sleep(EVOLUTION_INTERVAL_SECONDS)  # 48 ore
 
         if not os.path.exists(TRADES_FILE):
             continue
@@ -28,7 +38,7 @@ async def evolution_loop():
             with open(TRADES_FILE, "r") as f:
                 raw_trades = json.load(f)
         except Exception as e:
-            logger.error(f"Error reading trades file: {e}")
+            logger.error("Error reading trades file: %s", e)
             continue
 
         trades: List[TradeRecord] = []
@@ -45,11 +55,16 @@ async def evolution_loop():
         wins = [t for t in trades if t.pnl > 0]
         win_rate = len(wins) / total * 100
 
+        # Decisioni AI della finestra di evoluzione (dal journal)
+        since = int(time.time()) - EVOLUTION_INTERVAL_SECONDS
+        decision_counts = await asyncio.to_thread(journal.action_counts, since)
+
         suggestions = {
             "timestamp": int(time.time()),
             "stats": {
                 "total_trades": total,
                 "win_rate": win_rate,
+                "decisions": decision_counts,
             },
             "proposed_params": {
                 "max_positions": 3,
@@ -74,7 +89,7 @@ async def evolution_loop():
         with open(SUGGESTIONS_FILE, "w") as f:
             json.dump(history, f, ensure_ascii=False, indent=2)
 
-        logger.info(f"Learning cycle completed, win_rate={win_rate:.2f}%")
+        logger.info("Learning cycle completed, win_rate=%.2f%%", win_rate)
 
 
 @app.on_event("startup")
@@ -0,0 +1,199 @@
+"""
+Indice dei metadati degli asset (passo di size e prezzo, notional minimo,
+leva massima) per costruire ordini validi al primo colpo.
+
+Caricato una volta dall'exchange (Hyperliquid `meta`, Bybit
+instruments-info) e poi riletto in background ogni ASSET_META_REFRESH_SECONDS:
+get() è un lookup su dict e non aspetta mai il refresh. Lo usano sia
+HyperliquidTrader che il position manager Bybit.
+"""
+import threading
+import time
+from decimal import ROUND_DOWN, ROUND_HALF_UP, Decimal
+from typing import Any, Callable, Dict, Optional
+
+from .config import ASSET_META_REFRESH_SECONDS, ASSET_META_RETRY_SECONDS
+from .logging_config import setup_logger
+
+logger = setup_logger("asset_meta")
+
+# regole Hyperliquid per i perp: prezzi con max 5 cifre significative
+# e max (6 - szDecimals) decimali; ordini sotto 10 USD rifiutati
+HL_SIG_FIGS = 5
+HL_MAX_PRICE_DECIMALS = 6
+HL_MIN_NOTIONAL = 10.0
+
+
+class AssetSpec:
+    """Regole d'ordine di un asset. price_step None = solo regola delle cifre significative (Hyperliquid)."""
+
+    def __init__(self, symbol: str, size_step: float, price_step: Optional[float] = None,
+                 price_decimals: Optional[int] = None, sig_figs: Optional[int] = None,
+                 min_size: float = 0.0, min_notional: float = 0.0, max_leverage: float = 1.0):
+        self.symbol = symbol
+        # normalize: 100.0 -> 1E+2, così format_size non aggiunge decimali che il passo non ha
+        self.size_step = Decimal(str(size_step)).normalize()
+        self.price_step = Decimal(str(price_step)).normalize() if price_step else None
+        self.price_decimals = price_decimals
+        self.sig_figs = sig_figs
+        self.min_size = float(min_size)
+        self.min_notional = float(min_notional)
+        self.max_leverage = float(max_leverage)
+
+    def round_size(self, size: float) -> float:
+        """Size per difetto al passo (mai più del richiesto)."""
+        steps = (Decimal(str(size)) / self.size_step).to_integral_value(rounding=ROUND_DOWN)
+        return float(steps * self.size_step)
+
+    def format_size(self, size: float) -> str:
+        return format(Decimal(str(self.round_size(size))).quantize(self.size_step), "f")
+
+    def round_price(self, px: float) -> float:
+        if px <= 0:
+            return px
+        if self.price_step is not None:
+            steps = (Decimal(str(px)) / self.price_step).to_integral_value(rounding=ROUND_HALF_UP)
+            return float(steps * self.price_step)
+        px = float(f"{px:.{self.sig_figs or HL_SIG_FIGS}g}")
+        return round(px, self.price_decimals) if self.price_decimals is not None else px
+
+    def check(self, size: float, px: float) -> Optional[str]:
+        """Motivo per cui l'exchange rifiuterebbe l'ordine, o None."""
+        if size <= 0 or size < self.min_size:
+            return f"size {size} sotto il minimo {self.min_size} per {self.symbol}"
+        if size * px < self.min_notional:
+            return f"notional {size * px:.2f} sotto il minimo {self.min_notional:.2f} per {self.symbol}"
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "symbol": self.symbol,
+            "size_step": float(self.size_step),
+            "price_step": float(self.price_step) if self.price_step is not None else None,
+            "price_decimals": self.price_decimals,
+            "min_size": self.min_size,
+            "min_notional": self.min_notional,
+            "max_leverage": self.max_leverage,
+        }
+
+
+Loader = Callable[[], Dict[str, AssetSpec]]
+
+
+class AssetIndex:
+    """
+    symbol -> AssetSpec. Il primo get() carica in modo sincrono; quando i
+    dati sono più vecchi di `refresh_seconds` il reload parte in un thread
+    e intanto si risponde con i dati precedenti. Dopo un caricamento
+    fallito non si riprova prima di `retry_seconds` (intanto get() -> None).
+    """
+
+    def __init__(self, loader: Loader, refresh_seconds: float = ASSET_META_REFRESH_SECONDS,
+                 retry_seconds: float = ASSET_META_RETRY_SECONDS):
+        self.loader = loader
+        self.refresh_seconds = float(refresh_seconds)
+        self.retry_seconds = float(retry_seconds)
+        self._specs: Dict[str, AssetSpec] = {}
+        self._loaded_at: Optional[float] = None
+        self._retry_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def refresh(self) -> bool:
+        try:
+            specs = self.loader()
+        except Exception as e:
+            logger.warning("Metadati asset non disponibili, riprovo tra %.0fs: %s", self.retry_seconds, e)
+            specs = None
+        finally:
+            self._refreshing = False
+        if not specs:
+            self._retry_at = time.monotonic() + self.retry_seconds
+            return False
+        self._specs = specs
+        self._loaded_at = time.monotonic()
+        self._retry_at = None
+        logger.info("Metadati asset caricati: %d symbol", len(specs))
+        return True
+
+    def _backoff(self) -> bool:
+        return self._retry_at is not None and time.monotonic() < self._retry_at
+
+    def _ensure(self) -> None:
+        if self._backoff():
+            return
+        if self._loaded_at is None:
+            with self._lock:
+                if self._loaded_at is None and not self._backoff():
+                    self.refresh()
+        elif time.monotonic() - self._loaded_at > self.refresh_seconds and not self._refreshing:
+            self._refreshing = True
+            threading.Thread(target=self.refresh, name="asset-meta", daemon=True).start()
+
+    def get(self, symbol: str) -> Optional[AssetSpec]:
+        self._ensure()
+        return self._specs.get(symbol.upper())
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        self._ensure()
+        return {s: spec.to_dict() for s, spec in self._specs.items()}
+
+
+# ----------------------------------------------------------------------
+# Loader per exchange
+# ----------------------------------------------------------------------
+
+def hyperliquid_loader(info: Any) -> Loader:
+    """Da Info.meta(): universe [{"name", "szDecimals", "maxLeverage"}]."""
+
+    def load() -> Dict[str, AssetSpec]:
+        specs: Dict[str, AssetSpec] = {}
+        for asset in (info.meta() or {}).get("universe", []):
+            if asset.get("isDelisted"):
+                continue
+            sz_decimals = int(asset.get("szDecimals", 0))
+            name = str(asset["name"]).upper()
+            specs[name] = AssetSpec(
+                name,
+                size_step=10.0 ** -sz_decimals,
+                price_decimals=max(0, HL_MAX_PRICE_DECIMALS - sz_decimals),
+                sig_figs=HL_SIG_FIGS,
+                min_size=10.0 ** -sz_decimals,
+                min_notional=HL_MIN_NOTIONAL,
+                max_leverage=float(asset.get("maxLeverage", 1)),
+            )
+        return specs
+
+    return load
+
+
+def bybit_loader(session: Any, category: str = "linear") -> Loader:
+    """Da get_instruments_info (paginato): lotSizeFilter, priceFilter, leverageFilter."""
+
+    def load() -> Dict[str, AssetSpec]:
+        specs: Dict[str, AssetSpec] = {}
+        cursor = None
+        while True:
+            kwargs = {"category": category, "limit": 1000}
+            if cursor:
+                kwargs["cursor"] = cursor
+            r = session.get_instruments_info(**kwargs)
+            if r.get("retCode") != 0:
+                raise RuntimeError(f"instruments-info: {r.get('retMsg')}")
+            result = r.get("result", {})
+            for inst in result.get("list", []):
+                lot, price, lev = inst.get("lotSizeFilter", {}), inst.get("priceFilter", {}), inst.get("leverageFilter", {})
+                specs[inst["symbol"]] = AssetSpec(
+                    inst["symbol"],
+                    size_step=float(lot.get("qtyStep", "0.001")),
+                    price_step=float(price.get("tickSize", "0.01")),
+                    min_size=float(lot.get("minOrderQty", 0) or 0),
+                    min_notional=float(lot.get("minNotionalValue", 0) or 0),
+                    max_leverage=float(lev.get("maxLeverage", 1) or 1),
+                )
+            cursor = result.get("nextPageCursor")
+            if not cursor:
+                return specs
+
+    return load
+
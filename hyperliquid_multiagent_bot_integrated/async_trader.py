@@ -0,0 +1,73 @@
+"""
+Variante async di HyperliquidTrader per gli handler async del position manager.
+
+L'SDK hyperliquid è sincrono: ogni chiamata gira in un thread
+(asyncio.to_thread) e un semaforo limita le richieste all'exchange in volo
+(EXCHANGE_MAX_INFLIGHT), così un burst di open/close non occupa tutto il
+threadpool né martella l'API. All'apertura update_leverage e lettura del
+prezzo si sovrappongono, poi market_open; alla chiusura lo stop nativo si
+cancella solo dopo il fill di market_close (se la chiusura fallisce la
+posizione resta protetta).
+
+Lo stato (trailing_state, cache prezzi e account) resta quello del trader
+sincrono avvolto, quindi le due interfacce si possono usare insieme.
+"""
+import asyncio
+from typing import Any, Callable, Dict, List, Optional
+
+from .config import EXCHANGE_MAX_INFLIGHT
+from .hyperliquid_trader import HyperliquidTrader
+from .logging_config import setup_logger
+
+logger = setup_logger("AsyncHyperliquidTrader")
+
+
+class AsyncHyperliquidTrader:
+    def __init__(self, trader: HyperliquidTrader, max_inflight: int = EXCHANGE_MAX_INFLIGHT):
+        self.trader = trader
+        self.max_inflight = int(max_inflight)
+        self._sem: Optional[asyncio.Semaphore] = None
+
+    def __getattr__(self, name: str) -> Any:
+        # attributi sincroni (prices, trailing_state, ...) dal trader avvolto
+        return getattr(self.trader, name)
+
+    async def _call(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_inflight)
+        async with self._sem:
+            return await asyncio.to_thread(fn, *args)
+
+    async def open_position(self, symbol: str, side: str, usd_amount: float, sl_pct: float,
+                            execution: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        t = self.trader
+        execution = t._execution(execution)
+        side = t._check_side(side)
+        _, px = await asyncio.gather(self._call(t._set_leverage, symbol), self._call(t._get_last_price, symbol))
+        execution["expected_px"] = px
+        try:
+            size = t._usd_to_size(symbol, usd_amount, px)
+            resp = await self._call(t._market_open, symbol, side, size, usd_amount, sl_pct, execution)
+        except Exception as e:
+            return t._open_failed(symbol, side, execution, e)
+        return await self._call(t._after_open, symbol, side, resp, execution)
+
+    async def close_position(self, symbol: str, execution: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        t = self.trader
+        execution = t._execution(execution)
+        try:
+            resp = await self._call(t._market_close, symbol, execution)
+        except Exception as e:
+            logger.error("❌ Errore chiusura posizione %s: %s", symbol, e)
+            t._log_execution(symbol, "close", (t.trailing_state.get(symbol) or {}).get("side"), execution, None)
+            return {"ok": False, "error": str(e)}
+        return await self._call(t._after_close, symbol, resp, execution)
+
+    async def bulk_execute(self, orders: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return await self._call(self.trader.bulk_execute, orders)
+
+    async def get_open_positions(self) -> List[Dict[str, Any]]:
+        return await self._call(self.trader.get_open_positions)
+
+    async def update_trailing_stops(self) -> List[Dict[str, Any]]:
+        return await self._call(self.trader.update_trailing_stops)
@@ -0,0 +1,31 @@
+"""Rende importabile la root del progetto come package `shared` (come nei container)."""
+import importlib.util
+import os
+import sys
+from types import ModuleType
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def register_shared() -> ModuleType:
+    if "shared" in sys.modules:
+        return sys.modules["shared"]
+    spec = importlib.util.spec_from_file_location(
+        "shared", os.path.join(ROOT, "__init__.py"), submodule_search_locations=[ROOT]
+    )
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules["shared"] = mod
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def load_module(relpath: str, name: str) -> ModuleType:
+    """Carica un modulo per path (es. agents/07_master_ai_agent/main.py)."""
+    register_shared()
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, relpath))
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[name] = mod
+    spec.loader.exec_module(mod)
+    return mod
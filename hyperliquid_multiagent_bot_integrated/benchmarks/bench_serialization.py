@@ -0,0 +1,110 @@
+"""
+Micro-benchmark dell'overhead di serializzazione per ciclo dell'orchestrator.
+
+Per ogni symbol un ciclo fa: 5 risposte degli agenti (encode lato agente,
+decode lato orchestrator), il context verso /decide (encode, decode e
+validazione lato master) e la risposta con la decisione. Confronta:
+
+- before: json stdlib + validazione pydantic completa del Context + ctx.dict()
+- after:  codec negoziato (msgpack, o orjson) + validazione leggera
+
+Uso: python benchmarks/bench_serialization.py [--symbols 8] [--cycles 200]
+"""
+import argparse
+import json
+import random
+import time
+import warnings
+
+from _bootstrap import load_module, register_shared
+
+warnings.filterwarnings("ignore", category=DeprecationWarning)  # .dict() su pydantic v2
+register_shared()
+from shared.serialization import JSON, MSGPACK, dumps, loads, msgpack  # noqa: E402
+
+master = load_module("agents/07_master_ai_agent/main.py", "master_ai_agent_main")
+
+
+def _agent_responses(symbol: str, rnd: random.Random):
+    px = rnd.uniform(1, 60000)
+    tech = {"ok": True, "symbol": symbol, "interval": "15m",
+            "indicators": {"rsi": rnd.uniform(0, 100), "macd": rnd.gauss(0, 5),
+                           "macd_signal": rnd.gauss(0, 5), "atr": px * 0.01, "pivot": px}}
+    fib = {"ok": True, "symbol": symbol,
+           "levels": {k: px * f for k, f in [("level_0", 1.1), ("level_0236", 1.07), ("level_0382", 1.05),
+                                            ("level_0500", 1.0), ("level_0618", 0.97),
+                                            ("level_0786", 0.94), ("level_1", 0.9)]}}
+    gann = {"ok": True, "symbol": symbol, "last_price": px, "hint": "gann_placeholder"}
+    sent = {"ok": True, "symbol": symbol, "cached": True,
+            "sentiment": {"score": 0.0, "label": "neutral", "sources": []}}
+    fcst = {"ok": True, "symbol": symbol,
+            "forecast": {"direction": "flat", "start_price": px, "end_price": px * 1.002}}
+    return [tech, fib, gann, sent, fcst]
+
+
+def _context(symbol: str, responses):
+    tech, fib, gann, sent, fcst = responses
+    return {"symbol": symbol, "technical": tech, "fibonacci": fib, "gann": gann,
+            "sentiment": sent, "forecast": fcst,
+            "current_positions": [{"symbol": symbol, "side": "long", "size_usd": 100.0,
+                                   "entry_price": 1.0, "pnl": 0.5, "leverage": 1.0,
+                                   "ts_open": 1700000000}],
+            "equity": 1000.0, "max_positions": 3}
+
+
+DECISION = {"ok": True, "decision": {"action": "HOLD", "side": None, "size_pct_balance": 1.0,
+                                     "target_leverage": 1.0, "reason": "range, nessun segnale"}}
+
+
+def cycle_before(workload):
+    for responses, ctx in workload:
+        for resp in responses:
+            json.loads(json.dumps(resp, ensure_ascii=False, allow_nan=False, separators=(",", ":")))
+        body = json.dumps(ctx, ensure_ascii=False, separators=(",", ":"))
+        validated = master.Context(**json.loads(body))
+        validated.dict()
+        json.loads(json.dumps(DECISION, ensure_ascii=False, separators=(",", ":")))
+
+
+def cycle_after(workload, ct):
+    for responses, ctx in workload:
+        for resp in responses:
+            loads(dumps(resp, ct), ct)
+        master._light_context(loads(dumps(ctx, ct), ct))
+        loads(dumps(DECISION, ct), ct)
+
+
+def _time(fn, cycles: int) -> float:
+    fn()  # warmup
+    t0 = time.perf_counter()
+    for _ in range(cycles):
+        fn()
+    return (time.perf_counter() - t0) / cycles * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--symbols", type=int, default=8)
+    ap.add_argument("--cycles", type=int, default=200)
+    args = ap.parse_args()
+
+    rnd = random.Random(42)
+    workload = []
+    for i in range(args.symbols):
+        sym = f"SYM{i}"
+        responses = _agent_responses(sym, rnd)
+        workload.append((responses, _context(sym, responses)))
+
+    before = _time(lambda: cycle_before(workload), args.cycles)
+    rows = [("before (json + pydantic)", before)]
+    rows.append(("after  (orjson/json + light)", _time(lambda: cycle_after(workload, JSON), args.cycles)))
+    if msgpack is not None:
+        rows.append(("after  (msgpack + light)", _time(lambda: cycle_after(workload, MSGPACK), args.cycles)))
+
+    print(f"Serializzazione per ciclo, {args.symbols} symbol, {args.cycles} cicli")
+    for name, us in rows:
+        print(f"  {name:<32} {us:10.1f} us/ciclo   x{before / us:4.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+Suite di micro-benchmark dei percorsi caldi, con baseline e soglie di regressione.
+
+Gira offline: i dati sono fixture deterministiche (candele sintetiche con
+seed fisso, exchange fake, journal su cartella temporanea). Per ogni caso
+misura il tempo per chiamata come minimo su --rounds round alternati tra i
+casi, ciascuno di --repeat ripetizioni brevi (GC disattivato, come timeit),
+e lo confronta con baselines.json: se supera baseline * (1 + soglia) è una
+regressione e il processo esce con codice 1. La soglia è per caso dove serve
+(es. il journal, che dipende dal filesystem).
+baselines.json si scrive solo con --update: un caso senza baseline viene
+misurato e segnalato, non confrontato.
+
+Uso:
+    python benchmarks/suite.py                 # confronta con le baseline
+    python benchmarks/suite.py --only journal  # solo i casi che contengono "journal"
+    python benchmarks/suite.py --update        # riscrive le baseline (macchina di riferimento)
+
+Casi con dipendenze opzionali assenti (es. prophet) sono segnalati come skip.
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import warnings
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+from _bootstrap import load_module, register_shared  # noqa: E402
+
+register_shared()
+from shared import clock  # noqa: E402
+from shared.hyperliquid_data import RecordedCandles  # noqa: E402
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+DEFAULT_THRESHOLD = 0.25
+MIN_REPEAT_SECONDS = 0.002
+FIXTURE_START = 1704067200  # 2024-01-01 UTC
+
+
+class Skip(Exception):
+    pass
+
+
+def _fixture_candles() -> RecordedCandles:
+    clock.use_sim_clock(FIXTURE_START)
+    return RecordedCandles.synthetic(["BTC", "ETH", "SOL"], FIXTURE_START - 30 * 86400,
+                                     FIXTURE_START, "15m", seed=42)
+
+
+# ----------------------------------------------------------------------
+# Casi: ogni setup ritorna (funzione da misurare, chiamate per ripetizione)
+# ----------------------------------------------------------------------
+
+def case_compute_indicators() -> Tuple[Callable[[], Any], int]:
+    indicators = load_module("agents/01_technical_analyzer/indicators.py", "bench_indicators")
+    df = _fixture_candles()("BTC", "15m", 200)
+    return (lambda: indicators.compute_indicators(df)), 20
+
+
+def case_fibonacci_levels() -> Tuple[Callable[[], Any], int]:
+    fib = load_module("agents/03_fibonacci_agent/main.py", "bench_fibonacci_main")
+    df = _fixture_candles()("BTC", "4h", 100)
+    return (lambda: fib.compute_levels(df)), 500
+
+
+def case_prophet_forecast() -> Tuple[Callable[[], Any], int]:
+    try:
+        import prophet  # noqa: F401
+    except ImportError:
+        raise Skip("prophet non installato")
+    fcst = load_module("agents/06_forecaster_agent/main.py", "bench_forecaster_main")
+    df = _fixture_candles()("BTC", "1h", 500)
+    return (lambda: fcst.prophet_forecast(df, 24)), 1
+
+
+def case_safe_parse_decision() -> Tuple[Callable[[], Any], int]:
+    master = load_module("agents/07_master_ai_agent/main.py", "master_ai_agent_main")
+    raw = json.dumps({"action": "open", "side": "Long", "size_pct_balance": 4.5,
+                      "target_leverage": 1, "reason": "breakout sopra la resistenza con volume " * 4})
+    return (lambda: master._safe_parse_decision(raw)), 2000
+
+
+def case_journal_append_flush() -> Tuple[Callable[[], Any], int]:
+    from shared.decision_journal import DecisionJournal
+
+    journal = DecisionJournal(os.path.join(tempfile.mkdtemp(prefix="bench_journal_"), "j.db"))
+    candles = _fixture_candles()
+    df = candles("BTC", "15m", 200)
+    records = []
+    for i in range(100):
+        px = float(df["close"].iloc[i])
+        ctx = {"symbol": "BTC",
+               "technical": {"ok": True, "indicators": {"rsi": 50.0 + i % 20, "atr": px * 0.01, "pivot": px}},
+               "fibonacci": {"ok": True, "levels": {"level_0": px * 1.1, "level_1": px * 0.9}},
+               "gann": {"ok": True, "last_price": px, "hint": "gann_placeholder"},
+               "sentiment": {"ok": True, "sentiment": {"score": 0.0, "label": "neutral", "sources": []}},
+               "forecast": {"ok": False, "error": "prophet"},
+               "current_positions": [], "equity": 1000.0, "max_positions": 3}
+        records.append({"ts": FIXTURE_START + i, "symbol": "BTC", "context": ctx,
+                        "decision": {"action": "HOLD", "side": None, "size_pct_balance": 1.0,
+                                     "target_leverage": 1.0, "reason": "nessun segnale"}})
+
+    def run():
+        for r in records:
+            journal.append(r)
+        journal.flush()
+
+    return run, 1
+
+
+def case_update_trailing_stops() -> Tuple[Callable[[], Any], int]:
+    from shared.fake_exchange import FakeExchange, FakeInfo, FakeMarket
+    from shared.hyperliquid_trader import HyperliquidTrader
+
+    candles = _fixture_candles()
+    market = FakeMarket(candles.last_price, symbols=candles.symbols)
+    trader = HyperliquidTrader(info=FakeInfo(market, candles), exchange=FakeExchange(market), address="bench")
+    for sym, side in (("BTC", "long"), ("ETH", "short"), ("SOL", "long")):
+        trader.open_position(sym, side, usd_amount=100.0, sl_pct=0.02)
+    return trader.update_trailing_stops, 200
+
+
+def case_trailing_book_300pos() -> Tuple[Callable[[], Any], int]:
+    import numpy as np
+    from shared.trailing_engine import TrailingBook
+
+    rng = np.random.default_rng(42)
+    entry = rng.uniform(10.0, 1000.0, 300)
+    positions = [{"symbol": f"C{i}", "side": "long" if i % 2 else "short",
+                  "entry_price": float(px), "size": 1.0} for i, px in enumerate(entry)]
+    book = TrailingBook()
+    book.sync(positions, {}, 0.02)
+    # prezzi entro ±1.5%: qualche SL migliora, nessuno stop viene toccato dal reset
+    last = entry * (1.0 + rng.uniform(-0.015, 0.015, 300))
+
+    def run():
+        book.sl_pct[:] = -0.02
+        book.evaluate(last, 0.02)
+
+    return run, 2000
+
+
+def case_bybit_guardian_pass() -> Tuple[Callable[[], Any], int]:
+    bybit = load_module("lcz_position_manager_bybit.py", "bench_bybit")
+
+    class _Client:
+        def set_trading_stop(self, **kwargs):
+            return {"retCode": 0}
+
+    positions = []
+    for i in range(30):
+        sym = ("BTCUSDT", "ETHUSDT", "SOLUSDT")[i % 3]
+        entry = 100.0 + i
+        # un terzo oltre il trigger di break-even, il resto no
+        mark = entry * (1.02 if i % 3 == 0 else 1.001)
+        positions.append({"symbol": sym, "side": "Buy" if i % 2 else "Sell", "size": 1.0,
+                          "entry_price": entry, "leverage": 1.0, "pnl": 0.0, "stop_loss": 0.0,
+                          "take_profit": 0.0, "mark_price": mark})
+    client = _Client()
+    # ogni spostamento logga un WARNING: fuori dalla misura
+    bybit.logger.setLevel(logging.ERROR)
+
+    return (lambda: bybit.guardian_pass(positions, client)), 200
+
+
+CASES: Dict[str, Callable[[], Tuple[Callable[[], Any], int]]] = {
+    "compute_indicators": case_compute_indicators,
+    "fibonacci_levels": case_fibonacci_levels,
+    "prophet_forecast": case_prophet_forecast,
+    "safe_parse_decision": case_safe_parse_decision,
+    "journal_append_flush_100": case_journal_append_flush,
+    "update_trailing_stops_3pos": case_update_trailing_stops,
+    "trailing_book_300pos": case_trailing_book_300pos,
+    "bybit_guardian_pass_30pos": case_bybit_guardian_pass,
+}
+
+
+# ----------------------------------------------------------------------
+# Runner
+# ----------------------------------------------------------------------
+
+def measure(fn: Callable[[], Any], number: int, repeat: int, min_time: float = MIN_REPEAT_SECONDS) -> float:
+    """
+    Microsecondi per chiamata: minimo tra le ripetizioni (dopo un warmup, GC
+    disattivato come in timeit). `number` cresce finché una ripetizione dura
+    almeno min_time, così anche i casi da pochi microsecondi hanno finestre
+    misurabili.
+    """
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        fn()
+        while True:
+            t0 = time.perf_counter()
+            for _ in range(number):
+                fn()
+            elapsed = time.perf_counter() - t0
+            if elapsed >= min_time:
+                break
+            number *= max(2, min(10, int(min_time / max(elapsed, 1e-9)) + 1))
+        best = elapsed / number
+        for _ in range(repeat - 1):
+            t0 = time.perf_counter()
+            for _ in range(number):
+                fn()
+            best = min(best, (time.perf_counter() - t0) / number)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return best * 1e6
+
+
+def load_baselines() -> Dict[str, Any]:
+    if not os.path.exists(BASELINES):
+        return {"threshold": DEFAULT_THRESHOLD, "cases": {}}
+    with open(BASELINES) as f:
+        return json.load(f)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--only", help="esegue solo i casi il cui nome contiene questa stringa")
+    ap.add_argument("--repeat", type=int, default=20, help="ripetizioni per round")
+    ap.add_argument("--rounds", type=int, default=5, help="round alternati tra i casi (si tiene il minimo)")
+    ap.add_argument("--update", action="store_true", help="riscrive baselines.json con i valori misurati")
+    args = ap.parse_args()
+
+    baselines = load_baselines()
+    default_threshold = float(baselines.get("threshold", DEFAULT_THRESHOLD))
+    cases = baselines.setdefault("cases", {})
+
+    selected: Dict[str, Tuple[Callable[[], Any], int]] = {}
+    skipped: Dict[str, str] = {}
+    for name, setup in CASES.items():
+        if args.only and args.only not in name:
+            continue
+        try:
+            selected[name] = setup()
+        except Skip as e:
+            skipped[name] = str(e)
+
+    # round alternati: il rumore della macchina arriva a fasi di qualche secondo,
+    # il minimo su campioni sparsi nel tempo ne trova almeno uno pulito per caso
+    best = {name: float("inf") for name in selected}
+    for _ in range(max(1, args.rounds)):
+        for name, (fn, number) in selected.items():
+            best[name] = min(best[name], measure(fn, number, args.repeat))
+
+    regressions: List[str] = []
+    unknown: List[str] = []
+    print(f"{'caso':<30} {'us/call':>12} {'baseline':>12} {'delta':>8}")
+    for name in CASES:
+        if name in skipped:
+            print(f"{name:<30} {'skip':>12}   ({skipped[name]})")
+            continue
+        if name not in best:
+            continue
+        us = best[name]
+
+        base: Optional[Dict[str, Any]] = cases.get(name)
+        if args.update:
+            cases[name] = {**(base or {}), "us": round(us, 2)}
+            print(f"{name:<30} {us:12.2f} {'(aggiornata)':>12}")
+            continue
+        if base is None:
+            unknown.append(name)
+            print(f"{name:<30} {us:12.2f} {'(nessuna)':>12}")
+            continue
+
+        delta = us / base["us"] - 1.0
+        limit = float(base.get("threshold", default_threshold))
+        flag = "  REGRESSIONE" if delta > limit else ""
+        print(f"{name:<30} {us:12.2f} {base['us']:12.2f} {delta:+8.1%}{flag}")
+        if flag:
+            regressions.append(f"{name} {delta:+.1%} (soglia {limit:.0%})")
+
+    stale = sorted(set(cases) - set(CASES))
+    if args.update:
+        for name in stale:
+            del cases[name]
+        with open(BASELINES, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+    else:
+        if unknown:
+            print(f"\nAttenzione: casi senza baseline (non confrontati, usare --update): {', '.join(unknown)}")
+        if stale:
+            print(f"\nAttenzione: baseline di casi inesistenti: {', '.join(stale)}")
+
+    if regressions:
+        print(f"\nRegressioni: {'; '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
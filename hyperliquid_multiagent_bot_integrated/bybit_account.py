@@ -0,0 +1,225 @@
+"""
+Stato account Bybit (saldo, posizioni, mark price) tenuto aggiornato dagli
+stream WebSocket invece che da REST ad ogni lettura.
+
+- stream privati `position` e `wallet`: posizioni e saldo USDT
+- stream pubblico `tickers.<SYMBOL>`: mark price (e PnL non realizzato)
+
+Lo snapshot REST (`loader`, es. get_wallet_data del position manager) serve
+all'avvio, dopo invalidate() e come riconciliazione periodica ogni
+`reconcile_seconds` (messaggi persi durante una riconnessione). Senza stream
+attivi si torna a REST con TTL `rest_ttl`.
+
+I listener (add_listener) ricevono il symbol ad ogni mark price di una
+posizione aperta: il guardiano li usa per reagire entro il tick invece di
+aspettare il suo intervallo. FakeBybitStream fa da stand-in degli stream
+pybit nei test.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .logging_config import setup_logger
+
+logger = setup_logger("bybit_account")
+
+Loader = Callable[[], Tuple[float, List[Dict[str, Any]]]]
+
+
+def _f(value: Any, default: float = 0.0) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def position_from_stream(p: Dict[str, Any]) -> Dict[str, Any]:
+    """Messaggio `position` v5 -> stesso formato di get_wallet_data."""
+    return {
+        "symbol": p["symbol"],
+        "side": p["side"],
+        "size": _f(p.get("size")),
+        "entry_price": _f(p.get("avgPrice") or p.get("entryPrice")),
+        "leverage": _f(p.get("leverage"), 1.0),
+        "pnl": _f(p.get("unrealisedPnl")),
+        "stop_loss": _f(p.get("stopLoss")),
+        "take_profit": _f(p.get("takeProfit")),
+        "mark_price": _f(p.get("markPrice")),
+    }
+
+
+class BybitAccountCache:
+    def __init__(self, loader: Loader, rest_ttl: float = 30.0, reconcile_seconds: float = 300.0,
+                 coin: str = "USDT"):
+        self.loader = loader
+        self.rest_ttl = float(rest_ttl)
+        self.reconcile_seconds = float(reconcile_seconds)
+        self.coin = coin
+        self.balance = 0.0
+        self.positions: Dict[str, Dict[str, Any]] = {}
+        self.marks: Dict[str, float] = {}
+        self.streaming = False
+        self.stream_events = 0
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._listeners: List[Callable[[str], None]] = []
+
+    # ------------------------------------------------------------------
+    # Snapshot REST
+    # ------------------------------------------------------------------
+
+    def refresh(self) -> bool:
+        """Snapshot completo da REST: sostituisce posizioni e saldo."""
+        try:
+            balance, positions = self.loader()
+        except Exception as e:
+            logger.warning("Snapshot account Bybit fallito: %s", e)
+            return False
+        with self._lock:
+            self.balance = balance
+            self.positions = {p["symbol"]: dict(p) for p in positions}
+            for p in self.positions.values():
+                # mark dallo stream più recente di quello dello snapshot
+                if p["symbol"] in self.marks:
+                    self._apply_mark(p, self.marks[p["symbol"]])
+            self._loaded_at = time.monotonic()
+        return True
+
+    def invalidate(self) -> None:
+        """Dopo un ordine: la prossima lettura rifà lo snapshot REST."""
+        self._loaded_at = None
+
+    def _ensure(self) -> None:
+        loaded = self._loaded_at
+        max_age = self.reconcile_seconds if self.streaming else self.rest_ttl
+        if loaded is not None and time.monotonic() - loaded < max_age:
+            return
+        with self._refresh_lock:
+            # chi aspettava il lock trova lo snapshot appena fatto
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= max_age:
+                self.refresh()
+
+    def snapshot(self) -> Tuple[float, List[Dict[str, Any]]]:
+        """(saldo, posizioni) come get_wallet_data, senza REST se gli stream sono attivi."""
+        self._ensure()
+        with self._lock:
+            return self.balance, [dict(p) for p in self.positions.values()]
+
+    def price(self, symbol: str) -> Optional[float]:
+        """Ultimo mark price dallo stream ticker, se c'è."""
+        return self.marks.get(symbol)
+
+    def patch_position(self, symbol: str, **fields: Any) -> None:
+        """Aggiornamento locale in attesa del messaggio `position` (es. SL appena spostato)."""
+        with self._lock:
+            if symbol in self.positions:
+                self.positions[symbol].update(fields)
+
+    def add_listener(self, callback: Callable[[str], None]) -> None:
+        self._listeners.append(callback)
+
+    # ------------------------------------------------------------------
+    # Stream
+    # ------------------------------------------------------------------
+
+    def attach(self, private: Any = None, public: Any = None, symbols: Iterable[str] = ()) -> None:
+        """
+        Si iscrive agli stream (pybit WebSocket o FakeBybitStream):
+        `private` con position_stream/wallet_stream, `public` con ticker_stream.
+        """
+        if private is not None:
+            private.position_stream(callback=self.on_position)
+            private.wallet_stream(callback=self.on_wallet)
+            self.streaming = True
+        symbols = list(symbols)
+        if public is not None and symbols:
+            public.ticker_stream(symbol=symbols, callback=self.on_ticker)
+
+    def on_position(self, msg: Dict[str, Any]) -> None:
+        with self._lock:
+            for raw in msg.get("data", []):
+                if raw.get("category", "linear") != "linear":
+                    continue
+                p = position_from_stream(raw)
+                if p["size"] > 0:
+                    if p["symbol"] in self.marks:
+                        self._apply_mark(p, self.marks[p["symbol"]])
+                    self.positions[p["symbol"]] = p
+                else:
+                    self.positions.pop(p["symbol"], None)
+            self.stream_events += 1
+
+    def on_wallet(self, msg: Dict[str, Any]) -> None:
+        with self._lock:
+            for account in msg.get("data", []):
+                for coin in account.get("coin", []):
+                    if coin.get("coin") == self.coin:
+                        self.balance = _f(coin.get("walletBalance"), self.balance)
+            self.stream_events += 1
+
+    def on_ticker(self, msg: Dict[str, Any]) -> None:
+        data = msg.get("data") or {}
+        mark = data.get("markPrice")  # i delta lo omettono se non è cambiato
+        if mark is None:
+            return
+        symbol, mark = data.get("symbol"), _f(mark)
+        with self._lock:
+            self.marks[symbol] = mark
+            pos = self.positions.get(symbol)
+            if pos is not None:
+                self._apply_mark(pos, mark)
+        if pos is not None:
+            for callback in self._listeners:
+                try:
+                    callback(symbol)
+                except Exception as e:
+                    logger.warning("Listener mark price fallito: %s", e)
+
+    @staticmethod
+    def _apply_mark(pos: Dict[str, Any], mark: float) -> None:
+        sign = 1.0 if pos["side"] == "Buy" else -1.0
+        pos["mark_price"] = mark
+        pos["pnl"] = sign * pos["size"] * (mark - pos["entry_price"])
+
+
+class FakeBybitStream:
+    """
+    Stand-in di pybit.unified_trading.WebSocket (privato e pubblico insieme)
+    per i test: push_*() consegnano i messaggi nel formato v5 ai callback.
+    """
+
+    def __init__(self):
+        self._callbacks: Dict[str, List[Callable[[Dict[str, Any]], None]]] = {}
+
+    def _on(self, topic: str, callback: Callable[[Dict[str, Any]], None]) -> None:
+        self._callbacks.setdefault(topic, []).append(callback)
+
+    def position_stream(self, callback):
+        self._on("position", callback)
+
+    def wallet_stream(self, callback):
+        self._on("wallet", callback)
+
+    def ticker_stream(self, symbol, callback):
+        for s in [symbol] if isinstance(symbol, str) else symbol:
+            self._on(f"tickers.{s}", callback)
+
+    def _push(self, topic: str, data: Any) -> None:
+        msg = {"topic": topic, "ts": int(time.time() * 1000), "data": data}
+        for callback in self._callbacks.get(topic, []):
+            callback(msg)
+
+    def push_position(self, symbol: str, side: str, size: float, entry_price: float, mark_price: float,
+                      stop_loss: float = 0.0, take_profit: float = 0.0, leverage: float = 1.0) -> None:
+        self._push("position", [{
+            "category": "linear", "symbol": symbol, "side": side if size else "", "size": str(size),
+            "entryPrice": str(entry_price), "leverage": str(leverage), "markPrice": str(mark_price),
+            "unrealisedPnl": "0", "stopLoss": str(stop_loss or ""), "takeProfit": str(take_profit or ""),
+        }])
+
+    def push_wallet(self, balance: float, coin: str = "USDT") -> None:
+        self._push("wallet", [{"accountType": "UNIFIED", "coin": [{"coin": coin, "walletBalance": str(balance)}]}])
+
+    def push_ticker(self, symbol: str, mark_price: float) -> None:
+        self._push(f"tickers.{symbol}", {"symbol": symbol, "markPrice": str(mark_price)})
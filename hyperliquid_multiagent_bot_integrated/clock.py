@@ -0,0 +1,43 @@
+import time
+from typing import Callable
+
+# Sorgente del tempo per il codice del percorso di trading (scheduler, record,
+# feature bus, fake exchange). In produzione è time.time; il replay installa
+# un SimClock per far avanzare il tempo più veloce del reale.
+_now: Callable[[], float] = time.time
+
+
+def now() -> float:
+    return _now()
+
+
+def set_clock(fn: Callable[[], float]) -> None:
+    global _now
+    _now = fn
+
+
+def reset_clock() -> None:
+    set_clock(time.time)
+
+
+class SimClock:
+    """Orologio simulato: il tempo avanza solo con advance()/set()."""
+
+    def __init__(self, start: float):
+        self.t = float(start)
+
+    def __call__(self) -> float:
+        return self.t
+
+    def advance(self, seconds: float) -> float:
+        self.t += max(0.0, float(seconds))
+        return self.t
+
+    def set(self, ts: float) -> None:
+        self.t = float(ts)
+
+
+def use_sim_clock(start: float) -> SimClock:
+    clock = SimClock(start)
+    set_clock(clock)
+    return clock
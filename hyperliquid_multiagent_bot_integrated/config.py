@@ -1,4 +1,5 @@
 import os
+import socket
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,8 +11,94 @@ HYPERLIQUID_TESTNET = os.getenv("HYPERLIQUID_TESTNET", "true").lower() == "true"
 LLM_API_KEY = os.getenv("LLM_API_KEY", "")
 LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://api.deepseek.com/v1/chat/completions")
 
-SYMBOLS = ["BTC", "ETH", "SOL", "DOGE", "SUI", "ADA", "AAVE", "AVAX"]
+# Endpoint /info di Hyperliquid per le candele degli agenti (vuoto = nessun fetch)
+HYPERLIQUID_INFO_URL = os.getenv("HYPERLIQUID_INFO_URL", "")
+
+# Universo dei symbol; override con SYMBOLS=BTC,ETH,... (es. per i load test)
+SYMBOLS = [
+    s.strip().upper()
+    for s in os.getenv("SYMBOLS", "BTC,ETH,SOL,DOGE,SUI,ADA,AAVE,AVAX").split(",")
+    if s.strip()
+]
 
 MAX_POSITIONS = int(os.getenv("MAX_POSITIONS", "3"))
 ANALYSIS_INTERVAL_SECONDS = int(os.getenv("ANALYSIS_INTERVAL_SECONDS", str(15 * 60)))
 TRAILING_TICK_SECONDS = int(os.getenv("TRAILING_TICK_SECONDS", "60"))
+
+# URL dei servizi chiamati dall'orchestrator (default: host di docker-compose).
+# Gli override servono per esecuzioni fuori da compose (es. load test locale);
+# in monolith mode gli agenti sono risolti dall'host, quindi vanno lasciati di default.
+TECHNICAL_ANALYZER_URL = os.getenv("TECHNICAL_ANALYZER_URL", "http://technical_analyzer:8000")
+FIBONACCI_AGENT_URL = os.getenv("FIBONACCI_AGENT_URL", "http://fibonacci_agent:8000")
+GANN_AGENT_URL = os.getenv("GANN_AGENT_URL", "http://gann_agent:8000")
+SENTIMENT_AGENT_URL = os.getenv("SENTIMENT_AGENT_URL", "http://sentiment_agent:8000")
+FORECASTER_AGENT_URL = os.getenv("FORECASTER_AGENT_URL", "http://forecaster_agent:8000")
+MASTER_AI_AGENT_URL = os.getenv("MASTER_AI_AGENT_URL", "http://master_ai_agent:8000")
+POSITION_MANAGER_URL = os.getenv("POSITION_MANAGER_URL", "http://position_manager:8000")
+
+# Exchange usato dal position_manager: "hyperliquid" oppure "fake"
+# (shared/fake_exchange.py, prezzi dalla sorgente candele: replay e load test)
+EXCHANGE_BACKEND = os.getenv("EXCHANGE_BACKEND", "hyperliquid").lower()
+
+# --- SHARDING ORCHESTRATOR (più istanze, symbol divisi per consistent hashing) ---
+ORCHESTRATOR_SHARDING = os.getenv("ORCHESTRATOR_SHARDING", "false").lower() == "true"
+NODE_ID = os.getenv("NODE_ID", socket.gethostname())
+CLUSTER_DB = os.getenv("CLUSTER_DB", "/data/orchestrator_cluster.db")
+# Un nodo senza heartbeat da più di così perde i suoi symbol
+SHARD_LEASE_TTL_SECONDS = int(os.getenv("SHARD_LEASE_TTL_SECONDS", "180"))
+# Cadenza dell'heartbeat (task separato dal ciclo di analisi): ben sotto il TTL
+SHARD_HEARTBEAT_SECONDS = int(os.getenv("SHARD_HEARTBEAT_SECONDS", "60"))
+
+# --- FEATURE BUS (mmap su /data/feature_bus, scritto dagli agenti di analisi) ---
+# Se true l'orchestrator non rimanda al master i valori numerici già pubblicati sul bus:
+# il master li legge direttamente dal file (il resto delle sezioni resta nel body)
+FEATURE_BUS_CONTEXT = os.getenv("FEATURE_BUS_CONTEXT", "false").lower() == "true"
+# Età massima di un record del bus perché sia usato nel context
+FEATURE_BUS_MAX_AGE_SECONDS = int(os.getenv("FEATURE_BUS_MAX_AGE_SECONDS", "900"))
+
+# --- CACHE PREZZI (allMids: una chiamata per tutti i symbol) ---
+# Età massima dello snapshot dei mid prima di richiederne uno nuovo
+PRICE_CACHE_TTL_SECONDS = float(os.getenv("PRICE_CACHE_TTL_SECONDS", "2"))
+# Dopo un allMids fallito non si riprova prima di questi secondi (le letture non bloccano)
+PRICE_CACHE_RETRY_SECONDS = float(os.getenv("PRICE_CACHE_RETRY_SECONDS", "5"))
+# Oltre questa età i mid non si usano più: niente prezzo invece di un prezzo vecchio
+PRICE_CACHE_MAX_AGE_SECONDS = float(os.getenv("PRICE_CACHE_MAX_AGE_SECONDS", "30"))
+
+# --- CACHE STATO ACCOUNT (user_state nel trader) ---
+# Le letture entro il TTL condividono lo stesso snapshot; open/close lo invalidano
+ACCOUNT_STATE_TTL_SECONDS = float(os.getenv("ACCOUNT_STATE_TTL_SECONDS", "5"))
+# Se true il trader si iscrive allo stream userFills (websocket) e invalida
+# lo stato ad ogni fill, anche quelli non partiti da lui (es. trigger sull'exchange)
+ACCOUNT_FILLS_STREAM = os.getenv("ACCOUNT_FILLS_STREAM", "false").lower() == "true"
+
+# --- STOP NATIVI (trigger order sull'exchange al posto del solo polling) ---
+# Se true ogni posizione ha uno stop trigger reduce-only a riposo sull'exchange,
+# spostato con modify (in batch) quando il trailing migliora lo SL
+TRAILING_NATIVE_STOPS = os.getenv("TRAILING_NATIVE_STOPS", "true").lower() == "true"
+# Slippage massimo del limit dello stop (trigger market)
+STOP_ORDER_SLIPPAGE = float(os.getenv("STOP_ORDER_SLIPPAGE", "0.05"))
+# Stato trailing persistito (write-through) per ripartire senza perdere gli SL in profitto;
+# vuoto = solo in memoria
+TRAILING_STATE_DB = os.getenv("TRAILING_STATE_DB", "/data/trailing_state.db")
+
+# --- TRADER ASYNC ---
+# Max richieste all'exchange in volo dagli handler async del position manager
+EXCHANGE_MAX_INFLIGHT = int(os.getenv("EXCHANGE_MAX_INFLIGHT", "4"))
+# L'orchestratore raccoglie gli OPEN/CLOSE del ciclo e li manda insieme a /bulk_execute
+BULK_EXECUTION = os.getenv("BULK_EXECUTION", "true").lower() == "true"
+
+# --- TRAILING ENGINE (nel position manager, indipendente dal ciclo dell'orchestratore) ---
+TRAILING_ENGINE_ENABLED = os.getenv("TRAILING_ENGINE_ENABLED", "true").lower() == "true"
+TRAILING_ENGINE_INTERVAL_SECONDS = float(os.getenv("TRAILING_ENGINE_INTERVAL_SECONDS", "5"))
+
+# --- METADATI ASSET (passi size/prezzo, notional minimo, leva max) ---
+ASSET_META_REFRESH_SECONDS = float(os.getenv("ASSET_META_REFRESH_SECONDS", "3600"))
+# Dopo un caricamento fallito (anche il primo) non si riprova prima di questi secondi
+ASSET_META_RETRY_SECONDS = float(os.getenv("ASSET_META_RETRY_SECONDS", "30"))
+
+# --- LOG DI ESECUZIONE (latenza decisione -> fill e slippage per ordine) ---
+# File SQLite del log (vuoto = solo in memoria); ultime N righe per /execution_stats
+EXECUTION_LOG_DB = os.getenv("EXECUTION_LOG_DB", "/data/executions.db")
+EXECUTION_LOG_WINDOW = int(os.getenv("EXECUTION_LOG_WINDOW", "2000"))
+# Righe più vecchie di così vengono cancellate dal file (all'avvio e poi ogni ora)
+EXECUTION_LOG_RETENTION_DAYS = float(os.getenv("EXECUTION_LOG_RETENTION_DAYS", "30"))
@@ -1,34 +1,55 @@
 from fastapi import FastAPI, Request
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-import json, os, time
+from typing import Optional
+import time
 
 from shared.logging_config import setup_logger
+from shared.decision_journal import DecisionJournal
+from shared import feature_bus
+from shared import metrics
+from shared import profiling
 
 app = FastAPI(title="Hyperliquid Multi-Agent Dashboard")
+metrics.install_metrics(app, "dashboard")
+profiling.install_profiling(app, "dashboard")
 logger = setup_logger("dashboard")
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
-DATA_FILE = "/data/ai_decisions.json"
+JOURNAL_FILE = "/data/ai_decisions.db"
+
+journal = DecisionJournal(JOURNAL_FILE, readonly=True)
 
 
 @app.get("/")
-def index(request: Request):
-    history = []
-    if os.path.exists(DATA_FILE):
-        try:
-            with open(DATA_FILE, "r") as f:
-                history = json.load(f)
-        except Exception as e:
-            logger.error(f"Error reading {DATA_FILE}: {e}")
-    history = history[-100:]
+def index(request: Request, symbol: Optional[str] = None):
+    history = journal.recent(limit=100, symbol=symbol.upper() if symbol else None)
     return templates.TemplateResponse(
         "index.html",
         {
             "request": request,
-            "decisions": list(reversed(history)),
+            "decisions": history,
             "generated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
         },
     )
+
+
+@app.get("/api/decisions")
+def api_decisions(limit: int = 100, symbol: Optional[str] = None,
+                  since: Optional[int] = None, until: Optional[int] = None,
+                  include_context: bool = False):
+    """Senza include_context le sezioni del context sono riferimenti {"$ref": hash} (deduplicate)."""
+    limit = max(1, min(limit, 1000))
+    return journal.recent(limit=limit, symbol=symbol.upper() if symbol else None,
+                          since=since, until=until, include_context=include_context)
+
+
+@app.get("/api/features")
+def api_features(symbol: Optional[str] = None):
+    """Ultime feature pubblicate dagli agenti sul feature bus."""
+    snap = feature_bus.snapshot_all()
+    if symbol:
+        snap = {agent: {s: v for s, v in recs.items() if s == symbol.upper()} for agent, recs in snap.items()}
+    return snap
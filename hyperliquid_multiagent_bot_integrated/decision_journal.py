@@ -0,0 +1,358 @@
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+from . import metrics
+from .logging_config import setup_logger
+
+logger = setup_logger("decision_journal")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS decisions (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts      INTEGER NOT NULL,
+    symbol  TEXT NOT NULL,
+    action  TEXT,
+    body    TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_decisions_ts ON decisions(ts);
+CREATE INDEX IF NOT EXISTS idx_decisions_symbol_ts ON decisions(symbol, ts);
+CREATE TABLE IF NOT EXISTS context_blobs (
+    hash     TEXT PRIMARY KEY,
+    body     TEXT NOT NULL,
+    last_id  INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_context_blobs_last_id ON context_blobs(last_id);
+"""
+
+_REF = "$ref"
+
+
+def _canonical(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def _is_ref(value: Any) -> bool:
+    return isinstance(value, dict) and len(value) == 1 and _REF in value
+
+
+_STOP = object()
+
+
+class DecisionJournal:
+    """
+    Journal append-only delle decisioni AI su SQLite (WAL).
+
+    - append() mette il record in coda e ritorna subito: la scrittura
+      avviene in un thread dedicato, a batch, in una sola transazione.
+    - Indici su ts e (symbol, ts) per le letture di dashboard e learning agent.
+    - Compattazione periodica in background: tiene gli ultimi `retention`
+      record e fa checkpoint del WAL.
+    - Il context è content-addressed: ogni componente (technical, fibonacci,
+      gann, ...) è salvato una sola volta in context_blobs sotto il suo hash
+      e il record contiene solo {"$ref": hash}. Il context completo si
+      ricostruisce solo quando richiesto (resolve_context / include_context).
+
+    Con readonly=True non parte il writer (uso lato dashboard / learning agent).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        retention: int = 50000,
+        compact_interval: float = 600.0,
+        readonly: bool = False,
+    ):
+        self.path = path
+        self.retention = int(retention)
+        self.compact_interval = float(compact_interval)
+        self.readonly = readonly
+
+        self._local = threading.local()
+        self._blob_cache: "OrderedDict[str, Any]" = OrderedDict()
+        self._blob_cache_lock = threading.Lock()
+        self._queue: "queue.SimpleQueue[Any]" = queue.SimpleQueue()
+        self._writer: Optional[threading.Thread] = None
+
+        if not readonly:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            conn = self._connect()
+            conn.executescript(_SCHEMA)
+            conn.commit()
+            self._writer = threading.Thread(target=self._writer_loop, name="decision-journal", daemon=True)
+            self._writer.start()
+
+    # ------------------------------------------------------------------
+    # Connessioni
+    # ------------------------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        """Una connessione per thread (sqlite3 non le condivide)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        if self.readonly:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=5.0)
+        else:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        conn.row_factory = sqlite3.Row
+        self._local.conn = conn
+        return conn
+
+    # ------------------------------------------------------------------
+    # Scrittura
+    # ------------------------------------------------------------------
+
+    def append(self, record: Dict[str, Any]) -> None:
+        """Accoda un record {ts, symbol, context, decision}. Non blocca mai."""
+        if self.readonly:
+            raise RuntimeError("DecisionJournal aperto in sola lettura")
+        self._queue.put(record)
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Attende che i record in coda siano scritti (utile in shutdown)."""
+        if self._writer is None:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self) -> None:
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join(timeout=5.0)
+
+    def _writer_loop(self) -> None:
+        conn = self._connect()
+        last_compact = time.monotonic()
+
+        while True:
+            timeout = max(0.1, self.compact_interval - (time.monotonic() - last_compact))
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            batch: List[Dict[str, Any]] = []
+            waiters: List[threading.Event] = []
+            stop = False
+            while item is not None:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if len(batch) >= 500:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    item = None
+
+            if batch:
+                try:
+                    self._insert(conn, batch)
+                except Exception as e:
+                    logger.error("Errore scrittura journal (%s record): %s", len(batch), e)
+            for w in waiters:
+                w.set()
+
+            if time.monotonic() - last_compact >= self.compact_interval:
+                try:
+                    self.compact(conn)
+                except Exception as e:
+                    logger.error("Errore compattazione journal: %s", e)
+                last_compact = time.monotonic()
+
+            if stop:
+                return
+
+    def _insert(self, conn: sqlite3.Connection, batch: List[Dict[str, Any]]) -> None:
+        with conn:
+            for rec in batch:
+                decision = rec.get("decision") or {}
+                context, blobs = self._split_context(rec.get("context") or {})
+                body = dict(rec)
+                body["context"] = context
+                cur = conn.execute(
+                    "INSERT INTO decisions (ts, symbol, action, body) VALUES (?, ?, ?, ?)",
+                    (
+                        int(rec.get("ts", time.time())),
+                        str(rec.get("symbol", "")),
+                        decision.get("action"),
+                        json.dumps(body, ensure_ascii=False, separators=(",", ":")),
+                    ),
+                )
+                if blobs:
+                    conn.executemany(
+                        "INSERT INTO context_blobs (hash, body, last_id) VALUES (?, ?, ?) "
+                        "ON CONFLICT(hash) DO UPDATE SET last_id = excluded.last_id",
+                        [(h, b, cur.lastrowid) for h, b in blobs.items()],
+                    )
+
+    @staticmethod
+    def _split_context(context: Dict[str, Any]):
+        """Sostituisce i componenti strutturati del context con {"$ref": hash}."""
+        out: Dict[str, Any] = {}
+        blobs: Dict[str, str] = {}
+        for key, value in context.items():
+            if isinstance(value, (dict, list)) and value:
+                body = _canonical(value)
+                h = hashlib.blake2b(body.encode("utf-8"), digest_size=16).hexdigest()
+                blobs[h] = body
+                out[key] = {_REF: h}
+            else:
+                out[key] = value
+        return out, blobs
+
+    def compact(self, conn: Optional[sqlite3.Connection] = None) -> int:
+        """Applica la retention e fa checkpoint del WAL. Ritorna i record rimossi."""
+        conn = conn or self._connect()
+        with conn:
+            cur = conn.execute(
+                "DELETE FROM decisions WHERE id <= (SELECT MAX(id) FROM decisions) - ?",
+                (self.retention,),
+            )
+            removed = cur.rowcount or 0
+            # blob non più referenziati da nessun record rimasto
+            cur = conn.execute(
+                "DELETE FROM context_blobs WHERE last_id < (SELECT COALESCE(MIN(id), 0) FROM decisions)"
+            )
+            removed_blobs = cur.rowcount or 0
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        if removed or removed_blobs:
+            logger.info("Journal compattato: rimossi %s record, %s blob di context", removed, removed_blobs)
+        return removed
+
+    def import_legacy_json(self, legacy_path: str) -> int:
+        """Importa una volta il vecchio ai_decisions.json se il journal è vuoto."""
+        if not os.path.exists(legacy_path) or self.count() > 0:
+            return 0
+        try:
+            with open(legacy_path, "r") as f:
+                history = json.load(f)
+        except Exception as e:
+            logger.warning("Impossibile leggere %s: %s", legacy_path, e)
+            return 0
+        for rec in history:
+            self.append(rec)
+        self.flush()
+        logger.info("Importati %s record da %s", len(history), legacy_path)
+        return len(history)
+
+    # ------------------------------------------------------------------
+    # Lettura
+    # ------------------------------------------------------------------
+
+    def recent(
+        self,
+        limit: int = 100,
+        symbol: Optional[str] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        include_context: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        Ultimi record (dal più recente), filtrabili per symbol e intervallo ts.
+        Senza include_context i componenti del context restano {"$ref": hash}.
+        """
+        where, params = self._where(symbol, since, until)
+        sql = f"SELECT body FROM decisions {where} ORDER BY ts DESC, id DESC LIMIT ?"
+        rows = self._query(sql, params + [int(limit)])
+        records = [json.loads(r["body"]) for r in rows]
+        if include_context:
+            for rec in records:
+                rec["context"] = self.resolve_context(rec.get("context") or {})
+        return records
+
+    def resolve_context(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        """Ricostruisce il context completo sostituendo i {"$ref": hash}."""
+        refs = [v[_REF] for v in context.values() if _is_ref(v)]
+        if not refs:
+            return context
+        blobs = self._load_blobs(refs)
+        return {
+            k: (blobs.get(v[_REF]) if _is_ref(v) else v)
+            for k, v in context.items()
+        }
+
+    def _load_blobs(self, hashes: Iterable[str]) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        missing: List[str] = []
+        with self._blob_cache_lock:
+            for h in hashes:
+                if h in self._blob_cache:
+                    self._blob_cache.move_to_end(h)
+                    out[h] = self._blob_cache[h]
+                else:
+                    missing.append(h)
+        metrics.CACHE.inc("journal_blobs", "hit", amount=len(out))
+        metrics.CACHE.inc("journal_blobs", "miss", amount=len(missing))
+        if missing:
+            marks = ",".join("?" * len(missing))
+            rows = self._query(f"SELECT hash, body FROM context_blobs WHERE hash IN ({marks})", missing)
+            with self._blob_cache_lock:
+                for r in rows:
+                    value = json.loads(r["body"])
+                    out[r["hash"]] = value
+                    self._blob_cache[r["hash"]] = value
+                while len(self._blob_cache) > 1024:
+                    self._blob_cache.popitem(last=False)
+        return out
+
+    def storage_stats(self) -> Dict[str, int]:
+        rows = self._query(
+            "SELECT (SELECT COUNT(*) FROM decisions) AS decisions, "
+            "(SELECT COUNT(*) FROM context_blobs) AS blobs, "
+            "(SELECT COALESCE(SUM(LENGTH(body)), 0) FROM decisions) AS decision_bytes, "
+            "(SELECT COALESCE(SUM(LENGTH(body)), 0) FROM context_blobs) AS blob_bytes",
+            [],
+        )
+        return {k: int(rows[0][k]) for k in rows[0].keys()} if rows else {}
+
+    def count(self, symbol: Optional[str] = None, since: Optional[int] = None) -> int:
+        where, params = self._where(symbol, since, None)
+        rows = self._query(f"SELECT COUNT(*) AS n FROM decisions {where}", params)
+        return int(rows[0]["n"]) if rows else 0
+
+    def action_counts(self, since: Optional[int] = None) -> Dict[str, int]:
+        where, params = self._where(None, since, None)
+        rows = self._query(
+            f"SELECT action, COUNT(*) AS n FROM decisions {where} GROUP BY action", params
+        )
+        return {str(r["action"]): int(r["n"]) for r in rows}
+
+    @staticmethod
+    def _where(symbol: Optional[str], since: Optional[int], until: Optional[int]):
+        clauses: List[str] = []
+        params: List[Any] = []
+        if symbol:
+            clauses.append("symbol = ?")
+            params.append(symbol)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(int(since))
+        if until is not None:
+            clauses.append("ts <= ?")
+            params.append(int(until))
+        where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+        return where, params
+
+    def _query(self, sql: str, params: List[Any]) -> List[sqlite3.Row]:
+        if self.readonly and not os.path.exists(self.path):
+            return []
+        try:
+            return self._connect().execute(sql, params).fetchall()
+        except sqlite3.OperationalError as e:
+            # es. dashboard avviata prima che l'orchestrator crei lo schema
+            logger.warning("Lettura journal fallita: %s", e)
+            return []
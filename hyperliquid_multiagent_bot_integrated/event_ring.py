@@ -0,0 +1,133 @@
+"""
+Buffer eventi a capacità fissa con id di sequenza monotoni, e storico equity
+a più risoluzioni in memoria limitata.
+
+EventRing: append O(1) (deque con maxlen), ogni evento ha `seq` crescente.
+Le dashboard leggono in modo incrementale con since(cursor): ricevono solo
+gli eventi con seq > cursor e il nuovo cursore; wait() blocca finché arriva
+qualcosa, wait_async() fa lo stesso sull'event loop senza occupare thread
+(stream SSE: append() sveglia i client con loop.call_soon_threadsafe).
+Se il cursore è più vecchio del buffer, `gap` dice quanti eventi sono
+andati persi.
+
+EquityHistory: un campione per bucket in ogni livello (es. 1m, 15m, 4h);
+campioni nello stesso bucket aggiornano l'ultimo punto. Ogni livello ha
+la sua capacità, così lo storico lungo resta a bassa risoluzione.
+"""
+import asyncio
+import itertools
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+# (secondi per bucket, punti tenuti): 4h a 1m, 2 giorni a 15m, 60 giorni a 4h
+DEFAULT_RESOLUTIONS: Tuple[Tuple[int, int], ...] = ((60, 240), (900, 192), (14400, 360))
+
+
+class EventRing:
+    def __init__(self, capacity: int = 1000):
+        self.capacity = int(capacity)
+        self._events: Deque[Dict[str, Any]] = deque(maxlen=self.capacity)
+        self._seq = itertools.count(1)
+        self._last = 0
+        self._cond = threading.Condition()
+        # client async in attesa: (loop, evento) da svegliare ad ogni append
+        self._waiters: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+
+    @property
+    def cursor(self) -> int:
+        """seq dell'ultimo evento (0 se vuoto)."""
+        return self._last
+
+    def append(self, **fields: Any) -> Dict[str, Any]:
+        with self._cond:
+            self._last = next(self._seq)
+            event = {"seq": self._last, **fields}
+            self._events.append(event)
+            self._cond.notify_all()
+            waiters = list(self._waiters)
+        for loop, ready in waiters:
+            try:
+                loop.call_soon_threadsafe(ready.set)
+            except RuntimeError:
+                pass  # loop già chiuso
+        return event
+
+    def latest(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Ultimi `limit` eventi, dal più recente."""
+        with self._cond:
+            n = len(self._events) if limit is None else min(limit, len(self._events))
+            return [self._events[-1 - i] for i in range(n)]
+
+    def since(self, cursor: int = 0, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Eventi con seq > cursor, dal più vecchio, e il cursore da passare alla
+        prossima lettura. `gap` = eventi già usciti dal buffer dopo il cursore.
+        """
+        with self._cond:
+            if cursor > self._last:
+                cursor = 0  # sequenza ripartita (riavvio del servizio): si rilegge da capo
+            first = self._events[0]["seq"] if self._events else self._last + 1
+            start = max(0, cursor + 1 - first)
+            events = list(itertools.islice(self._events, start, None if limit is None else start + limit))
+            gap = max(0, first - cursor - 1)
+        return {"cursor": events[-1]["seq"] if events else cursor, "gap": gap, "events": events}
+
+    def wait(self, cursor: int, timeout: float) -> bool:
+        """Blocca finché c'è un evento dopo `cursor` (True) o scade il timeout (False)."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._last > cursor, timeout)
+
+    async def wait_async(self, cursor: int, timeout: float) -> bool:
+        """Come wait() ma sull'event loop: se il client si disconnette la cancellazione toglie l'attesa."""
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._cond:
+            if self._last > cursor:
+                return True
+            self._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._cond:
+                self._waiters.discard(waiter)
+
+
+class EquityHistory:
+    def __init__(self, resolutions: Iterable[Tuple[int, int]] = DEFAULT_RESOLUTIONS):
+        self.resolutions = sorted((int(s), int(n)) for s, n in resolutions)
+        self._tiers: Dict[int, Deque[Dict[str, Any]]] = {s: deque(maxlen=n) for s, n in self.resolutions}
+        self._lock = threading.Lock()
+
+    def add(self, equity: float, ts: Optional[float] = None) -> None:
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            for seconds, points in self._tiers.items():
+                bucket = int(ts // seconds * seconds)
+                if points and points[-1]["ts"] == bucket:
+                    last = points[-1]
+                    last["equity"] = equity
+                    last["min"] = min(last["min"], equity)
+                    last["max"] = max(last["max"], equity)
+                else:
+                    points.append({"ts": bucket, "equity": equity, "min": equity, "max": equity})
+
+    def series(self, resolution: Optional[int] = None, since: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Punti (dal più vecchio) del livello con bucket `resolution` secondi
+        (default il più fine). Con `since` solo i bucket da quel ts in poi:
+        l'ultimo può essere stato aggiornato dopo la lettura precedente.
+        """
+        seconds = self.resolutions[0][0] if resolution is None else int(resolution)
+        if seconds not in self._tiers:
+            raise ValueError(f"risoluzione {seconds}s non disponibile: {[s for s, _ in self.resolutions]}")
+        fmt = "%H:%M" if seconds < 3600 else "%m-%d %H:%M"
+        with self._lock:
+            points = [dict(p) for p in self._tiers[seconds] if since is None or p["ts"] >= since]
+        for p in points:
+            p["time"] = datetime.fromtimestamp(p["ts"]).strftime(fmt)
+        return points
@@ -0,0 +1,187 @@
+"""
+Log di esecuzione: latenza segnale -> fill e slippage per ordine.
+
+Ogni ordine porta i timestamp delle sue fasi (wall clock, time.time(),
+confrontabili tra servizi sullo stesso host/NTP):
+- decision: decisione del master ricevuta dall'orchestratore
+- received: richiesta arrivata al position manager
+- sent:     ordine inviato all'exchange
+- ack:      risposta dell'exchange
+- fill:     esecuzione; per gli IOC/market il fill arriva nella risposta, quindi = ack
+
+Insieme al prezzo atteso (mid usato per dimensionare l'ordine) e al prezzo
+medio di fill, da cui lo slippage in bps (positivo = contro di noi).
+Le righe vanno in una tabella SQLite (una riga per ordine, cancellate dopo
+`retention_days`) e le ultime `window` restano in memoria per summary() con
+i percentili; all'avvio la finestra si ricarica dal file.
+"""
+import os
+import sqlite3
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+import numpy as np
+
+from . import clock
+from .config import EXECUTION_LOG_RETENTION_DAYS, EXECUTION_LOG_WINDOW
+from .logging_config import setup_logger
+
+logger = setup_logger("execution_log")
+
+STAGES = ("decision", "received", "sent", "ack", "fill")
+# intervalli riportati da summary(): nome -> (fase iniziale, fase finale)
+LEGS = {
+    "decision_to_received": ("decision", "received"),
+    "received_to_sent": ("received", "sent"),
+    "sent_to_ack": ("sent", "ack"),
+    "ack_to_fill": ("ack", "fill"),
+    "decision_to_fill": ("decision", "fill"),
+    "received_to_fill": ("received", "fill"),
+}
+PERCENTILES = (50, 90, 99)
+PRUNE_INTERVAL = 3600.0  # secondi tra una pulizia delle righe scadute e la successiva
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS executions (
+    ts            REAL NOT NULL,
+    symbol        TEXT NOT NULL,
+    action        TEXT NOT NULL,
+    is_buy        INTEGER,
+    ok            INTEGER NOT NULL,
+    t_decision    REAL,
+    t_received    REAL,
+    t_sent        REAL,
+    t_ack         REAL,
+    t_fill        REAL,
+    expected_px   REAL,
+    fill_px       REAL,
+    slippage_bps  REAL
+);
+CREATE INDEX IF NOT EXISTS executions_ts ON executions (ts);
+"""
+
+
+def slippage_bps(is_buy: Optional[bool], expected_px: Optional[float], fill_px: Optional[float]) -> Optional[float]:
+    """Scostamento del fill dal prezzo atteso in bps: positivo se pagato più (buy) o incassato meno (sell)."""
+    if is_buy is None or not expected_px or not fill_px:
+        return None
+    diff = (fill_px - expected_px) / expected_px * 1e4
+    return diff if is_buy else -diff
+
+
+class ExecutionLog:
+    """Registro degli ordini eseguiti. path None = solo memoria (replay, fake exchange)."""
+
+    def __init__(self, path: Optional[str] = None, window: int = EXECUTION_LOG_WINDOW,
+                 retention_days: float = EXECUTION_LOG_RETENTION_DAYS):
+        self.path = path
+        self.retention = float(retention_days) * 86400.0
+        self._rows: Deque[Dict[str, Any]] = deque(maxlen=int(window))
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pruned_at = 0.0
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            self._conn.commit()
+            self._prune()
+            self._load()
+
+    def _load(self) -> None:
+        """Ultime `window` righe dal file: le statistiche sopravvivono a un riavvio."""
+        try:
+            rows = self._conn.execute(
+                "SELECT * FROM executions ORDER BY ts DESC, rowid DESC LIMIT ?", (self._rows.maxlen,)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning("Lettura log esecuzioni fallita: %s", e)
+            return
+        for r in reversed(rows):
+            row = dict(r)
+            row["is_buy"] = None if row["is_buy"] is None else bool(row["is_buy"])
+            row["ok"] = bool(row["ok"])
+            self._rows.append(row)
+
+    def _prune(self) -> None:
+        """Cancella le righe oltre la retention (al più una volta ogni PRUNE_INTERVAL)."""
+        now = clock.now()
+        if self.retention <= 0 or now - self._pruned_at < PRUNE_INTERVAL:
+            return
+        self._pruned_at = now
+        try:
+            with self._conn:
+                deleted = self._conn.execute("DELETE FROM executions WHERE ts < ?", (now - self.retention,)).rowcount
+        except sqlite3.Error as e:
+            logger.warning("Pulizia log esecuzioni fallita: %s", e)
+            return
+        if deleted:
+            logger.info("Log esecuzioni: cancellate %d righe oltre la retention", deleted)
+
+    def record(self, symbol: str, action: str, is_buy: Optional[bool], stamps: Dict[str, float],
+               expected_px: Optional[float] = None, fill_px: Optional[float] = None,
+               ok: bool = True) -> Dict[str, Any]:
+        row = {
+            "ts": clock.now(), "symbol": symbol, "action": action, "is_buy": is_buy, "ok": ok,
+            **{f"t_{s}": stamps.get(s) for s in STAGES},
+            "expected_px": expected_px, "fill_px": fill_px,
+            "slippage_bps": slippage_bps(is_buy, expected_px, fill_px) if ok else None,
+        }
+        with self._lock:
+            self._rows.append(row)
+            if self._conn is not None:
+                try:
+                    with self._conn:
+                        self._conn.execute(
+                            f"INSERT INTO executions ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                            tuple(row.values()),
+                        )
+                except sqlite3.Error as e:
+                    logger.warning("Scrittura log esecuzioni fallita: %s", e)
+                self._prune()
+        return row
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = list(self._rows)
+        return rows[-limit:] if limit > 0 else rows
+
+    def summary(self, symbol: Optional[str] = None, since: Optional[float] = None) -> Dict[str, Any]:
+        """Percentili (ms) di ogni intervallo tra fasi e dello slippage (bps) sugli ordini in finestra."""
+        with self._lock:
+            rows = [r for r in self._rows
+                    if (symbol is None or r["symbol"] == symbol) and (since is None or r["ts"] >= since)]
+        ok_rows = [r for r in rows if r["ok"]]
+        latency = {}
+        for name, (start, end) in LEGS.items():
+            values = [(r[f"t_{end}"] - r[f"t_{start}"]) * 1000.0 for r in ok_rows
+                      if r[f"t_{start}"] is not None and r[f"t_{end}"] is not None]
+            latency[name] = _stats(values, 2)
+        slippage = [r["slippage_bps"] for r in ok_rows if r["slippage_bps"] is not None]
+        return {
+            "orders": len(rows),
+            "failed": len(rows) - len(ok_rows),
+            "latency_ms": latency,
+            "slippage_bps": _stats(slippage, 3),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def _stats(values: List[float], digits: int) -> Dict[str, Any]:
+    if not values:
+        return {"count": 0}
+    arr = np.asarray(values, dtype=float)
+    out = {"count": int(arr.size), "mean": round(float(arr.mean()), digits)}
+    for p, v in zip(PERCENTILES, np.percentile(arr, PERCENTILES)):
+        out[f"p{p}"] = round(float(v), digits)
+    out["max"] = round(float(arr.max()), digits)
+    return out
@@ -0,0 +1,364 @@
+import itertools
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from . import clock
+from .hyperliquid_data import fetch_ohlcv_hyperliquid, interval_seconds
+from .logging_config import setup_logger
+
+logger = setup_logger("fake_exchange")
+
+
+def _last_close(symbol: str) -> Optional[float]:
+    df = fetch_ohlcv_hyperliquid(symbol, "1m", 1)
+    return None if df is None or df.empty else float(df["close"].iloc[-1])
+
+
+class FakeMarket:
+    """
+    Stato di un exchange simulato (posizioni, fill, PnL) condiviso da
+    FakeInfo e FakeExchange. I prezzi arrivano da `price_fn(symbol)`, di
+    default l'ultima close della sorgente candele (quindi seguono il clock
+    simulato del replay); i fill avvengono al prezzo corrente ± slippage,
+    con fee taker.
+
+    Gli ordini trigger (stop market) restano in `triggers` e sono valutati
+    da check_triggers() ad ogni chiamata di FakeInfo/FakeExchange: non c'è
+    un motore continuo, quindi scattano al primo prezzo osservato oltre
+    il triggerPx.
+
+    `depth[coin]` limita la size eseguita da un singolo ordine (book sottile):
+    il resto dell'ordine non viene eseguito, come un IOC riempito in parte.
+    """
+
+    def __init__(
+        self,
+        price_fn: Optional[Callable[[str], Optional[float]]] = None,
+        symbols: Iterable[str] = (),
+        starting_equity: float = 1000.0,
+        fee_rate: float = 0.00035,
+        slippage_bps: float = 2.0,
+    ):
+        self.price_fn = price_fn or _last_close
+        self.symbols = [s.upper() for s in symbols]
+        self.starting_equity = float(starting_equity)
+        self.fee_rate = float(fee_rate)
+        self.slippage_bps = float(slippage_bps)
+        self.positions: Dict[str, Dict[str, float]] = {}  # coin -> {"szi", "entryPx"}
+        self.fills: List[Dict[str, Any]] = []
+        self.realized_pnl = 0.0
+        self.fees = 0.0
+        self._oids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._fill_listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self.triggers: Dict[int, Dict[str, Any]] = {}  # oid -> {"coin", "is_buy", "sz", "trigger_px", "reduce_only"}
+        self.depth: Dict[str, float] = {}  # coin -> size massima per ordine (assente = illimitata)
+
+    def subscribe_fills(self, callback: Callable[[Dict[str, Any]], None]) -> None:
+        """Stand-in dello stream userFills: callback(fill) dopo ogni esecuzione."""
+        self._fill_listeners.append(callback)
+
+    def price(self, coin: str) -> Optional[float]:
+        return self.price_fn(coin)
+
+    def fill(self, coin: str, is_buy: bool, sz: float, reduce_only: bool = False) -> Dict[str, Any]:
+        px = self.price(coin)
+        if px is None or sz <= 0:
+            return {"error": f"Nessun prezzo o size non valida per {coin}"}
+        px *= 1.0 + (self.slippage_bps / 1e4) * (1 if is_buy else -1)
+        sz = min(sz, self.depth.get(coin, sz))
+        signed = sz if is_buy else -sz
+
+        with self._lock:
+            pos = self.positions.get(coin, {"szi": 0.0, "entryPx": 0.0})
+            szi, entry = pos["szi"], pos["entryPx"]
+            if reduce_only:
+                if szi == 0 or (szi > 0) == is_buy:
+                    return {"error": f"Nessuna posizione da ridurre su {coin}"}
+                signed = max(-abs(szi), min(abs(szi), signed))
+                sz = abs(signed)
+
+            closed = 0.0
+            if szi and (szi > 0) != (signed > 0):
+                closed = min(abs(szi), abs(signed))
+                self.realized_pnl += closed * (px - entry) * (1 if szi > 0 else -1)
+            new_szi = szi + signed
+            if abs(new_szi) < 1e-12:
+                self.positions.pop(coin, None)
+            elif szi == 0 or (szi > 0) != (new_szi > 0):
+                self.positions[coin] = {"szi": new_szi, "entryPx": px}
+            elif abs(new_szi) > abs(szi):
+                self.positions[coin] = {"szi": new_szi, "entryPx": (szi * entry + signed * px) / new_szi}
+            else:
+                self.positions[coin] = {"szi": new_szi, "entryPx": entry}
+
+            fee = sz * px * self.fee_rate
+            self.fees += fee
+            oid = next(self._oids)
+            fill = {"time": clock.now(), "coin": coin, "is_buy": is_buy, "sz": sz,
+                    "px": px, "fee": fee, "oid": oid, "closed_sz": closed}
+            self.fills.append(fill)
+        for callback in self._fill_listeners:
+            try:
+                callback(fill)
+            except Exception as e:
+                logger.warning("Listener dei fill fallito: %s", e)
+        return {"filled": {"totalSz": f"{sz:.8f}", "avgPx": f"{px:.8f}", "oid": oid}}
+
+    def place_trigger(self, coin: str, is_buy: bool, sz: float, trigger_px: float,
+                      reduce_only: bool = True) -> Dict[str, Any]:
+        if sz <= 0 or trigger_px <= 0:
+            return {"error": f"Trigger non valido per {coin}"}
+        with self._lock:
+            oid = next(self._oids)
+            self.triggers[oid] = {"coin": coin, "is_buy": is_buy, "sz": sz,
+                                  "trigger_px": trigger_px, "reduce_only": reduce_only}
+        return {"resting": {"oid": oid}}
+
+    def modify_trigger(self, oid: int, coin: str, is_buy: bool, sz: float, trigger_px: float,
+                       reduce_only: bool = True) -> Dict[str, Any]:
+        with self._lock:
+            if self.triggers.pop(oid, None) is None:
+                return {"error": f"Ordine {oid} inesistente o già eseguito"}
+        # come su Hyperliquid, la modify assegna un nuovo oid
+        return self.place_trigger(coin, is_buy, sz, trigger_px, reduce_only)
+
+    def cancel_trigger(self, oid: int) -> bool:
+        with self._lock:
+            return self.triggers.pop(oid, None) is not None
+
+    def check_triggers(self) -> None:
+        """Esegue a mercato gli stop il cui triggerPx è stato toccato."""
+        if not self.triggers:
+            return
+        fired = []
+        with self._lock:
+            for oid, t in list(self.triggers.items()):
+                if t["reduce_only"] and t["coin"] not in self.positions:
+                    del self.triggers[oid]  # posizione chiusa: lo stop reduce-only decade
+                    continue
+                px = self.price(t["coin"])
+                # stop di un long (vende) scatta sotto, di uno short (compra) sopra
+                if px is not None and (px >= t["trigger_px"] if t["is_buy"] else px <= t["trigger_px"]):
+                    fired.append(self.triggers.pop(oid))
+        for t in fired:
+            res = self.fill(t["coin"], t["is_buy"], t["sz"], reduce_only=t["reduce_only"])
+            logger.info("Trigger %s @ %s eseguito: %s", t["coin"], t["trigger_px"], res)
+
+    def unrealized(self, coin: str) -> float:
+        pos = self.positions.get(coin)
+        px = self.price(coin)
+        if not pos or px is None:
+            return 0.0
+        return pos["szi"] * (px - pos["entryPx"])
+
+    def equity(self) -> float:
+        return (self.starting_equity + self.realized_pnl - self.fees
+                + sum(self.unrealized(c) for c in list(self.positions)))
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "fills": len(self.fills),
+            "open_positions": len(self.positions),
+            "realized_pnl": round(self.realized_pnl, 4),
+            "fees": round(self.fees, 4),
+            "equity": round(self.equity(), 4),
+        }
+
+
+def _io(latency: float) -> None:
+    if latency > 0:
+        time.sleep(latency)
+
+
+def _order_response(status: Dict[str, Any]) -> Dict[str, Any]:
+    if "error" in status:
+        return {"status": "err", "response": status["error"]}
+    return {"status": "ok", "response": {"type": "order", "data": {"statuses": [status]}}}
+
+
+class FakeInfo:
+    """
+    Stand-in di hyperliquid.info.Info per i metodi usati dal trader.
+    `latency` (secondi, fissa) simula il round trip di ogni chiamata.
+    """
+
+    def __init__(self, market: FakeMarket, candles: Callable[..., Any] = fetch_ohlcv_hyperliquid,
+                 latency: float = 0.0):
+        self.market = market
+        self.candles = candles
+        self.latency = float(latency)
+
+    def candles_snapshot(self, name: str, interval: str, startTime: int, endTime: int) -> List[Dict[str, Any]]:
+        _io(self.latency)
+        limit = max(1, int((endTime - startTime) / 1000 // interval_seconds(interval)))
+        df = self.candles(name, interval, limit)
+        if df is None:
+            return []
+        step_ms = interval_seconds(interval) * 1000
+        return [
+            {"t": int(r.timestamp), "T": int(r.timestamp) + step_ms - 1, "s": name, "i": interval,
+             "o": str(r.open), "h": str(r.high), "l": str(r.low), "c": str(r.close), "v": str(r.volume)}
+            for r in df.itertuples(index=False)
+        ]
+
+    def all_mids(self) -> Dict[str, str]:
+        _io(self.latency)
+        self.market.check_triggers()
+        out = {}
+        for coin in set(self.market.symbols) | set(self.market.positions):
+            px = self.market.price(coin)
+            if px is not None:
+                out[coin] = str(px)
+        return out
+
+    def meta(self) -> Dict[str, Any]:
+        """Universe plausibile: szDecimals dal prezzo come su Hyperliquid (BTC 5, ETH 4, DOGE 0)."""
+        _io(self.latency)
+        universe = []
+        for coin in sorted(set(self.market.symbols) | set(self.market.positions)):
+            px = self.market.price(coin)
+            sz_decimals = max(0, min(5, math.floor(math.log10(px)) + 1)) if px else 2
+            universe.append({"name": coin, "szDecimals": sz_decimals, "maxLeverage": 50})
+        return {"universe": universe}
+
+    def frontend_open_orders(self, address: str) -> List[Dict[str, Any]]:
+        """Solo i trigger a riposo (gli unici ordini non immediati del fake)."""
+        _io(self.latency)
+        return [
+            {"coin": t["coin"], "oid": oid, "side": "B" if t["is_buy"] else "A", "sz": str(t["sz"]),
+             "isTrigger": True, "triggerPx": str(t["trigger_px"]), "reduceOnly": t["reduce_only"]}
+            for oid, t in list(self.market.triggers.items())
+        ]
+
+    def subscribe(self, subscription: Dict[str, Any], callback: Callable[[Any], None]) -> int:
+        """Come Info.subscribe, ma solo userFills (messaggi nel formato del websocket)."""
+        if subscription.get("type") != "userFills":
+            raise NotImplementedError(f"Sottoscrizione non supportata: {subscription}")
+        user = subscription.get("user")
+
+        def on_fill(fill: Dict[str, Any]) -> None:
+            callback({"channel": "userFills", "data": {"user": user, "isSnapshot": False, "fills": [{
+                "coin": fill["coin"], "px": str(fill["px"]), "sz": str(fill["sz"]),
+                "side": "B" if fill["is_buy"] else "A", "time": int(fill["time"] * 1000),
+                "fee": str(fill["fee"]), "oid": fill["oid"],
+            }]}})
+
+        self.market.subscribe_fills(on_fill)
+        return len(self.market._fill_listeners)
+
+    def user_state(self, address: str) -> Dict[str, Any]:
+        _io(self.latency)
+        m = self.market
+        m.check_triggers()
+        positions = []
+        for coin, pos in list(m.positions.items()):
+            px = m.price(coin) or pos["entryPx"]
+            positions.append({
+                "type": "oneWay",
+                "position": {
+                    "coin": coin,
+                    "szi": str(pos["szi"]),
+                    "entryPx": str(pos["entryPx"]),
+                    "leverage": "1",
+                    "positionValue": str(abs(pos["szi"]) * px),
+                    "unrealizedPnl": str(m.unrealized(coin)),
+                },
+            })
+        equity = m.equity()
+        return {
+            "assetPositions": positions,
+            "marginSummary": {"accountValue": str(equity)},
+            "withdrawable": str(equity),
+        }
+
+
+class FakeExchange:
+    """
+    Stand-in di hyperliquid.exchange.Exchange: market order eseguiti su
+    FakeMarket, più ordini trigger (stop market) e IOC con bulk_orders,
+    bulk_modify_orders_new, cancel e bulk_cancel. Gli IOC sono eseguiti
+    subito al prezzo corrente se entro il limit, altrimenti rifiutati;
+    ordini limit a riposo (GTC/ALO) non sono simulati. `latency` come in FakeInfo.
+    """
+
+    def __init__(self, market: FakeMarket, latency: float = 0.0):
+        self.market = market
+        self.latency = float(latency)
+
+    def _place(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        order_type = req.get("order_type", {})
+        if order_type.get("limit", {}).get("tif") == "Ioc":
+            coin, is_buy, limit_px = req["coin"], bool(req["is_buy"]), float(req["limit_px"])
+            px = self.market.price(coin)
+            if px is None or (px > limit_px if is_buy else px < limit_px):
+                return {"error": f"IOC {coin} non eseguibile entro {limit_px}"}
+            return self.market.fill(coin, is_buy, float(req["sz"]), reduce_only=bool(req.get("reduce_only", False)))
+        trigger = order_type.get("trigger")
+        if not trigger:
+            return {"error": "FakeExchange supporta solo ordini trigger e IOC"}
+        return self.market.place_trigger(req["coin"], bool(req["is_buy"]), float(req["sz"]),
+                                         float(trigger["triggerPx"]), bool(req.get("reduce_only", False)))
+
+    @staticmethod
+    def _bulk_response(statuses: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {"status": "ok", "response": {"type": "order", "data": {"statuses": statuses}}}
+
+    def update_leverage(self, leverage: int, name: str, is_cross: bool = True) -> Dict[str, Any]:
+        _io(self.latency)
+        return {"status": "ok", "response": {"type": "default"}}
+
+    def market_open(self, name: str, is_buy: bool, sz: float, px: Optional[float] = None,
+                    slippage: float = 0.05, cloid: Any = None, builder: Any = None) -> Dict[str, Any]:
+        _io(self.latency)
+        return _order_response(self.market.fill(name, is_buy, float(sz)))
+
+    def market_close(self, coin: str, sz: Optional[float] = None, px: Optional[float] = None,
+                     slippage: float = 0.05, cloid: Any = None, builder: Any = None) -> Dict[str, Any]:
+        _io(self.latency)
+        pos = self.market.positions.get(coin)
+        if not pos:
+            return {"status": "err", "response": f"Nessuna posizione su {coin}"}
+        size = abs(pos["szi"]) if sz is None else float(sz)
+        return _order_response(self.market.fill(coin, pos["szi"] < 0, size, reduce_only=True))
+
+    def order(self, name: str, is_buy: bool, sz: float, limit_px: float, order_type: Dict[str, Any],
+              reduce_only: bool = False, cloid: Any = None, builder: Any = None) -> Dict[str, Any]:
+        return self.bulk_orders([{"coin": name, "is_buy": is_buy, "sz": sz, "limit_px": limit_px,
+                                  "order_type": order_type, "reduce_only": reduce_only}])
+
+    def bulk_orders(self, order_requests: List[Dict[str, Any]], builder: Any = None) -> Dict[str, Any]:
+        _io(self.latency)
+        self.market.check_triggers()
+        return self._bulk_response([self._place(req) for req in order_requests])
+
+    def bulk_modify_orders_new(self, modify_requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+        _io(self.latency)
+        self.market.check_triggers()
+        statuses = []
+        for mod in modify_requests:
+            req = mod["order"]
+            trigger = req.get("order_type", {}).get("trigger")
+            if not trigger:
+                statuses.append({"error": "FakeExchange supporta solo ordini trigger"})
+                continue
+            statuses.append(self.market.modify_trigger(
+                mod["oid"], req["coin"], bool(req["is_buy"]), float(req["sz"]),
+                float(trigger["triggerPx"]), bool(req.get("reduce_only", False)),
+            ))
+        return self._bulk_response(statuses)
+
+    def cancel(self, name: str, oid: int) -> Dict[str, Any]:
+        _io(self.latency)
+        if not self.market.cancel_trigger(oid):
+            return {"status": "ok", "response": {"type": "cancel", "data": {"statuses": [
+                {"error": f"Ordine {oid} inesistente o già eseguito"}]}}}
+        return {"status": "ok", "response": {"type": "cancel", "data": {"statuses": ["success"]}}}
+
+    def bulk_cancel(self, cancel_requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+        _io(self.latency)
+        statuses = ["success" if self.market.cancel_trigger(req["oid"])
+                    else {"error": f"Ordine {req['oid']} inesistente o già eseguito"} for req in cancel_requests]
+        return {"status": "ok", "response": {"type": "cancel", "data": {"statuses": statuses}}}
@@ -0,0 +1,37 @@
+import json
+from typing import Any, Dict
+
+# LLM stand-in deterministico per replay e load test: regole fisse su RSI e
+# forecast, stessa risposta per lo stesso context, nessuna chiamata esterna.
+
+
+def decide(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    rsi = ((ctx.get("technical") or {}).get("indicators") or {}).get("rsi")
+    direction = ((ctx.get("forecast") or {}).get("forecast") or {}).get("direction", "flat")
+    positions = ctx.get("current_positions") or []
+    if rsi is None or rsi != rsi:
+        return {"action": "HOLD", "side": None, "size_pct_balance": 1, "reason": "mock: rsi assente"}
+    if positions:
+        side = positions[0].get("side")
+        if (side == "long" and rsi > 65) or (side == "short" and rsi < 35):
+            return {"action": "CLOSE", "side": side, "size_pct_balance": 1, "reason": f"mock: rsi {rsi:.1f}"}
+        return {"action": "HOLD", "side": None, "size_pct_balance": 1, "reason": "mock: in posizione"}
+    if rsi < 30 and direction != "down":
+        return {"action": "OPEN", "side": "long", "size_pct_balance": 5, "reason": f"mock: rsi {rsi:.1f}"}
+    if rsi > 70 and direction != "up":
+        return {"action": "OPEN", "side": "short", "size_pct_balance": 5, "reason": f"mock: rsi {rsi:.1f}"}
+    return {"action": "HOLD", "side": None, "size_pct_balance": 1, "reason": "mock: nessun segnale"}
+
+
+def complete(system_prompt: str, user_prompt: str) -> str:
+    """Stessa firma logica di _llm_complete del master: prompt -> testo JSON."""
+    ctx = json.loads(user_prompt.split("Contesto:\n", 1)[1])
+    return json.dumps(decide(ctx))
+
+
+def chat_completion(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Risposta in formato OpenAI chat/completions (per lo stand-in HTTP)."""
+    messages = body.get("messages") or []
+    system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+    user = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+    return {"choices": [{"index": 0, "message": {"role": "assistant", "content": complete(system, user)}}]}
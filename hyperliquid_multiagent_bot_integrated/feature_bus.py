@@ -0,0 +1,315 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import zlib
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from . import clock
+from . import metrics
+from .logging_config import setup_logger
+
+logger = setup_logger("feature_bus")
+
+FEATURE_BUS_DIR = os.getenv("FEATURE_BUS_DIR", "/data/feature_bus")
+FEATURE_BUS_CAPACITY = int(os.getenv("FEATURE_BUS_CAPACITY", "512"))
+
+# Schema fisso per agente: ordine dei campi float64 nel record
+SCHEMAS: Dict[str, Tuple[str, ...]] = {
+    "technical": ("rsi", "macd", "macd_signal", "atr", "pivot"),
+    "fibonacci": ("level_0", "level_0236", "level_0382", "level_0500",
+                  "level_0618", "level_0786", "level_1"),
+    "gann": ("last_price",),
+    "sentiment": ("score",),
+    "forecast": ("direction", "start_price", "end_price"),  # direction: up=1, flat=0, down=-1
+}
+
+_MAGIC = b"FBUS"
+_VERSION = 1
+# magic, version, n_fields, capacity, schema crc
+_HEADER = struct.Struct("<4sIIII")
+_HEADER_SIZE = 64
+# seq, ts, symbol
+_SLOT_HEAD = struct.Struct("<Qd16s")
+
+
+class FeatureBus:
+    """
+    Bus delle feature per-symbol su file mmap (volume /data condiviso).
+
+    Un file per agente: header + `capacity` slot a dimensione fissa
+    [seq u64 | ts f64 | symbol 16s | values f64 * n_fields].
+    Lo slot di un symbol si trova per hash con probing lineare.
+
+    Consistenza con seqlock: il writer porta seq a dispari, scrive i valori
+    e lo riporta a pari; il reader rilegge se seq è dispari o è cambiato
+    durante la lettura. I reader non fanno HTTP né copiano l'intero file.
+    Più writer (worker uvicorn, monolite e servizi) si escludono con flock
+    sul file: il seq e l'assegnazione degli slot sono read-modify-write.
+    """
+
+    def __init__(self, agent: str, directory: str = FEATURE_BUS_DIR,
+                 capacity: int = FEATURE_BUS_CAPACITY, create: bool = False):
+        self.agent = agent
+        self.fields = SCHEMAS[agent]
+        self.values = struct.Struct(f"<{len(self.fields)}d")
+        self.slot_size = _SLOT_HEAD.size + self.values.size
+        self.path = os.path.join(directory, f"{agent}.bin")
+        self._lock = threading.Lock()
+        self._slots: Dict[str, int] = {}
+        self._mm: Optional[mmap.mmap] = None
+        self._file = None
+        self.capacity = capacity
+        self._schema_crc = zlib.crc32(",".join(self.fields).encode())
+
+        if create:
+            self._create(directory)
+        self._open()
+
+    # ------------------------------------------------------------------
+    # File
+    # ------------------------------------------------------------------
+
+    def _create(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        size = _HEADER_SIZE + self.capacity * self.slot_size
+        if os.path.exists(self.path) and os.path.getsize(self.path) == size:
+            with open(self.path, "rb") as f:
+                magic, version, n_fields, capacity, crc = _HEADER.unpack(f.read(_HEADER.size))
+            if (magic, version, n_fields, capacity, crc) == (
+                _MAGIC, _VERSION, len(self.fields), self.capacity, self._schema_crc
+            ):
+                return
+        # file nuovo o schema cambiato: si riparte da zero
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            f.truncate(size)
+            f.write(_HEADER.pack(_MAGIC, _VERSION, len(self.fields), self.capacity, self._schema_crc))
+        os.replace(tmp, self.path)
+
+    def _open(self) -> bool:
+        if self._mm is not None:
+            return True
+        if not os.path.exists(self.path):
+            return False
+        f = open(self.path, "r+b")
+        mm = mmap.mmap(f.fileno(), 0)
+        magic, version, n_fields, capacity, crc = _HEADER.unpack_from(mm, 0)
+        if magic != _MAGIC or version != _VERSION or n_fields != len(self.fields) or crc != self._schema_crc:
+            mm.close()
+            f.close()
+            logger.warning("Feature bus %s con schema diverso, ignorato", self.path)
+            return False
+        self.capacity = capacity
+        self._mm = mm
+        # aperto finché vive il bus: serve al flock dei writer
+        self._file = f
+        return True
+
+    def _offset(self, idx: int) -> int:
+        return _HEADER_SIZE + idx * self.slot_size
+
+    def _find_slot(self, symbol: str, claim: bool) -> Optional[int]:
+        idx = self._slots.get(symbol)
+        if idx is not None:
+            return idx
+        key = symbol.encode("utf-8")[:16].ljust(16, b"\0")
+        start = zlib.crc32(key) % self.capacity
+        for i in range(self.capacity):
+            slot = (start + i) % self.capacity
+            _, _, name = _SLOT_HEAD.unpack_from(self._mm, self._offset(slot))
+            if name == key:
+                self._slots[symbol] = slot
+                return slot
+            if name == b"\0" * 16:
+                if not claim:
+                    return None
+                _SLOT_HEAD.pack_into(self._mm, self._offset(slot), 0, 0.0, key)
+                self._slots[symbol] = slot
+                return slot
+        return None
+
+    # ------------------------------------------------------------------
+    # Writer
+    # ------------------------------------------------------------------
+
+    def publish(self, symbol: str, features: Mapping[str, Any], ts: Optional[float] = None) -> bool:
+        values = [float(features.get(f, float("nan"))) for f in self.fields]
+        ts = clock.now() if ts is None else ts
+        # lock di thread + flock: il flock è per file aperto, non esclude i thread dello stesso processo
+        with self._lock:
+            if not self._open():
+                return False
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            try:
+                slot = self._find_slot(symbol, claim=True)
+                if slot is None:
+                    logger.warning("Feature bus %s pieno, %s non pubblicato", self.agent, symbol)
+                    return False
+                off = self._offset(slot)
+                seq, _, name = _SLOT_HEAD.unpack_from(self._mm, off)
+                _SLOT_HEAD.pack_into(self._mm, off, seq + 1, ts, name)
+                self.values.pack_into(self._mm, off + _SLOT_HEAD.size, *values)
+                _SLOT_HEAD.pack_into(self._mm, off, seq + 2, ts, name)
+            finally:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        return True
+
+    # ------------------------------------------------------------------
+    # Reader
+    # ------------------------------------------------------------------
+
+    def _read_slot(self, slot: int) -> Optional[Dict[str, Any]]:
+        off = self._offset(slot)
+        for _ in range(100):
+            seq1, ts, name = _SLOT_HEAD.unpack_from(self._mm, off)
+            if seq1 == 0:
+                return None
+            if seq1 % 2:
+                continue  # scrittura in corso
+            vals = self.values.unpack_from(self._mm, off + _SLOT_HEAD.size)
+            seq2 = _SLOT_HEAD.unpack_from(self._mm, off)[0]
+            if seq1 == seq2:
+                rec: Dict[str, Any] = dict(zip(self.fields, vals))
+                rec["ts"] = ts
+                rec["seq"] = seq1 // 2
+                return rec
+        return None
+
+    def read(self, symbol: str) -> Optional[Dict[str, Any]]:
+        if not self._open():
+            return None
+        slot = self._find_slot(symbol, claim=False)
+        return None if slot is None else self._read_slot(slot)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Ultimo record di tutti i symbol pubblicati."""
+        if not self._open():
+            return {}
+        out: Dict[str, Dict[str, Any]] = {}
+        for slot in range(self.capacity):
+            name = _SLOT_HEAD.unpack_from(self._mm, self._offset(slot))[2]
+            if name == b"\0" * 16:
+                continue
+            rec = self._read_slot(slot)
+            if rec is not None:
+                out[name.rstrip(b"\0").decode("utf-8")] = rec
+        return out
+
+
+_publishers: Dict[str, Optional[FeatureBus]] = {}
+# gli handler sync girano nel threadpool: due thread non devono creare lo stesso file insieme
+_publishers_lock = threading.Lock()
+
+
+def _publisher(agent: str) -> Optional[FeatureBus]:
+    with _publishers_lock:
+        if agent not in _publishers:
+            try:
+                _publishers[agent] = FeatureBus(agent, create=True)
+            except Exception as e:
+                logger.warning("Feature bus %s non disponibile: %s", agent, e)
+                _publishers[agent] = None
+        return _publishers[agent]
+
+
+def publish(agent: str, symbol: str, features: Mapping[str, Any]) -> None:
+    """Pubblica best-effort: un errore sul bus non deve mai rompere l'agente."""
+    bus = _publishers.get(agent) or _publisher(agent)
+    if bus is None:
+        return
+    try:
+        bus.publish(symbol.upper(), features)
+    except Exception as e:
+        logger.warning("Errore pubblicazione feature %s/%s: %s", agent, symbol, e)
+
+
+_readers: Dict[str, FeatureBus] = {}
+
+
+def reader(agent: str) -> FeatureBus:
+    """Bus in sola lettura (il file compare quando l'agente pubblica la prima volta)."""
+    bus = _readers.get(agent)
+    if bus is None:
+        bus = _readers[agent] = FeatureBus(agent)
+    return bus
+
+
+def snapshot_all() -> Dict[str, Dict[str, Dict[str, Any]]]:
+    return {agent: reader(agent).snapshot() for agent in SCHEMAS}
+
+
+_DIRECTIONS = {1.0: "up", 0.0: "flat", -1.0: "down"}
+# dove stanno i campi del bus nella risposta HTTP di ogni agente (None = al primo livello)
+_SECTION_KEYS: Dict[str, Optional[str]] = {
+    "technical": "indicators",
+    "fibonacci": "levels",
+    "gann": None,
+    "sentiment": "sentiment",
+    "forecast": "forecast",
+}
+
+
+def strip_section(agent: str, section: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Risposta HTTP di un agente senza i campi che il master ritrova sul bus:
+    restano quelli non numerici (interval, hint, label, sources, ...), marcati
+    con feature_bus=True perché il master li ricomponga con merge_section.
+    """
+    fields = set(SCHEMAS[agent])
+    if agent == "forecast":
+        fields.discard("direction")  # già stringa nella risposta, la si tiene com'è
+    key = _SECTION_KEYS[agent]
+    out = {k: v for k, v in section.items() if k not in ("ok", key) and (key or k not in fields)}
+    if key is not None:
+        rest = {k: v for k, v in (section.get(key) or {}).items() if k not in fields}
+        if rest:
+            out[key] = rest
+    out["feature_bus"] = True
+    return out
+
+
+def merge_section(agent: str, stripped: Dict[str, Any], max_age: float) -> Dict[str, Any]:
+    """Ricompone una sezione ridotta da strip_section con i valori del bus."""
+    out = read_section(agent, stripped.get("symbol", ""), max_age)
+    if not out["ok"]:
+        return out
+    key = _SECTION_KEYS[agent]
+    for k, v in stripped.items():
+        if k == "feature_bus":
+            continue
+        if k == key and isinstance(v, dict):
+            out[key].update(v)
+        else:
+            out[k] = v
+    return out
+
+
+def read_section(agent: str, symbol: str, max_age: float) -> Dict[str, Any]:
+    """
+    Ultimo output di un agente per `symbol`, nella stessa forma della sua
+    risposta HTTP (per il context del master). ok=False se assente o vecchio.
+    """
+    rec = reader(agent).read(symbol.upper())
+    age = clock.now() - rec["ts"] if rec is not None else None
+    metrics.cache_access("feature_bus", age is not None and age <= max_age)
+    if rec is None:
+        return {"ok": False, "symbol": symbol, "error": "feature bus: nessun dato"}
+    if age > max_age:
+        return {"ok": False, "symbol": symbol, "error": f"feature bus: dato vecchio ({age:.0f}s)"}
+
+    values = {f: rec[f] for f in SCHEMAS[agent]}
+    out: Dict[str, Any] = {"ok": True, "symbol": symbol, "source": "feature_bus", "age_s": round(age, 1)}
+    if agent == "technical":
+        out["indicators"] = values
+    elif agent == "fibonacci":
+        out["levels"] = values
+    elif agent == "gann":
+        out.update(values)
+    elif agent == "sentiment":
+        out["sentiment"] = values
+    elif agent == "forecast":
+        values["direction"] = _DIRECTIONS.get(values["direction"], "flat")
+        out["forecast"] = values
+    return out
@@ -0,0 +1,341 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from . import metrics
+from .logging_config import setup_logger
+from .serialization import dumps, loads, request_codec
+
+logger = setup_logger("http_client")
+
+_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "120"))
+_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "10"))
+_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "8"))
+
+# status per cui ha senso riprovare (sovraccarico / errori transitori)
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class _LatencyStats:
+    """Contatori e finestra mobile delle latenze (ms) di un endpoint."""
+
+    def __init__(self, window: int = 512):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def observe(self, ms: float, ok: bool) -> None:
+        self.calls += 1
+        if not ok:
+            self.errors += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.samples.append(ms)
+
+    def summary(self) -> Dict[str, Any]:
+        ordered = sorted(self.samples)
+
+        def pct(p: float) -> Optional[float]:
+            if not ordered:
+                return None
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 2)
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "avg_ms": round(self.total_ms / self.calls, 2) if self.calls else None,
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "max_ms": round(self.max_ms, 2),
+        }
+
+
+class _BaseClient:
+    """Parte comune di ServiceClient e SyncServiceClient: config, statistiche, header e retry."""
+
+    def __init__(
+        self,
+        timeout: float = 40.0,
+        codec: Optional[str] = None,
+        retries: int = _RETRIES,
+        max_connections: int = _MAX_CONNECTIONS,
+        max_keepalive: int = _MAX_KEEPALIVE,
+        keepalive_expiry: float = _KEEPALIVE_EXPIRY,
+    ):
+        self.timeout = timeout
+        self.content_type, self.accept = request_codec(codec)
+        self.retries = max(1, int(retries))
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._stats: Dict[Tuple[str, str], _LatencyStats] = {}
+
+    @staticmethod
+    def _split(url: str) -> Tuple[str, str]:
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}", parts.path or "/"
+
+    def _stats_for(self, upstream: str, path: str) -> _LatencyStats:
+        key = (upstream, path)
+        st = self._stats.get(key)
+        if st is None:
+            st = self._stats[key] = _LatencyStats()
+        return st
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        return random.uniform(0.0, min(_BACKOFF_MAX, _BACKOFF_BASE * (2 ** attempt)))
+
+    def _request_kwargs(self, json: Any, headers: Optional[Dict[str, str]],
+                        timeout: Optional[float]) -> Dict[str, Any]:
+        hdrs = {"accept": self.accept, **metrics.trace_headers()}
+        kwargs: Dict[str, Any] = {}
+        if json is not None:
+            hdrs["content-type"] = self.content_type
+            kwargs["content"] = dumps(json, self.content_type)
+        hdrs.update(headers or {})
+        kwargs["headers"] = hdrs
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        return kwargs
+
+    @staticmethod
+    def _failed(stats: _LatencyStats, upstream: str, path: str, url: str, t0: float, e: Exception,
+                idempotent: bool) -> bool:
+        """Registra una richiesta senza risposta; True se si può riprovare."""
+        elapsed = time.perf_counter() - t0
+        stats.observe(elapsed * 1000.0, ok=False)
+        metrics.observe_upstream(upstream, path, elapsed, "error")
+        logger.error("Error calling %s: %r", url, e)
+        return idempotent or isinstance(e, (httpx.ConnectError, httpx.PoolTimeout))
+
+    @staticmethod
+    def _answered(stats: _LatencyStats, upstream: str, path: str, url: str, t0: float, r: httpx.Response,
+                  idempotent: bool, last: bool) -> bool:
+        """Registra una risposta; True se è quella da restituire (altrimenti si riprova)."""
+        elapsed = time.perf_counter() - t0
+        stats.observe(elapsed * 1000.0, ok=r.status_code < 400)
+        metrics.observe_upstream(upstream, path, elapsed, str(r.status_code))
+        if r.status_code < 400:
+            return True
+        logger.warning("%s -> status %d: %s", url, r.status_code, r.text[:200])
+        return not idempotent or r.status_code not in _RETRY_STATUS or last
+
+    @staticmethod
+    def _decode(url: str, r: httpx.Response) -> Dict[str, Any]:
+        if r.status_code != 200:
+            return {"ok": False, "error": f"{url} -> status {r.status_code}", "status": r.status_code}
+        try:
+            return loads(r.content, r.headers.get("content-type"))
+        except ValueError:
+            return {"ok": False, "error": f"Invalid JSON from {url}"}
+
+    def latency_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {f"{up}{path}": st.summary() for (up, path), st in self._stats.items()}
+
+    def reset_stats(self) -> None:
+        self._stats.clear()
+
+
+class ServiceClient(_BaseClient):
+    """
+    Client HTTP condiviso per le chiamate in uscita di un servizio.
+
+    - un httpx.AsyncClient long-lived (keepalive) per ogni upstream
+      (scheme://host:port), con limiti espliciti di connessioni e pool
+    - retry uniforme con backoff esponenziale e full jitter
+    - latenza per chiamata registrata per (upstream, path), anche nel
+      registry di shared.metrics
+    - trace id corrente propagato nell'header x-trace-id
+
+    Le richieste non idempotenti (idempotent=False, es. apertura ordini)
+    vengono ritentate solo se la connessione non è mai stata stabilita,
+    per non rischiare doppie esecuzioni.
+
+    I body sono serializzati con il codec negoziato (INTERSERVICE_CODEC:
+    msgpack o JSON via orjson); per API esterne usare codec="json".
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def _client_for(self, upstream: str) -> httpx.AsyncClient:
+        client = self._clients.get(upstream)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, pool=_POOL_TIMEOUT),
+                limits=self.limits,
+            )
+            self._clients[upstream] = client
+        return client
+
+    # ------------------------------------------------------------------
+    # Richieste
+    # ------------------------------------------------------------------
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        json: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+        idempotent: bool = True,
+    ) -> httpx.Response:
+        """
+        Esegue la richiesta con retry. Ritorna l'ultima risposta ricevuta
+        (anche se non 2xx); solleva l'ultima eccezione se non ne arriva nessuna.
+        """
+        upstream, path = self._split(url)
+        client = self._client_for(upstream)
+        stats = self._stats_for(upstream, path)
+        attempts = self.retries if retries is None else max(1, int(retries))
+        kwargs = self._request_kwargs(json, headers, timeout)
+
+        last_exc: Optional[Exception] = None
+        for attempt in range(attempts):
+            if attempt:
+                stats.retries += 1
+                await asyncio.sleep(self._backoff(attempt))
+
+            t0 = time.perf_counter()
+            try:
+                r = await client.request(method, url, **kwargs)
+            except Exception as e:
+                last_exc = e
+                if not self._failed(stats, upstream, path, url, t0, e, idempotent):
+                    break
+                continue
+            if self._answered(stats, upstream, path, url, t0, r, idempotent, attempt == attempts - 1):
+                return r
+
+        assert last_exc is not None
+        raise last_exc
+
+    async def post_json(self, url: str, payload: Any = None, **kwargs: Any) -> Dict[str, Any]:
+        """POST con body JSON; in caso di errore ritorna {"ok": False, "error": ...}."""
+        return await self._json("POST", url, json=payload, **kwargs)
+
+    async def get_json(self, url: str, **kwargs: Any) -> Dict[str, Any]:
+        return await self._json("GET", url, **kwargs)
+
+    async def _json(self, method: str, url: str, **kwargs: Any) -> Dict[str, Any]:
+        try:
+            r = await self.request(method, url, **kwargs)
+        except Exception:
+            return {"ok": False, "error": f"Failed after retries: {url}"}
+        return self._decode(url, r)
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    async def aclose(self) -> None:
+        clients, self._clients = list(self._clients.values()), {}
+        await asyncio.gather(*(c.aclose() for c in clients), return_exceptions=True)
+
+
+class SyncServiceClient(_BaseClient):
+    """
+    Stesso client (keepalive, retry con backoff, latenze, trace id) per il
+    codice sincrono: handler sync che girano nel threadpool (es. fetch delle
+    candele dagli agenti) e thread dedicati. Un solo httpx.Client per
+    upstream, thread-safe: i thread dello stesso servizio condividono il pool.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._clients: Dict[str, httpx.Client] = {}
+        self._lock = threading.Lock()
+
+    def _client_for(self, upstream: str) -> httpx.Client:
+        client = self._clients.get(upstream)
+        if client is None or client.is_closed:
+            with self._lock:
+                client = self._clients.get(upstream)
+                if client is None or client.is_closed:
+                    client = httpx.Client(
+                        timeout=httpx.Timeout(self.timeout, pool=_POOL_TIMEOUT),
+                        limits=self.limits,
+                    )
+                    self._clients[upstream] = client
+        return client
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        json: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+        idempotent: bool = True,
+    ) -> httpx.Response:
+        """Come ServiceClient.request, bloccante."""
+        upstream, path = self._split(url)
+        client = self._client_for(upstream)
+        with self._lock:
+            stats = self._stats_for(upstream, path)
+        attempts = self.retries if retries is None else max(1, int(retries))
+        kwargs = self._request_kwargs(json, headers, timeout)
+
+        last_exc: Optional[Exception] = None
+        for attempt in range(attempts):
+            if attempt:
+                stats.retries += 1
+                time.sleep(self._backoff(attempt))
+
+            t0 = time.perf_counter()
+            try:
+                r = client.request(method, url, **kwargs)
+            except Exception as e:
+                last_exc = e
+                if not self._failed(stats, upstream, path, url, t0, e, idempotent):
+                    break
+                continue
+            if self._answered(stats, upstream, path, url, t0, r, idempotent, attempt == attempts - 1):
+                return r
+
+        assert last_exc is not None
+        raise last_exc
+
+    def post_json(self, url: str, payload: Any = None, **kwargs: Any) -> Dict[str, Any]:
+        """POST con body JSON; in caso di errore ritorna {"ok": False, "error": ...}."""
+        return self._json("POST", url, json=payload, **kwargs)
+
+    def get_json(self, url: str, **kwargs: Any) -> Dict[str, Any]:
+        return self._json("GET", url, **kwargs)
+
+    def _json(self, method: str, url: str, **kwargs: Any) -> Dict[str, Any]:
+        try:
+            r = self.request(method, url, **kwargs)
+        except Exception:
+            return {"ok": False, "error": f"Failed after retries: {url}"}
+        return self._decode(url, r)
+
+    def close(self) -> None:
+        with self._lock:
+            clients, self._clients = list(self._clients.values()), {}
+        for c in clients:
+            c.close()
@@ -1,5 +1,27 @@
+import glob
+import os
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import numpy as np
 import pandas as pd
-from typing import Optional
+
+from . import clock
+from .config import HYPERLIQUID_INFO_URL
+from .http_client import SyncServiceClient
+
+OHLCV_COLUMNS = ["timestamp", "open", "high", "low", "close", "volume"]
+
+# (symbol, interval, limit) -> DataFrame con OHLCV_COLUMNS
+OhlcvSource = Callable[[str, str, int], Optional[pd.DataFrame]]
+
+_source: Optional[OhlcvSource] = None
+
+
+def set_ohlcv_source(source: Optional[OhlcvSource]) -> None:
+    """Installa la sorgente delle candele (es. RecordedCandles per il replay)."""
+    global _source
+    _source = source
+
 
 def fetch_ohlcv_hyperliquid(symbol: str, interval: str = "15m", limit: int = 200) -> Optional[pd.DataFrame]:
     """TODO: implementa il fetch delle candele da Hyperliquid.
@@ -11,5 +33,156 @@ def fetch_ohlcv_hyperliquid(symbol: str, interval: str = "15m", limit: int = 200
     - low (float)
     - close (float)
     - volume (float)
+
+    Se è installata una sorgente con set_ohlcv_source() viene usata quella,
+    altrimenti, se HYPERLIQUID_INFO_URL è configurato, l'endpoint /info
+    (candleSnapshot) di Hyperliquid o di un suo stand-in locale.
     """
+    if _source is not None:
+        return _source(symbol, interval, limit)
+    if HYPERLIQUID_INFO_URL:
+        return fetch_candle_snapshot(HYPERLIQUID_INFO_URL, symbol, interval, limit)
     raise NotImplementedError("Implementa fetch_ohlcv_hyperliquid con la tua logica di dati")
+
+
+# pool keepalive condiviso dai thread dell'agente; latenze nel registry di shared.metrics
+_http = SyncServiceClient(timeout=10, codec="json", retries=2)
+
+
+def fetch_candle_snapshot(info_url: str, symbol: str, interval: str, limit: int) -> Optional[pd.DataFrame]:
+    """POST {"type": "candleSnapshot"} sull'API /info, convertito in OHLCV_COLUMNS."""
+    end_ms = int(clock.now() * 1000)
+    start_ms = end_ms - limit * interval_seconds(interval) * 1000
+    r = _http.request(
+        "POST",
+        info_url,
+        json={"type": "candleSnapshot",
+              "req": {"coin": symbol, "interval": interval, "startTime": start_ms, "endTime": end_ms}},
+    )
+    r.raise_for_status()
+    candles = r.json()
+    if not candles:
+        return None
+    df = pd.DataFrame(candles)
+    df = pd.DataFrame({
+        "timestamp": df["t"].astype("int64"),
+        "open": df["o"].astype(float),
+        "high": df["h"].astype(float),
+        "low": df["l"].astype(float),
+        "close": df["c"].astype(float),
+        "volume": df["v"].astype(float),
+    })
+    return df.tail(limit).reset_index(drop=True)
+
+
+_UNITS = {"m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def interval_seconds(interval: str) -> int:
+    """'15m' -> 900, '4h' -> 14400, ..."""
+    try:
+        return int(interval[:-1]) * _UNITS[interval[-1]]
+    except (KeyError, ValueError):
+        raise ValueError(f"Intervallo non valido: {interval}")
+
+
+class RecordedCandles:
+    """
+    Sorgente di candele registrate per il replay.
+
+    Le candele sono a un intervallo base per symbol; gli intervalli più
+    lunghi sono ricampionati una volta sola e poi serviti per slicing.
+    Vengono restituite solo le candele già chiuse al tempo di clock.now(),
+    quindi gli agenti vedono esattamente la storia disponibile in quel momento.
+    Per intervalli più corti del base si usano le candele base.
+    """
+
+    def __init__(self, frames: Dict[str, pd.DataFrame], base_interval: str = "15m"):
+        self.base_interval = base_interval
+        self.base_seconds = interval_seconds(base_interval)
+        self.frames = {s.upper(): df.sort_values("timestamp").reset_index(drop=True)[OHLCV_COLUMNS]
+                       for s, df in frames.items()}
+        # (symbol, interval) -> (frame, close_time_ms)
+        self._cache: Dict[Tuple[str, str], Tuple[pd.DataFrame, np.ndarray]] = {}
+
+    @classmethod
+    def from_dir(cls, path: str, base_interval: str = "15m") -> "RecordedCandles":
+        """Carica `<path>/<SYMBOL>_<base_interval>.csv` (colonne OHLCV_COLUMNS)."""
+        frames: Dict[str, pd.DataFrame] = {}
+        for f in sorted(glob.glob(os.path.join(path, f"*_{base_interval}.csv"))):
+            symbol = os.path.basename(f)[: -len(f"_{base_interval}.csv")]
+            frames[symbol] = pd.read_csv(f)
+        if not frames:
+            raise FileNotFoundError(f"Nessun file *_{base_interval}.csv in {path}")
+        return cls(frames, base_interval)
+
+    @classmethod
+    def synthetic(cls, symbols: Iterable[str], start: float, end: float,
+                  base_interval: str = "15m", seed: int = 0) -> "RecordedCandles":
+        """Random walk geometrico deterministico (per test e load test offline)."""
+        step = interval_seconds(base_interval)
+        ts = np.arange(int(start) // step * step, int(end), step, dtype=np.int64) * 1000
+        frames: Dict[str, pd.DataFrame] = {}
+        for i, symbol in enumerate(symbols):
+            rnd = np.random.default_rng(seed + i)
+            px0 = float(rnd.uniform(0.5, 50000.0))
+            vol = float(rnd.uniform(0.002, 0.012))
+            close = px0 * np.exp(np.cumsum(rnd.normal(0.0, vol, len(ts))))
+            open_ = np.concatenate(([px0], close[:-1]))
+            spread = np.abs(rnd.normal(0.0, vol / 2, len(ts))) * close
+            frames[symbol] = pd.DataFrame({
+                "timestamp": ts,
+                "open": open_,
+                "high": np.maximum(open_, close) + spread,
+                "low": np.minimum(open_, close) - spread,
+                "close": close,
+                "volume": rnd.uniform(10.0, 1000.0, len(ts)),
+            })
+        return cls(frames, base_interval)
+
+    @property
+    def symbols(self):
+        return list(self.frames)
+
+    def time_range(self) -> Tuple[float, float]:
+        """(primo, ultimo) istante coperto da tutte le serie, in secondi."""
+        first = max(float(df["timestamp"].iloc[0]) for df in self.frames.values()) / 1000.0
+        last = min(float(df["timestamp"].iloc[-1]) for df in self.frames.values()) / 1000.0
+        return first, last + self.base_seconds
+
+    def _resampled(self, symbol: str, interval: str) -> Tuple[pd.DataFrame, np.ndarray]:
+        key = (symbol, interval)
+        hit = self._cache.get(key)
+        if hit is not None:
+            return hit
+        base = self.frames[symbol]
+        seconds = interval_seconds(interval)
+        if seconds <= self.base_seconds:
+            df, seconds = base, self.base_seconds
+        else:
+            idx = pd.to_datetime(base["timestamp"], unit="ms")
+            df = (
+                base.set_index(idx)
+                .resample(f"{seconds}s", origin="epoch")
+                .agg({"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"})
+                .dropna()
+            )
+            df.insert(0, "timestamp", (df.index.view("int64") // 1_000_000).astype("int64"))
+            df = df.reset_index(drop=True)
+        close_ms = df["timestamp"].to_numpy() + seconds * 1000
+        self._cache[key] = (df, close_ms)
+        return df, close_ms
+
+    def __call__(self, symbol: str, interval: str = "15m", limit: int = 200) -> Optional[pd.DataFrame]:
+        symbol = symbol.upper()
+        if symbol not in self.frames:
+            return None
+        df, close_ms = self._resampled(symbol, interval)
+        end = int(np.searchsorted(close_ms, clock.now() * 1000.0, side="right"))
+        if end == 0:
+            return None
+        return df.iloc[max(0, end - limit):end].reset_index(drop=True)
+
+    def last_price(self, symbol: str) -> Optional[float]:
+        df = self(symbol, self.base_interval, 1)
+        return None if df is None or df.empty else float(df["close"].iloc[-1])
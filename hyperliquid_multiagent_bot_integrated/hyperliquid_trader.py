@@ -1,19 +1,39 @@
 import logging
 import os
+import threading
 import time
 from decimal import Decimal
 from typing import Dict, Any, List, Optional
 
-from eth_account import Account
-from hyperliquid.exchange import Exchange
-from hyperliquid.info import Info
-from hyperliquid.utils import constants
-
+import numpy as np
+
+try:
+    from eth_account import Account
+    from hyperliquid.exchange import Exchange
+    from hyperliquid.info import Info
+    from hyperliquid.utils import constants
+except ImportError:  # SDK non installato: si può usare solo con info/exchange iniettati
+    Account = Exchange = Info = constants = None
+
+from . import clock
+from . import metrics
+from .asset_meta import AssetIndex, hyperliquid_loader
+from .config import (
+    ACCOUNT_FILLS_STREAM, ACCOUNT_STATE_TTL_SECONDS, STOP_ORDER_SLIPPAGE, TRAILING_NATIVE_STOPS,
+)
+from .execution_log import ExecutionLog
 from .logging_config import setup_logger
+from .price_cache import PriceCache
+from .trailing_engine import LADDER_ACTIVATION, LADDER_OFFSET, TrailingBook
+from .trailing_store import TrailingStore
 
 logger = setup_logger("HyperliquidTrader")
 
 
+class InvalidOrder(RuntimeError):
+    """Ordine scartato prima dell'invio: size o notional fuori dai limiti dell'exchange."""
+
+
 class HyperliquidTrader:
     """
     Wrapper per operare su Hyperliquid (Perp) con leva 1x.
@@ -36,35 +56,89 @@ class HyperliquidTrader:
 
     - Lo SL non torna mai indietro:
         sl_pct cresce solo (per ogni symbol).
-    """
 
-    def __init__(self, testnet: bool = True):
-        self.testnet = testnet
+    Stop nativi (TRAILING_NATIVE_STOPS): all'apertura viene messo sull'exchange
+    uno stop trigger reduce-only, che scatta anche tra un tick e l'altro;
+    update_trailing_stops lo sposta con un'unica bulk modify per tutte le
+    posizioni il cui SL è migliorato. Il controllo locale stop_hit resta
+    come rete di sicurezza (es. stop rifiutato dall'exchange).
 
-        pk = os.getenv("HYPERLIQUID_PRIVATE_KEY")
-        address = os.getenv("HYPERLIQUID_ADDRESS")
+    Con uno `store` (TrailingStore) ogni modifica dello stato trailing è
+    scritta subito su disco; restore_trailing_state() la ricarica all'avvio.
 
-        if not pk or not address:
-            raise RuntimeError(
-                "❌ Missing HYPERLIQUID_PRIVATE_KEY or HYPERLIQUID_ADDRESS in environment."
-            )
+    Ogni ordine di open/close finisce in `executions` (ExecutionLog) con i
+    timestamp delle fasi, prezzo atteso e prezzo di fill.
+    """
+
+    def __init__(self, testnet: bool = True, info: Any = None, exchange: Any = None,
+                 address: Optional[str] = None, store: Optional[TrailingStore] = None,
+                 executions: Optional[ExecutionLog] = None):
+        self.testnet = testnet
+        self.store = store
+        self.executions = executions if executions is not None else ExecutionLog()
+
+        if info is not None and exchange is not None:
+            # client iniettati (es. fake_exchange per replay/test): niente credenziali
+            self.address = address or "0x0"
+            self.wallet = None
+            self.info = info
+            self.exchange = exchange
+        else:
+            pk = os.getenv("HYPERLIQUID_PRIVATE_KEY")
+            address = address or os.getenv("HYPERLIQUID_ADDRESS")
+
+            if not pk or not address:
+                raise RuntimeError(
+                    "❌ Missing HYPERLIQUID_PRIVATE_KEY or HYPERLIQUID_ADDRESS in environment."
+                )
+            if Info is None:
+                raise RuntimeError("❌ hyperliquid-python-sdk non installato.")
 
-        self.address = address
-        api_url = constants.TESTNET_API_URL if testnet else constants.MAINNET_API_URL
+            self.address = address
+            api_url = constants.TESTNET_API_URL if testnet else constants.MAINNET_API_URL
 
-        self.wallet = Account.from_key(pk)
-        self.info = Info(api_url, skip_ws=True)
-        self.exchange = Exchange(self.wallet, api_url, account_address=self.address)
+            self.wallet = Account.from_key(pk)
+            # websocket solo se serve lo stream dei fill
+            self.info = Info(api_url, skip_ws=not ACCOUNT_FILLS_STREAM)
+            self.exchange = Exchange(self.wallet, api_url, account_address=self.address)
 
         # SL iniziale di default (2%)
         self.default_sl_pct = float(os.getenv("INITIAL_SL_PCT", "0.02"))
 
         logger.info(
-            f"✅ HyperliquidTrader inizializzato | testnet={self.testnet}, address={self.address}"
+            "✅ HyperliquidTrader inizializzato | testnet=%s, address=%s", self.testnet, self.address
         )
 
+        # Mid di tutti i symbol con una chiamata allMids, TTL breve
+        self.prices = PriceCache(self.info.all_mids)
+        # szDecimals, regole di prezzo e leva max per symbol (da Info.meta)
+        self.assets = AssetIndex(hyperliquid_loader(self.info))
+
+        # Cache di user_state: (ts, state); la generazione sale ad ogni
+        # invalidazione, così un fetch partito prima non viene salvato come fresco
+        self.account_ttl = ACCOUNT_STATE_TTL_SECONDS
+        self._account: Optional[tuple] = None
+        self._account_gen = 0
+        self._account_lock = threading.Lock()
+        if ACCOUNT_FILLS_STREAM and hasattr(self.info, "subscribe"):
+            try:
+                self.info.subscribe({"type": "userFills", "user": self.address}, self._on_user_fills)
+                logger.info("📡 Stream userFills attivo: stato account invalidato ad ogni fill")
+            except Exception as e:
+                logger.warning("⚠️ Stream userFills non disponibile, solo TTL: %s", e)
+
+        self.native_stops = TRAILING_NATIVE_STOPS
+        self.book = TrailingBook()
+        self._leverage_set: set = set()
+        # ogni modifica di trailing_state (tick, open, close, bulk, restore) passa di qui;
+        # rientrante: il tick può completare un restore rimasto in sospeso
+        self._trailing_lock = threading.RLock()
+        # stato salvato non ancora riconciliato (user_state non disponibile all'avvio)
+        self._pending_restore: Optional[Dict[str, Dict[str, Any]]] = None
+
         # Stato interno trailing
-        # es: {"BTC": {"sl_pct": -0.02}}
+        # es: {"BTC": {"sl_pct": -0.02, "stop_oid": 123, "stop_px": 41160.0,
+        #              "side": "long", "entry_px": 42000.0}}
         self.trailing_state: Dict[str, Dict[str, Any]] = {}
 
         # Best effort login
@@ -75,26 +149,34 @@ class HyperliquidTrader:
                     logger.info("⏳ Eseguo login_if_needed su Hyperliquid…")
                     self.exchange.login_if_needed()
         except Exception as e:
-            logger.warning(f"⚠️ Impossibile verificare login Hyperliquid: {e}")
+            logger.warning("⚠️ Impossibile verificare login Hyperliquid: %s", e)
 
     # ------------------------------------------------------------------
     # Helpers
     # ------------------------------------------------------------------
 
     def _get_last_price(self, symbol: str) -> Optional[float]:
+        """Ultimo mid dalla cache prezzi; candles 1m solo se il symbol manca da allMids."""
+        px = self.prices.get(symbol)
+        if px is not None:
+            return px
+        return self._get_last_candle_close(symbol)
+
+    def _get_last_candle_close(self, symbol: str) -> Optional[float]:
         """Prende l'ultimo prezzo (close) da candles 1m."""
         try:
-            now_ms = int(time.time() * 1000)
+            now_ms = int(clock.now() * 1000)
             start_ms = now_ms - 60 * 60 * 1000  # ultima ora
 
-            candles = self.info.candles_snapshot(
-                name=symbol,
-                interval="1m",
-                startTime=start_ms,
-                endTime=now_ms,
-            )
+            with metrics.upstream_call("hyperliquid", "candles_snapshot"):
+                candles = self.info.candles_snapshot(
+                    name=symbol,
+                    interval="1m",
+                    startTime=start_ms,
+                    endTime=now_ms,
+                )
             if not candles:
-                logger.warning(f"⚠️ Nessuna candela trovata per {symbol}")
+                logger.warning("⚠️ Nessuna candela trovata per %s", symbol)
                 return None
 
             last = candles[-1]
@@ -104,24 +186,74 @@ class HyperliquidTrader:
                 px = float(last[4])
 
             if px <= 0:
-                logger.warning(f"⚠️ Prezzo non valido per {symbol}: {px}")
+                logger.warning("⚠️ Prezzo non valido per %s: %s", symbol, px)
                 return None
 
             return px
         except Exception as e:
-            logger.error(f"❌ Errore nel fetch del prezzo per {symbol}: {e}")
+            logger.error("❌ Errore nel fetch del prezzo per %s: %s", symbol, e)
             return None
 
-    def _usd_to_size(self, symbol: str, usd_amount: float) -> float:
-        """Converte USD -> size (coin) usando l'ultimo prezzo."""
-        px = self._get_last_price(symbol)
+    # ------------------------------------------------------------------
+    # Stato account (cache)
+    # ------------------------------------------------------------------
+
+    def _user_state(self) -> Any:
+        """
+        user_state condiviso tra i chiamanti: entro il TTL tutti leggono lo
+        stesso snapshot, e chi arriva durante un fetch aspetta quello.
+        """
+        cached = self._account
+        if cached is not None and clock.now() - cached[0] < self.account_ttl:
+            metrics.cache_access("account_state", True)
+            return cached[1]
+        with self._account_lock:
+            cached = self._account
+            if cached is not None and clock.now() - cached[0] < self.account_ttl:
+                metrics.cache_access("account_state", True)
+                return cached[1]
+            metrics.cache_access("account_state", False)
+            gen = self._account_gen
+            with metrics.upstream_call("hyperliquid", "user_state"):
+                state = self.info.user_state(self.address)
+            if gen == self._account_gen:
+                self._account = (clock.now(), state)
+            return state
+
+    def invalidate_account_state(self) -> None:
+        """Da chiamare dopo ogni ordine: la prossima lettura va all'exchange."""
+        self._account_gen += 1
+        self._account = None
+
+    def _on_user_fills(self, msg: Dict[str, Any]) -> None:
+        data = msg.get("data", {}) if isinstance(msg, dict) else {}
+        if data.get("isSnapshot"):
+            return  # storico inviato all'iscrizione
+        fills = data.get("fills", [])
+        if fills:
+            logger.debug("Fill ricevuti dallo stream (%d): invalido lo stato account", len(fills))
+            self.invalidate_account_state()
+
+    def _usd_to_size(self, symbol: str, usd_amount: float, px: Optional[float] = None) -> float:
+        """
+        Converte USD -> size (coin) usando l'ultimo prezzo (o quello già letto),
+        arrotondata per difetto a szDecimals; se sotto il minimo dell'exchange
+        errore subito invece di un ordine rifiutato.
+        """
+        px = px if px is not None else self._get_last_price(symbol)
         if px is None:
             raise RuntimeError(f"Impossibile ottenere il prezzo per {symbol} per calcolare la size.")
 
         size = Decimal(str(usd_amount)) / Decimal(str(px))
         size_f = float(size)
+        spec = self.assets.get(symbol)
+        if spec is not None:
+            size_f = spec.round_size(size_f)
+            reason = spec.check(size_f, px)
+            if reason:
+                raise InvalidOrder(f"Ordine non valido: {reason}")
         if size_f <= 0:
-            raise RuntimeError(f"Size calcolata non valida per {symbol}: {size_f}")
+            raise InvalidOrder(f"Size calcolata non valida per {symbol}: {size_f}")
         return size_f
 
     def _compute_sl_pct_from_profit(self, pnl_pct: float) -> float:
@@ -133,13 +265,210 @@ class HyperliquidTrader:
 
         Output decimale (0.01 = 1%, -0.02 = -2%).
         """
-        pnl_percent = pnl_pct * 100.0
-
-        if pnl_percent < 0.5:
+        if pnl_pct < LADDER_ACTIVATION:
             return -abs(self.default_sl_pct)
+        return pnl_pct - LADDER_OFFSET
+
+    # ------------------------------------------------------------------
+    # Persistenza dello stato trailing
+    # ------------------------------------------------------------------
+
+    def _persist(self, *symbols: str) -> None:
+        """Write-through dei symbol dati: upsert se hanno stato, altrimenti delete."""
+        if self.store is None or not symbols:
+            return
+        try:
+            self.store.put_many((s, self.trailing_state[s]) for s in symbols if s in self.trailing_state)
+            self.store.delete(*(s for s in symbols if s not in self.trailing_state))
+        except Exception as e:
+            # il trading non si ferma per il disco: lo stato in memoria resta valido
+            logger.error("❌ Salvataggio stato trailing %s fallito: %s", ",".join(symbols), e)
+
+    def _resting_oids(self) -> Optional[set]:
+        """oid degli ordini aperti (trigger compresi); None se non verificabile."""
+        fetch = getattr(self.info, "frontend_open_orders", None) or getattr(self.info, "open_orders", None)
+        if fetch is None:
+            return None
+        try:
+            with metrics.upstream_call("hyperliquid", "open_orders"):
+                return {o.get("oid") for o in fetch(self.address) or []}
+        except Exception as e:
+            logger.warning("⚠️ Ordini aperti non disponibili: %s", e)
+            return None
+
+    def restore_trailing_state(self) -> Dict[str, int]:
+        """
+        Ricarica lo stato salvato e lo riconcilia con le posizioni aperte:
+        tiene solo i symbol ancora aperti con lo stesso verso ed entry
+        (altrimenti è un'altra posizione) e dimentica gli stop nativi che
+        non sono più sull'exchange, che il primo tick rimette.
+        Se le posizioni non si possono leggere non scarta nulla: la
+        riconciliazione resta in sospeso e la ritenta il primo tick riuscito.
+        """
+        if self.store is None:
+            return {"restored": 0, "dropped": 0, "pending": 0}
+        saved = self.store.load()
+        positions = self._read_positions() if saved else []
+        if positions is None:
+            self._pending_restore = saved
+            logger.warning("⚠️ Posizioni non disponibili: ripristino di %d symbol rimandato al prossimo tick",
+                           len(saved))
+            return {"restored": 0, "dropped": 0, "pending": len(saved)}
+        return self._reconcile_saved(saved, positions)
+
+    def _reconcile_saved(self, saved: Dict[str, Dict[str, Any]],
+                         positions: List[Dict[str, Any]]) -> Dict[str, int]:
+        by_symbol = {p["symbol"]: p for p in positions}
+        resting = self._resting_oids() if saved else None
+
+        restored: Dict[str, Dict[str, Any]] = {}
+        dropped: List[str] = []
+        with self._trailing_lock:
+            self._pending_restore = None
+            for symbol, state in saved.items():
+                if symbol in self.trailing_state:
+                    continue  # aperta dopo l'avvio: lo stato in memoria è più recente
+                p = by_symbol.get(symbol)
+                entry_px = state.get("entry_px")
+                if (
+                    p is None
+                    or (state.get("side") and state["side"] != p["side"])
+                    or (entry_px and abs(p["entry_price"] / entry_px - 1.0) > 1e-4)
+                ):
+                    dropped.append(symbol)
+                    continue
+                if resting is not None and state.get("stop_oid") not in resting:
+                    state["stop_oid"] = state["stop_px"] = None
+                restored[symbol] = state
+
+            self.trailing_state.update(restored)
+            self.book.invalidate()
+            self._persist(*dropped, *restored)
+        logger.info("♻️ Stato trailing ripristinato: %d symbol (%d scartati)", len(restored), len(dropped))
+        return {"restored": len(restored), "dropped": len(dropped), "pending": 0}
+
+    # ------------------------------------------------------------------
+    # Stop trigger sull'exchange
+    # ------------------------------------------------------------------
+
+    def _round_px(self, symbol: str, px: float) -> float:
+        """Prezzo valido per Hyperliquid: 5 cifre significative e max (6 - szDecimals) decimali."""
+        spec = self.assets.get(symbol)
+        return spec.round_price(px) if spec is not None else float(f"{px:.5g}")
+
+    def _stop_request(self, symbol: str, side: str, size: float, stop_px: float) -> Dict[str, Any]:
+        """OrderRequest di uno stop-market reduce-only che chiude la posizione."""
+        is_buy = side == "short"
+        limit_px = stop_px * (1.0 + STOP_ORDER_SLIPPAGE if is_buy else 1.0 - STOP_ORDER_SLIPPAGE)
+        return {
+            "coin": symbol,
+            "is_buy": is_buy,
+            "sz": size,
+            "limit_px": self._round_px(symbol, limit_px),
+            "order_type": {"trigger": {"triggerPx": self._round_px(symbol, stop_px), "isMarket": True, "tpsl": "sl"}},
+            "reduce_only": True,
+        }
+
+    @staticmethod
+    def _statuses(resp: Any) -> List[Any]:
+        if not isinstance(resp, dict) or resp.get("status") != "ok":
+            return []
+        data = resp.get("response", {})
+        return data.get("data", {}).get("statuses", []) if isinstance(data, dict) else []
+
+    def _submit_stops(self, places: List[tuple], modifies: List[tuple]) -> None:
+        """
+        Invia in batch gli stop nuovi (bulk_orders) e gli spostamenti
+        (bulk_modify_orders_new): al più due chiamate per tick.
+        places/modifies: [(symbol, request, stop_px)].
+        """
+        for call, items, payload in (
+            ("bulk_orders", places, [req for _, req, _ in places]),
+            ("bulk_modify_orders_new", modifies, [req for _, req, _ in modifies]),
+        ):
+            if not items:
+                continue
+            try:
+                with metrics.upstream_call("hyperliquid", call):
+                    resp = getattr(self.exchange, call)(payload)
+            except Exception as e:
+                logger.error("❌ Errore %s stop (%d ordini): %s", call, len(items), e)
+                continue
+            statuses = self._statuses(resp)
+            if not statuses:
+                logger.warning("⚠️ %s stop rifiutato: %s", call, resp)
+                continue
+            for (symbol, req, stop_px), st in zip(items, statuses):
+                state = self.trailing_state.get(symbol)
+                if state is None:
+                    continue
+                if isinstance(st, dict) and "error" in st:
+                    logger.warning("⚠️ Stop %s non accettato: %s", symbol, st["error"])
+                    if call == "bulk_modify_orders_new":
+                        state["stop_oid"] = None  # l'ordine non c'è più: al prossimo tick si rimette
+                    continue
+                resting = st.get("resting", {}) if isinstance(st, dict) else {}
+                # una modify può restituire un nuovo oid
+                state["stop_oid"] = resting.get("oid", state.get("stop_oid") if call != "bulk_orders" else None)
+                state["stop_px"] = stop_px
+
+    def _cancel_stops(self, symbols: List[str]) -> None:
+        """Cancel in un'unica bulk_cancel degli stop nativi dei symbol dati."""
+        reqs = [{"coin": s, "oid": self.trailing_state[s]["stop_oid"]} for s in symbols
+                if (self.trailing_state.get(s) or {}).get("stop_oid") is not None]
+        if not reqs:
+            return
+        try:
+            with metrics.upstream_call("hyperliquid", "bulk_cancel"):
+                self.exchange.bulk_cancel(reqs)
+        except Exception as e:
+            logger.warning("⚠️ Cancel stop %s fallito: %s", ",".join(r["coin"] for r in reqs), e)
+
+    def _cancel_stop(self, symbol: str) -> None:
+        state = self.trailing_state.get(symbol) or {}
+        oid = state.get("stop_oid")
+        if oid is None:
+            return
+        try:
+            with metrics.upstream_call("hyperliquid", "cancel"):
+                resp = self.exchange.cancel(symbol, oid)
+        except Exception as e:
+            # reduce-only senza posizione: nel peggiore dei casi resta inerte
+            logger.warning("⚠️ Cancel stop %s (oid=%s) fallito: %s", symbol, oid, e)
+            return
+        if any(isinstance(st, dict) and "error" in st for st in self._statuses(resp)):
+            logger.warning("⚠️ Cancel stop %s (oid=%s) rifiutato: %s", symbol, oid, resp)
+        # tolto (o già scattato): lo stato non deve più puntare a quell'ordine
+        state["stop_oid"] = state["stop_px"] = None
+
+    # ------------------------------------------------------------------
+    # Log di esecuzione
+    # ------------------------------------------------------------------
 
-        sl_percent = pnl_percent - 1.0
-        return sl_percent / 100.0
+    @staticmethod
+    def _execution(execution: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Timestamp delle fasi di un ordine; se il chiamante non li passa, ricevuto adesso."""
+        execution = dict(execution or {})
+        if execution.get("received") is None:
+            execution["received"] = time.time()
+        return execution
+
+    def _log_execution(self, symbol: str, action: str, side: Optional[str], execution: Dict[str, Any],
+                       filled: Optional[Dict[str, Any]]) -> None:
+        """side = verso della posizione (long/short): la direzione dell'ordine dipende dall'azione."""
+        is_buy = None if side is None else (side == "long") == (action == "open")
+        if filled is not None and execution.get("fill") is None:
+            # IOC/market: il fill arriva nella risposta dell'ordine
+            execution["fill"] = execution.get("ack")
+        self.executions.record(
+            symbol, action, is_buy, execution, execution.get("expected_px"),
+            float(filled["avgPx"]) if filled else None, ok=filled is not None,
+        )
+
+    @classmethod
+    def _filled(cls, resp: Any) -> Optional[Dict[str, Any]]:
+        return next((st["filled"] for st in cls._statuses(resp)
+                     if isinstance(st, dict) and "filled" in st), None)
 
     # ------------------------------------------------------------------
     # API pubblica
@@ -151,76 +480,344 @@ class HyperliquidTrader:
         side: str,
         usd_amount: float,
         sl_pct: float,
+        execution: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Any]:
         """
         Apre una posizione LONG/SHORT su Hyperliquid con leva 1x.
+        `execution`: timestamp già noti dell'ordine (decision, received) per il log di esecuzione.
+        Un ordine sotto i minimi dell'exchange non viene inviato: ok=False con invalid=True.
         """
+        execution = self._execution(execution)
+        side = self._check_side(side)
+        self._set_leverage(symbol)
+        execution["expected_px"] = self._get_last_price(symbol)
+        try:
+            size = self._usd_to_size(symbol, usd_amount, execution["expected_px"])
+            resp = self._market_open(symbol, side, size, usd_amount, sl_pct, execution)
+        except Exception as e:
+            return self._open_failed(symbol, side, execution, e)
+        return self._after_open(symbol, side, resp, execution)
+
+    def _open_failed(self, symbol: str, side: str, execution: Dict[str, Any], e: Exception) -> Dict[str, Any]:
+        self._log_execution(symbol, "open", side, execution, None)
+        if isinstance(e, InvalidOrder):
+            logger.warning("⚠️ Apertura %s non inviata: %s", symbol, e)
+            return {"ok": False, "error": str(e), "invalid": True}
+        logger.error("❌ Errore apertura posizione %s: %s", symbol, e)
+        return {"ok": False, "error": str(e)}
+
+    def close_position(self, symbol: str, execution: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Chiude interamente la posizione su un symbol; lo stop nativo si toglie solo dopo il fill."""
+        execution = self._execution(execution)
+        try:
+            resp = self._market_close(symbol, execution)
+        except Exception as e:
+            logger.error("❌ Errore chiusura posizione %s: %s", symbol, e)
+            self._log_execution(symbol, "close", (self.trailing_state.get(symbol) or {}).get("side"),
+                                execution, None)
+            return {"ok": False, "error": str(e)}
+        return self._after_close(symbol, resp, execution)
+
+    # Passi di open/close: separati perché AsyncHyperliquidTrader esegue in
+    # parallelo quelli indipendenti (leverage e prezzo, cancel e close)
+
+    @staticmethod
+    def _check_side(side: str) -> str:
         side = side.lower().strip()
         if side not in {"long", "short"}:
             raise ValueError(f"side non valido: {side}")
+        return side
 
-        is_buy = side == "long"
-
-        # Leverage 1x
+    def _set_leverage(self, symbol: str) -> None:
+        # Leverage 1x: una volta per symbol e processo (la leva non cambia)
+        if symbol in self._leverage_set:
+            return
         try:
-            self.exchange.update_leverage(1, symbol, is_cross=True)
+            with metrics.upstream_call("hyperliquid", "update_leverage"):
+                self.exchange.update_leverage(1, symbol, is_cross=True)
+            self._leverage_set.add(symbol)
         except Exception as e:
-            logger.warning(f"⚠️ Impossibile settare leverage 1x per {symbol}: {e}")
-
-        size = self._usd_to_size(symbol, usd_amount)
+            logger.warning("⚠️ Impossibile settare leverage 1x per %s: %s", symbol, e)
 
+    def _market_open(self, symbol: str, side: str, size: float, usd_amount: float, sl_pct: float,
+                     execution: Optional[Dict[str, Any]] = None) -> Any:
         logger.info(
-            f"▶️ OPEN {symbol} | side={side} | size={size:.6f} | notional≈{usd_amount:.2f} USD | sl_init={sl_pct}"
+            "▶️ OPEN %s | side=%s | size=%.6f | notional≈%.2f USD | sl_init=%s",
+            symbol, side, size, usd_amount, sl_pct,
         )
-
+        execution = execution if execution is not None else {}
         try:
-            resp = self.exchange.market_open(
-                name=symbol,
-                is_buy=is_buy,
-                sz=size,
-                px=None,
-                slippage=0.05,
-            )
-            logger.info(f"✅ Order result OPEN {symbol}: {resp}")
-        except Exception as e:
-            logger.error(f"❌ Errore apertura posizione {symbol}: {e}")
-            return {"ok": False, "error": str(e)}
+            with metrics.upstream_call("hyperliquid", "market_open"):
+                execution["sent"] = time.time()
+                resp = self.exchange.market_open(
+                    name=symbol,
+                    is_buy=side == "long",
+                    sz=size,
+                    px=None,
+                    slippage=0.05,
+                )
+                execution["ack"] = time.time()
+            logger.info("✅ Order result OPEN %s: %s", symbol, resp)
+            return resp
+        finally:
+            self.invalidate_account_state()
+
+    def _after_open(self, symbol: str, side: str, resp: Any,
+                    execution: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Stato trailing, stop nativo iniziale e log di esecuzione della posizione appena aperta."""
+        filled = self._filled(resp)
+        if execution is not None:
+            self._log_execution(symbol, "open", side, execution, filled)
+        with self._trailing_lock:
+            place = self._init_trailing(symbol, side, filled)
+            if place:
+                self._submit_stops(*self._split_stops([place]))
+                logger.info("🛡️ Stop nativo %s @ %s (oid=%s)", symbol, place[2],
+                            self.trailing_state[symbol].get("stop_oid"))
+            self._persist(symbol)
 
-        # Inizializza SL a default (-2%)
+        return {"ok": True, "response": resp}
+
+    def _init_trailing(self, symbol: str, side: str, filled: Optional[Dict[str, Any]]) -> Optional[tuple]:
+        """
+        Stato trailing iniziale; ritorna lo stop nativo da mettere (symbol, request, stop_px).
+        Da chiamare con _trailing_lock. Se un tick ha già messo uno stop per la
+        posizione appena vista, il suo oid resta e lo stop viene spostato, non duplicato.
+        """
+        # SL iniziale sempre il default (-2%), come nel trailing: max_risk_pct è solo informativo
+        init_sl_pct = -abs(self.default_sl_pct)
+        prev = self.trailing_state.get(symbol) or {}
         self.trailing_state[symbol] = {
-            "sl_pct": -abs(self.default_sl_pct)
+            "sl_pct": init_sl_pct, "stop_oid": prev.get("stop_oid"), "stop_px": prev.get("stop_px"),
+            "side": side, "entry_px": float(filled["avgPx"]) if filled else None,
         }
+        if not (self.native_stops and filled):
+            return None
+        entry, filled_sz = float(filled["avgPx"]), float(filled["totalSz"])
+        stop_px = self._round_px(symbol, entry * (1.0 + init_sl_pct if side == "long" else 1.0 - init_sl_pct))
+        return (symbol, self._stop_request(symbol, side, filled_sz, stop_px), stop_px)
+
+    def _split_stops(self, items: List[tuple]) -> tuple:
+        """(places, modifies) per _submit_stops: modify dove il symbol ha già uno stop sull'exchange."""
+        places: List[tuple] = []
+        modifies: List[tuple] = []
+        for symbol, req, stop_px in items:
+            oid = (self.trailing_state.get(symbol) or {}).get("stop_oid")
+            if oid is None:
+                places.append((symbol, req, stop_px))
+            else:
+                modifies.append((symbol, {"oid": oid, "order": req}, stop_px))
+        return places, modifies
 
-        return {"ok": True, "response": resp}
-
-    def close_position(self, symbol: str) -> Dict[str, Any]:
-        """Chiude interamente la posizione su un symbol."""
-        logger.info(f"▶️ CLOSE {symbol} (market_close)")
+    def _resize_stop(self, symbol: str, remaining: float) -> Optional[tuple]:
+        """
+        Stop nativo ridimensionato sul residuo di una chiusura parziale
+        (symbol, request, stop_px), da passare a _split_stops; None se il
+        symbol non ha uno stop sull'exchange. Da chiamare con _trailing_lock.
+        """
+        state = self.trailing_state.get(symbol) or {}
+        if not self.native_stops or state.get("stop_oid") is None or not state.get("stop_px") or not state.get("side"):
+            return None
+        return (symbol, self._stop_request(symbol, state["side"], remaining, state["stop_px"]), state["stop_px"])
 
+    def _market_close(self, symbol: str, execution: Optional[Dict[str, Any]] = None) -> Any:
+        logger.info("▶️ CLOSE %s (market_close)", symbol)
+        execution = execution if execution is not None else {}
+        # il mid che market_close userà come riferimento: prezzo atteso del fill
+        execution["expected_px"] = self.prices.get(symbol)
         try:
-            resp = self.exchange.market_close(
-                coin=symbol,
-                sz=None,
-                px=None,
-                slippage=0.05,
-            )
-            logger.info(f"✅ Order result CLOSE {symbol}: {resp}")
-        except Exception as e:
-            logger.error(f"❌ Errore chiusura posizione {symbol}: {e}")
-            return {"ok": False, "error": str(e)}
+            with metrics.upstream_call("hyperliquid", "market_close"):
+                execution["sent"] = time.time()
+                resp = self.exchange.market_close(
+                    coin=symbol,
+                    sz=None,
+                    px=None,
+                    slippage=0.05,
+                )
+                execution["ack"] = time.time()
+            logger.info("✅ Order result CLOSE %s: %s", symbol, resp)
+            return resp
+        finally:
+            self.invalidate_account_state()
 
-        if symbol in self.trailing_state:
-            del self.trailing_state[symbol]
+    def _after_close(self, symbol: str, resp: Any, execution: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Dopo il fill: cancel dello stop nativo e via lo stato trailing. Senza
+        fill lo stop resta; con un fill parziale (IOC sul book sottile) lo stop
+        viene ridimensionato sul residuo, che resta protetto.
+        """
+        filled = self._filled(resp)
+        if execution is not None:
+            side = (self.trailing_state.get(symbol) or {}).get("side")
+            self._log_execution(symbol, "close", side, execution, filled)
+        if filled is None:
+            logger.warning("⚠️ CLOSE %s non eseguito, lo stop nativo resta: %s", symbol, resp)
+            return {"ok": False, "error": f"Chiusura non eseguita: {resp}"}
+        # market_close non dice quanto resta: si rilegge la posizione (cache già invalidata)
+        positions = self._read_positions()
+        with self._trailing_lock:
+            if positions is None:
+                # residuo non verificabile: lo stop reduce-only resta, al più inerte; il tick ripulisce
+                logger.warning("⚠️ CLOSE %s eseguito ma posizione non verificabile, lo stop nativo resta", symbol)
+                return {"ok": True, "response": resp}
+            remaining = next((p["size"] for p in positions if p["symbol"] == symbol), 0.0)
+            if remaining > 0:
+                logger.warning("⚠️ CLOSE %s parziale (eseguiti %s), lo stop resta sul residuo %.8g",
+                               symbol, filled.get("totalSz"), remaining)
+                resize = self._resize_stop(symbol, remaining)
+                if resize:
+                    self._submit_stops(*self._split_stops([resize]))
+                self._persist(symbol)
+                return {"ok": False, "error": f"Chiusura parziale, residuo {remaining:.8g}", "response": resp}
+            self._cancel_stop(symbol)
+            if symbol in self.trailing_state:
+                del self.trailing_state[symbol]
+                self._persist(symbol)
 
         return {"ok": True, "response": resp}
 
+    def bulk_execute(self, orders: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        OPEN e CLOSE di un ciclo in una sola azione firmata (bulk_orders):
+        ogni ordine è un IOC a prezzo marketable (mid ± 5%), come fanno
+        market_open/market_close dell'SDK uno alla volta.
+
+        orders: [{"symbol", "action": "open"|"close", "side", "size_usd", "execution"}]
+        (execution opzionale: timestamp già noti per il log di esecuzione)
+        Ritorna un risultato per ordine, nello stesso ordine:
+        {"symbol", "action", "ok", "response" | "error"}; invalid=True se l'ordine
+        è stato scartato prima dell'invio (sotto i minimi dell'exchange).
+        Gli stop nativi delle nuove posizioni partono poi in un'unica bulk_orders.
+        Una CLOSE eseguita solo in parte è ok=False: lo stop resta, ridimensionato
+        sul residuo.
+        """
+        slippage = 0.05  # come market_open/market_close
+        results: List[Optional[Dict[str, Any]]] = [None] * len(orders)
+        plan: List[tuple] = []  # (indice, symbol, action, side, execution, request)
+        mids = self.prices.snapshot()
+        positions: Optional[Dict[str, Dict[str, Any]]] = None
+
+        for idx, o in enumerate(orders):
+            symbol, action = str(o.get("symbol", "")).upper(), o.get("action")
+            execution = self._execution(o.get("execution"))
+            try:
+                if action == "open":
+                    side = self._check_side(o.get("side") or "")
+                    self._set_leverage(symbol)
+                    px = mids.get(symbol) or self._get_last_price(symbol)
+                    size = self._usd_to_size(symbol, float(o["size_usd"]), px)
+                    is_buy, reduce_only = side == "long", False
+                    logger.info("▶️ OPEN %s | side=%s | size=%.6f | notional≈%.2f USD | bulk",
+                                symbol, side, size, float(o["size_usd"]))
+                elif action == "close":
+                    if positions is None:
+                        # size reale della posizione, non quella in cache
+                        self.invalidate_account_state()
+                        read = self._read_positions()
+                        if read is None:
+                            raise RuntimeError("Posizioni non disponibili (user_state)")
+                        positions = {p["symbol"]: p for p in read}
+                    pos = positions.get(symbol)
+                    if pos is None:
+                        raise RuntimeError(f"Nessuna posizione aperta su {symbol}")
+                    px = mids.get(symbol) or self._get_last_price(symbol)
+                    if px is None:
+                        raise RuntimeError(f"Impossibile ottenere il prezzo per {symbol}")
+                    side, size = pos["side"], pos["size"]
+                    is_buy, reduce_only = side == "short", True
+                    logger.info("▶️ CLOSE %s | size=%.6f | bulk", symbol, size)
+                else:
+                    raise ValueError(f"azione non valida: {action}")
+            except Exception as e:
+                results[idx] = {"symbol": symbol, "action": action, "ok": False, "error": str(e)}
+                if isinstance(e, InvalidOrder):
+                    results[idx]["invalid"] = True
+                continue
+            limit_px = self._round_px(symbol, px * (1.0 + slippage if is_buy else 1.0 - slippage))
+            execution["expected_px"] = px
+            plan.append((idx, symbol, action, side, execution, {
+                "coin": symbol, "is_buy": is_buy, "sz": size, "limit_px": limit_px,
+                "order_type": {"limit": {"tif": "Ioc"}}, "reduce_only": reduce_only,
+            }))
+
+        statuses: List[Any] = []
+        error = "Nessuna risposta per l'ordine"
+        if plan:
+            try:
+                with metrics.upstream_call("hyperliquid", "bulk_orders"):
+                    sent = time.time()
+                    resp = self.exchange.bulk_orders([req for *_, req in plan])
+                    ack = time.time()
+                for *_, execution, _ in plan:
+                    execution["sent"], execution["ack"] = sent, ack
+                logger.info("✅ Order result BULK (%d ordini): %s", len(plan), resp)
+                statuses = self._statuses(resp)
+                if not statuses:
+                    error = f"bulk_orders rifiutato: {resp}"
+            except Exception as e:
+                logger.error("❌ Errore bulk_orders (%d ordini): %s", len(plan), e)
+                error = str(e)
+            finally:
+                self.invalidate_account_state()
+
+        places: List[tuple] = []
+        closed: List[str] = []
+        # stato trailing toccato solo con il lock: il trailing engine gira in parallelo
+        with self._trailing_lock:
+            for k, (idx, symbol, action, side, execution, req) in enumerate(plan):
+                st = statuses[k] if k < len(statuses) else {"error": error}
+                filled = st.get("filled") if isinstance(st, dict) else None
+                self._log_execution(symbol, action, side, execution, filled)
+                if not isinstance(st, dict) or "error" in st or filled is None:
+                    err = st.get("error", st) if isinstance(st, dict) else st
+                    logger.warning("⚠️ %s %s non eseguito: %s", action.upper(), symbol, err)
+                    results[idx] = {"symbol": symbol, "action": action, "ok": False, "error": str(err)}
+                    continue
+                if action == "open":
+                    place = self._init_trailing(symbol, side, filled)
+                    if place:
+                        places.append(place)
+                else:
+                    # IOC reduce-only: può eseguire solo una parte della posizione
+                    # in Decimal: totalSz è una stringa esatta, il residuo non deve avere errori di float
+                    remaining = float(Decimal(str(req["sz"])) - Decimal(str(filled.get("totalSz", req["sz"]))))
+                    if remaining > 0:
+                        logger.warning("⚠️ CLOSE %s parziale (eseguiti %s su %s), lo stop resta sul residuo",
+                                       symbol, filled.get("totalSz"), req["sz"])
+                        resize = self._resize_stop(symbol, remaining)
+                        if resize:
+                            places.append(resize)
+                        results[idx] = {"symbol": symbol, "action": action, "ok": False,
+                                        "error": f"Chiusura parziale, residuo {remaining:.8g}", "response": st}
+                        continue
+                    closed.append(symbol)
+                results[idx] = {"symbol": symbol, "action": action, "ok": True, "response": st}
+
+            # stop delle posizioni chiuse (dopo il fill: se il close fallisce lo stop resta);
+            # in places anche gli stop ridimensionati sui residui delle chiusure parziali
+            self._cancel_stops(closed)
+            for symbol in closed:
+                self.trailing_state.pop(symbol, None)
+            if places:
+                self._submit_stops(*self._split_stops(places))
+            self._persist(*closed, *(p[0] for p in places))
+        return results
+
     def get_open_positions(self) -> List[Dict[str, Any]]:
-        """Ritorna lista di posizioni aperte in formato semplice."""
+        """Ritorna lista di posizioni aperte in formato semplice ([] se user_state non risponde)."""
+        positions = self._read_positions()
+        return [] if positions is None else positions
+
+    def _read_positions(self) -> Optional[List[Dict[str, Any]]]:
+        """
+        Posizioni aperte, o None se user_state fallisce: chi toglie stato per
+        le posizioni "sparite" deve distinguere "nessuna posizione" da "non so".
+        """
         try:
-            state = self.info.user_state(self.address)
+            state = self._user_state()
         except Exception as e:
-            logger.error(f"❌ Errore lettura user_state Hyperliquid: {e}")
-            return []
+            logger.error("❌ Errore lettura user_state Hyperliquid: %s", e)
+            return None
 
         positions: List[Dict[str, Any]] = []
 
@@ -268,80 +865,119 @@ class HyperliquidTrader:
 
         Lo SL NON torna mai indietro (solo migliora).
         Se il prezzo raggiunge lo SL → chiudiamo la posizione.
+        Con gli stop nativi gli SL migliorati vengono spostati sull'exchange
+        in un'unica bulk modify a fine giro.
+
+        La valutazione è vettoriale su tutte le posizioni (TrailingBook):
+        solo gli stop toccati e gli SL migliorati producono chiamate.
+        Un tick alla volta: lo chiamano sia il trailing engine che /tick_trailing.
         """
-        positions = self.get_open_positions()
-        results: List[Dict[str, Any]] = []
+        with self._trailing_lock:
+            return self._trailing_tick()
+
+    def _trailing_tick(self) -> List[Dict[str, Any]]:
+        positions = self._read_positions()
+        if positions is None:
+            # lettura inaffidabile: niente purge né nuovi stop, gli stop nativi restano dove sono
+            logger.warning("⚠️ Tick trailing saltato: posizioni non disponibili")
+            return []
+        if self._pending_restore is not None:
+            self._reconcile_saved(self._pending_restore, positions)
+
+        # posizioni sparite (stop nativo scattato o chiusura esterna): via lo stato
+        open_symbols = {p["symbol"] for p in positions}
+        gone = [s for s in self.trailing_state if s not in open_symbols]
+        for symbol in gone:
+            logger.info("🧹 %s non più aperta: rimuovo lo stato trailing", symbol)
+            del self.trailing_state[symbol]
+        self._persist(*gone)
 
-        for p in positions:
-            symbol = p["symbol"]
-            side = p["side"]
-            entry = p["entry_price"]
-            if entry <= 0:
-                continue
+        book = self.book
+        book.sync(positions, self.trailing_state, self.default_sl_pct)
+        if not len(book):
+            return []
 
-            last = self._get_last_price(symbol)
-            if not last:
+        mids = self.prices.snapshot()
+        if not mids:
+            # allMids assente o troppo vecchio: meglio non muovere stop che usare prezzi vecchi
+            logger.warning("⚠️ Tick trailing saltato: prezzi non disponibili")
+            return []
+        last = np.array([mids.get(s) or self._get_last_candle_close(s) or np.nan for s in book.symbols],
+                        dtype=float)
+        ev = book.evaluate(last, self.default_sl_pct)
+
+        places: List[tuple] = []
+        modifies: List[tuple] = []
+        closed = False
+        dirty: List[str] = []
+        todo = ev["improved"] | ev["stop_hit"]
+        if self.native_stops:
+            # posizioni ancora senza stop sull'exchange (apertura esterna o stop rifiutato)
+            todo |= np.array([(self.trailing_state.get(s) or {}).get("stop_oid") is None for s in book.symbols])
+        for i in np.flatnonzero(todo):
+            symbol, side = book.symbols[i], book.sides[i]
+            state = self.trailing_state.setdefault(symbol, {"stop_oid": None, "stop_px": None})
+            state.update(sl_pct=float(ev["sl_pct"][i]), side=side, entry_px=float(book.entry[i]))
+            dirty.append(symbol)
+            if not ev["valid"][i]:
                 continue
+            sl_price = float(ev["sl_price"][i])
 
-            # Profit % attuale
-            if side == "long":
-                pnl_pct = (last - entry) / entry
-            else:
-                pnl_pct = (entry - last) / entry
-
-            state = self.trailing_state.get(symbol, {"sl_pct": -abs(self.default_sl_pct)})
-            current_sl_pct = state["sl_pct"]
-
-            target_sl_pct = self._compute_sl_pct_from_profit(pnl_pct)
-
-            # mai peggiorare lo SL
-            new_sl_pct = max(current_sl_pct, target_sl_pct)
-
-            # calcolo prezzo stop
-            if side == "long":
-                sl_price = entry * (1.0 + new_sl_pct)
-                stop_hit = last <= sl_price
-            else:
-                sl_price = entry * (1.0 - new_sl_pct)
-                stop_hit = last >= sl_price
-
-            # aggiorna stato
-            self.trailing_state[symbol] = {"sl_pct": new_sl_pct}
-
-            if stop_hit:
+            if ev["stop_hit"][i]:
                 logger.info(
-                    f"🛑 TRAILING STOP HIT {symbol} | side={side} | "
-                    f"entry={entry:.4f} last={last:.4f} sl_px={sl_price:.4f} "
-                    f"pnl={pnl_pct*100:.2f}% sl_pct={new_sl_pct*100:.2f}%"
+                    "🛑 TRAILING STOP HIT %s | side=%s | entry=%.4f last=%.4f sl_px=%.4f pnl=%.2f%% sl_pct=%.2f%%",
+                    symbol, side, book.entry[i], last[i], sl_price, ev["pnl_pct"][i] * 100, ev["sl_pct"][i] * 100,
                 )
+                closed = True
                 try:
-                    self.exchange.market_close(
-                        coin=symbol,
-                        sz=None,
-                        px=None,
-                        slippage=0.05,
-                    )
-                    if symbol in self.trailing_state:
+                    with metrics.upstream_call("hyperliquid", "market_close"):
+                        resp = self.exchange.market_close(
+                            coin=symbol,
+                            sz=None,
+                            px=None,
+                            slippage=0.05,
+                        )
+                    if self._filled(resp) is None:
+                        # lo stop nativo resta a proteggere la posizione
+                        logger.warning("⚠️ Chiusura trailing %s non eseguita: %s", symbol, resp)
+                    else:
+                        self._cancel_stop(symbol)
                         del self.trailing_state[symbol]
                 except Exception as e:
-                    logger.error(f"❌ Errore chiusura posizione trailing {symbol}: {e}")
-            else:
-                logger.debug(
-                    f"🔁 TRAILING {symbol} | side={side} | entry={entry:.4f} last={last:.4f} "
-                    f"pnl={pnl_pct*100:.2f}% sl_pct={new_sl_pct*100:.2f}% sl_px={sl_price:.4f}"
-                )
+                    logger.error("❌ Errore chiusura posizione trailing %s: %s", symbol, e)
+                finally:
+                    self.invalidate_account_state()
+            elif self.native_stops:
+                stop_px = self._round_px(symbol, sl_price)
+                req = self._stop_request(symbol, side, float(book.size[i]), stop_px)
+                if state["stop_oid"] is None:
+                    places.append((symbol, req, stop_px))
+                elif stop_px != state["stop_px"]:
+                    modifies.append((symbol, {"oid": state["stop_oid"], "order": req}, stop_px))
+
+        if places or modifies:
+            self._submit_stops(places, modifies)
+        self._persist(*dirty)
+        if closed:
+            book.invalidate()
+
+        logger.debug("🔁 TRAILING %d posizioni | migliorati=%d stop=%d",
+                     len(book), int(ev["improved"].sum()), int(ev["stop_hit"].sum()))
 
+        results: List[Dict[str, Any]] = []
+        for i, symbol in enumerate(book.symbols):
+            if not ev["valid"][i]:
+                continue
             results.append(
                 {
                     "symbol": symbol,
-                    "side": side,
-                    "entry_price": entry,
-                    "last_price": last,
-                    "pnl_pct": pnl_pct,
-                    "sl_pct": self.trailing_state[symbol]["sl_pct"],
-                    "sl_price": sl_price,
-                    "stop_hit": stop_hit,
+                    "side": book.sides[i],
+                    "entry_price": float(book.entry[i]),
+                    "last_price": float(last[i]),
+                    "pnl_pct": float(ev["pnl_pct"][i]),
+                    "sl_pct": float(ev["sl_pct"][i]),
+                    "sl_price": float(ev["sl_price"][i]),
+                    "stop_hit": bool(ev["stop_hit"][i]),
                 }
             )
-
         return results
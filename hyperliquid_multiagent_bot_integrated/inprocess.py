@@ -0,0 +1,224 @@
+import asyncio
+import importlib
+import importlib.util
+import os
+import sys
+import time
+from contextlib import AsyncExitStack
+from types import ModuleType
+from typing import Any, Callable, Dict, Tuple
+from urllib.parse import urlsplit
+
+from fastapi import HTTPException, Request
+from fastapi.dependencies.utils import solve_dependencies
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import APIRoute, serialize_response
+
+from . import metrics
+from .http_client import _LatencyStats
+from .logging_config import setup_logger
+from .serialization import JSON, dumps
+
+logger = setup_logger("inprocess")
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# host del servizio (come in docker-compose) -> cartella dell'agente
+AGENT_DIRS: Dict[str, str] = {
+    "technical_analyzer": "agents/01_technical_analyzer",
+    "fibonacci_agent": "agents/03_fibonacci_agent",
+    "gann_agent": "agents/04_gann_agent",
+    "sentiment_agent": "agents/05_sentiment_agent",
+    "forecaster_agent": "agents/06_forecaster_agent",
+    "master_ai_agent": "agents/07_master_ai_agent",
+    "position_manager": "agents/08_position_manager",
+}
+
+
+def load_agent(service: str) -> ModuleType:
+    """
+    Importa il main.py di un agente come `agent_<service>.main`.
+    La cartella viene registrata come package, così gli import relativi
+    (es. `from .indicators import ...`) funzionano come nel container.
+    """
+    pkg_name = f"agent_{service}"
+    mod_name = f"{pkg_name}.main"
+    if mod_name in sys.modules:
+        return sys.modules[mod_name]
+
+    agent_dir = os.path.join(ROOT, AGENT_DIRS[service])
+    if pkg_name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(
+            pkg_name, os.path.join(agent_dir, "__init__.py"), submodule_search_locations=[agent_dir]
+        )
+        pkg = importlib.util.module_from_spec(spec)
+        sys.modules[pkg_name] = pkg
+        spec.loader.exec_module(pkg)
+    return importlib.import_module(mod_name)
+
+
+class _Handler:
+    """
+    Endpoint FastAPI di un agente, invocabile direttamente con un dict.
+    I parametri (body, query, Request, Depends) li risolve FastAPI stessa dal
+    dependant della route, e il risultato passa dal response_model: l'agente
+    vede gli stessi argomenti e l'orchestrator riceve lo stesso JSON che
+    avrebbe via HTTP, solo senza serializzare/parsare il body.
+    """
+
+    def __init__(self, route: APIRoute):
+        self.route = route
+        self.endpoint: Callable = route.endpoint
+        self.is_async = asyncio.iscoroutinefunction(self.endpoint)
+
+    async def __call__(self, method: str, path: str, query: str, payload: Any) -> Any:
+        route = self.route
+        request = _make_request(method, path, query, payload)
+        # come nel request handler di FastAPI: exit stack per le dipendenze con yield
+        async with AsyncExitStack() as request_stack, AsyncExitStack() as function_stack:
+            request.scope["fastapi_inner_astack"] = request_stack
+            request.scope["fastapi_function_astack"] = function_stack
+            solved = await solve_dependencies(
+                request=request,
+                dependant=route.dependant,
+                body=payload if route.body_field is not None else None,
+                dependency_overrides_provider=route.dependency_overrides_provider,
+                async_exit_stack=request_stack,
+                embed_body_fields=route._embed_body_fields,
+            )
+            if solved.errors:
+                raise HTTPException(status_code=422, detail=jsonable_encoder(solved.errors))
+            if self.is_async:
+                result = await self.endpoint(**solved.values)
+            else:
+                result = await asyncio.to_thread(self.endpoint, **solved.values)
+
+        return await serialize_response(
+            field=route.response_field,
+            response_content=result,
+            include=route.response_model_include,
+            exclude=route.response_model_exclude,
+            by_alias=route.response_model_by_alias,
+            exclude_unset=route.response_model_exclude_unset,
+            exclude_defaults=route.response_model_exclude_defaults,
+            exclude_none=route.response_model_exclude_none,
+            is_coroutine=self.is_async,
+        )
+
+
+def _make_request(method: str, path: str, query: str, payload: Any) -> Request:
+    """Request ASGI minimale: query string per i parametri, body per gli endpoint che lo leggono da soli."""
+    body = dumps(payload, JSON) if payload is not None else b""
+
+    async def receive() -> Dict[str, Any]:
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "headers": [(b"content-type", JSON.encode("latin-1"))],
+        "query_string": query.encode("latin-1"),
+    }
+    return Request(scope, receive)
+
+
+class InProcessClient:
+    """
+    Stessa interfaccia di ServiceClient (post_json / get_json / latency_stats /
+    aclose), ma invece di fare una chiamata HTTP risolve l'host dell'URL
+    (es. http://technical_analyzer:8000/analyze) nell'agente corrispondente
+    e ne invoca direttamente l'handler. Gli agenti vengono importati alla
+    prima chiamata; gli handler sync girano nel threadpool come in FastAPI.
+    Il trace id passa da solo: gli handler girano in una copia del contesto.
+    Come uvicorn, prima della prima richiesta a un agente ne esegue gli
+    handler di startup (es. ripristino trailing e TrailingEngine del position
+    manager), e quelli di shutdown in aclose().
+    """
+
+    def __init__(self):
+        self._handlers: Dict[Tuple[str, str, str], _Handler] = {}
+        self._stats: Dict[Tuple[str, str], _LatencyStats] = {}
+        # service -> startup in corso o finito: le chiamate concorrenti aspettano lo stesso
+        self._started: Dict[str, "asyncio.Future[Any]"] = {}
+
+    async def _ensure_started(self, service: str) -> None:
+        started = self._started.get(service)
+        if started is None:
+            started = self._started[service] = asyncio.ensure_future(self._startup(service))
+        await asyncio.shield(started)
+
+    @staticmethod
+    async def _startup(service: str) -> Any:
+        """Entra nel lifespan dell'app (on_event("startup") compresi); ritorna il context per lo shutdown."""
+        app = load_agent(service).app
+        lifespan = app.router.lifespan_context(app)
+        await lifespan.__aenter__()
+        return lifespan
+
+    def _handler_for(self, service: str, method: str, path: str) -> _Handler:
+        key = (service, method, path)
+        handler = self._handlers.get(key)
+        if handler is not None:
+            return handler
+        module = load_agent(service)
+        for route in module.app.routes:
+            if isinstance(route, APIRoute) and route.path == path and method in route.methods:
+                handler = self._handlers[key] = _Handler(route)
+                return handler
+        raise HTTPException(status_code=404, detail=f"{method} {path} non esiste su {service}")
+
+    async def _call(self, method: str, url: str, payload: Any = None) -> Dict[str, Any]:
+        parts = urlsplit(url)
+        service = parts.hostname or ""
+        path = parts.path or "/"
+        stats = self._stats.get((service, path))
+        if stats is None:
+            stats = self._stats[(service, path)] = _LatencyStats()
+
+        t0 = time.perf_counter()
+        try:
+            if service not in AGENT_DIRS:
+                raise HTTPException(status_code=502, detail=f"Servizio sconosciuto: {service}")
+            handler = self._handler_for(service, method, path)
+            await self._ensure_started(service)
+            result = await handler(method, path, parts.query, payload)
+        except HTTPException as e:
+            self._observe(stats, service, path, t0, str(e.status_code))
+            logger.warning("%s -> status %d: %s", url, e.status_code, e.detail)
+            return {"ok": False, "error": f"{url} -> status {e.status_code}", "status": e.status_code}
+        except Exception as e:
+            self._observe(stats, service, path, t0, "error")
+            logger.error("Error calling %s: %r", url, e)
+            return {"ok": False, "error": f"Failed: {url}: {e}"}
+
+        self._observe(stats, service, path, t0, "200")
+        return result
+
+    @staticmethod
+    def _observe(stats: _LatencyStats, service: str, path: str, t0: float, status: str) -> None:
+        elapsed = time.perf_counter() - t0
+        stats.observe(elapsed * 1000.0, ok=status == "200")
+        metrics.observe_upstream(f"inprocess://{service}", path, elapsed, status)
+
+    async def post_json(self, url: str, payload: Any = None, **_: Any) -> Dict[str, Any]:
+        return await self._call("POST", url, payload)
+
+    async def get_json(self, url: str, **_: Any) -> Dict[str, Any]:
+        return await self._call("GET", url)
+
+    def latency_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {f"inprocess://{svc}{path}": st.summary() for (svc, path), st in self._stats.items()}
+
+    def reset_stats(self) -> None:
+        self._stats.clear()
+
+    async def aclose(self) -> None:
+        started, self._started = self._started, {}
+        for service, fut in started.items():
+            if not fut.done() or fut.exception() is not None:
+                continue
+            try:
+                await fut.result().__aexit__(None, None, None)
+            except Exception as e:
+                logger.warning("Shutdown di %s fallito: %r", service, e)
@@ -1,21 +1,51 @@
+import json
 import time
 import requests
-import os
+from requests.adapters import HTTPAdapter
 import logging
+import os
 from datetime import datetime
-from fastapi import FastAPI
-from threading import Thread
-from pybit.unified_trading import HTTP
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from threading import Event, Thread
+try:
+    from pybit.unified_trading import HTTP, WebSocket
+except ImportError:  # pybit non installato: nessuna sessione Bybit
+    HTTP = WebSocket = None
 from pydantic import BaseModel
+try:
+    from shared.logging_config import setup_logger
+except ImportError:  # avviato dalla root del progetto, senza il package shared
+    from logging_config import setup_logger
+try:
+    from shared.event_ring import EquityHistory, EventRing
+except ImportError:
+    from event_ring import EquityHistory, EventRing
+try:
+    from shared.asset_meta import AssetIndex, bybit_loader
+except ImportError:  # senza il package shared: solo le precisioni fisse qui sotto
+    AssetIndex = bybit_loader = None
+try:
+    from shared.bybit_account import BybitAccountCache
+except ImportError:  # senza il package shared: ogni lettura va a REST
+    BybitAccountCache = None
+try:
+    from shared.http_client import SyncServiceClient
+except ImportError:  # senza il package shared: requests.Session semplice
+    SyncServiceClient = None
 
 # --- CONFIGURAZIONE ---
 SLEEP_INTERVAL = 900  # 15 Minuti (Ciclo AI Master)
-FAST_CHECK_INTERVAL = 30 # 30 Secondi (Ciclo Guardiano SL)
+FAST_CHECK_INTERVAL = 30 # 30 Secondi (Ciclo Guardiano SL; con lo stream ticker reagisce subito al mark price)
+ACCOUNT_RECONCILE_INTERVAL = 300 # Snapshot REST di controllo quando saldo/posizioni arrivano dal WebSocket
+GUARDIAN_MIN_SPACING = 2 # Secondi minimi tra due passate del guardiano (i delta ticker arrivano a raffica)
+SL_RETRY_BASE = 30       # Dopo un set_trading_stop fallito il simbolo aspetta 30s, poi 60s, ...
+SL_RETRY_MAX = 600       # ...fino a 10 minuti tra un tentativo e l'altro
 
 MASTER_AI_URL = "http://master-ai-agent:8000"
 TARGET_SYMBOLS = ["BTCUSDT", "ETHUSDT", "SOLUSDT"]
 
-# Precisione decimali per Qty e Prezzo (SL/TP)
+# Precisione decimali per Qty e Prezzo (SL/TP): fallback se instruments-info non è disponibile
 QTY_PRECISION = {"BTCUSDT": 3, "ETHUSDT": 2, "SOLUSDT": 1}
 PRICE_PRECISION = {"BTCUSDT": 1, "ETHUSDT": 2, "SOLUSDT": 3}
 
@@ -27,65 +57,128 @@ DEFAULT_TP_PERCENT = 0.05  # 5% Take Profit iniziale (Risk:Reward 1:2.5)
 BE_TRIGGER_PCT = 0.008 # Se il prezzo va a +0.8% a favore...
 BE_OFFSET_PCT = 0.001  # ...sposta lo SL a +0.1% (così paghiamo le commissioni)
 
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger("PositionManager")
+# --- LOG EVENTI / DASHBOARD ---
+LOG_CAPACITY = 1000     # eventi tenuti per le letture incrementali (/management_logs?since=)
+LOG_LATEST = 100        # eventi restituiti da /management_logs senza cursore
+SSE_KEEPALIVE = 15      # secondi tra i commenti keepalive dello stream SSE
+
+logger = setup_logger("PositionManager")
 app = FastAPI()
 
-# LOGS
-management_logs = [] 
-equity_history = [] 
+# LOGS: eventi con seq crescente (letture incrementali/SSE), equity a 1m/15m/4h
+management_logs = EventRing(LOG_CAPACITY)
+equity_history = EquityHistory()
 
 API_KEY = os.getenv("BYBIT_API_KEY")
 API_SECRET = os.getenv("BYBIT_API_SECRET")
 IS_TESTNET = os.getenv("BYBIT_TESTNET", "false").lower() == "true"
+# Stream privati position/wallet + ticker pubblici: saldo, posizioni e mark price senza REST
+ACCOUNT_STREAM = os.getenv("BYBIT_ACCOUNT_STREAM", "true").lower() == "true"
 
 session = None
 try:
     session = HTTP(testnet=IS_TESTNET, api_key=API_KEY, api_secret=API_SECRET)
 except: pass
 
+# Passi qty/prezzo, notional minimo e leva max di tutti i linear (instruments-info, refresh in background)
+assets = AssetIndex(bybit_loader(session)) if session and AssetIndex else None
+
+# Client HTTP persistente verso il Master AI (keepalive tra un ciclo e l'altro).
+# Un solo tentativo: execute_batch_strategy apre posizioni, non va ripetuto.
+if SyncServiceClient:
+    ai_http = SyncServiceClient(timeout=180, codec="json", retries=1, max_connections=4, max_keepalive=1)
+else:
+    ai_http = requests.Session()
+    ai_http.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
 class CloseRequest(BaseModel):
     symbol: str
 
+_LOG_LEVELS = {"error": logging.ERROR, "warning": logging.WARNING}
+
 def add_log(title, message, status="info"):
     timestamp = datetime.now().strftime("%H:%M:%S")
-    print(f"[{timestamp}] {title}: {message}")
-    management_logs.insert(0, {"id": int(time.time()*1000), "time": timestamp, "pair": title, "action": message, "status": status})
-    if len(management_logs) > 100: management_logs.pop()
+    logger.log(_LOG_LEVELS.get(status, logging.INFO), "%s: %s", title, message)
+    management_logs.append(id=int(time.time()*1000), time=timestamp, pair=title, action=message, status=status)
+
+def fetch_wallet_data():
+    """Saldo e posizioni da REST (2 chiamate). Solleva se Bybit rifiuta: lo snapshot non va sovrascritto."""
+    r = session.get_wallet_balance(accountType="UNIFIED", coin="USDT")
+    if r['retCode'] != 0:
+        raise RuntimeError(f"wallet-balance: {r.get('retMsg')}")
+    bal = float(r['result']['list'][0]['coin'][0]['walletBalance'])
+    r2 = session.get_positions(category="linear", settleCoin="USDT")
+    if r2['retCode'] != 0:
+        raise RuntimeError(f"position-list: {r2.get('retMsg')}")
+    pos = []
+    for p in r2['result']['list']:
+        if float(p['size']) > 0:
+            pos.append({
+                "symbol": p['symbol'],
+                "side": p['side'],
+                "size": float(p['size']),
+                "entry_price": float(p['avgPrice']),
+                "leverage": float(p['leverage']),
+                "pnl": float(p['unrealisedPnl']),
+                "stop_loss": float(p.get('stopLoss') or 0),
+                "take_profit": float(p.get('takeProfit') or 0),
+                "mark_price": float(p['markPrice'])
+            })
+    return bal, pos
+
+# Saldo/posizioni/mark condivisi da guardiano, ciclo AI ed endpoint (stream WebSocket + snapshot REST)
+account = (BybitAccountCache(fetch_wallet_data, rest_ttl=FAST_CHECK_INTERVAL,
+                             reconcile_seconds=ACCOUNT_RECONCILE_INTERVAL)
+           if session and BybitAccountCache else None)
+
+# Il guardiano dorme fino a FAST_CHECK_INTERVAL o al prossimo mark price di una posizione aperta
+guardian_wake = Event()
+if account is not None:
+    account.add_listener(lambda sym: guardian_wake.set())
 
 def get_wallet_data():
     if not session: return 0.0, []
-    bal = 0.0
-    pos = []
+    if account is not None:
+        return account.snapshot()
     try:
-        r = session.get_wallet_balance(accountType="UNIFIED", coin="USDT")
-        if r['retCode'] == 0:
-            bal = float(r['result']['list'][0]['coin'][0]['walletBalance'])
-        r2 = session.get_positions(category="linear", settleCoin="USDT")
-        if r2['retCode'] == 0:
-            for p in r2['result']['list']:
-                if float(p['size']) > 0:
-                    pos.append({
-                        "symbol": p['symbol'],
-                        "side": p['side'],
-                        "size": float(p['size']),
-                        "entry_price": float(p['avgPrice']),
-                        "leverage": float(p['leverage']),
-                        "pnl": float(p['unrealisedPnl']),
-                        "stop_loss": float(p.get('stopLoss', 0)),
-                        "take_profit": float(p.get('takeProfit', 0)),
-                        "mark_price": float(p['markPrice'])
-                    })
-    except: pass
-    return bal, pos
+        return fetch_wallet_data()
+    except Exception as e:
+        logger.error("Wallet fetch failed: %s", e)
+        return 0.0, []
+
+def start_account_stream():
+    """WebSocket privato (position, wallet) e pubblico (tickers) verso la cache account."""
+    if account is None or not ACCOUNT_STREAM or WebSocket is None: return
+    try:
+        private = WebSocket(testnet=IS_TESTNET, channel_type="private", api_key=API_KEY, api_secret=API_SECRET)
+        public = WebSocket(testnet=IS_TESTNET, channel_type="linear")
+        account.attach(private, public, TARGET_SYMBOLS)
+        add_log("STREAM", "Account & mark price WebSocket active", "success")
+    except Exception as e:
+        add_log("STREAM", f"WebSocket unavailable, REST polling only: {e}", "warning")
 
 def get_price(sym):
+    px = account.price(sym) if account is not None else None
+    if px: return px
     try:
         r = session.get_tickers(category="linear", symbol=sym)
         return float(r['result']['list'][0]['markPrice'])
     except: return 0.0
 
-def calculate_sl_tp(entry_price, direction, sl_pct, tp_pct, precision):
+def _spec(sym):
+    return assets.get(sym) if assets is not None else None
+
+def round_price(sym, px):
+    """Prezzo al tick size del simbolo (o alla precisione fissa)"""
+    spec = _spec(sym)
+    return spec.round_price(px) if spec else round(px, PRICE_PRECISION.get(sym, 2))
+
+def format_qty(sym, qty):
+    """Qty per difetto al qtyStep del simbolo (o alla precisione fissa)"""
+    spec = _spec(sym)
+    return spec.format_size(qty) if spec else f"{qty:.{QTY_PRECISION.get(sym, 3)}f}"
+
+def calculate_sl_tp(entry_price, direction, sl_pct, tp_pct, sym):
     """Calcola prezzi esatti per SL e TP in base alla direzione"""
     if direction == "long":
         sl = entry_price * (1 - sl_pct)
@@ -94,62 +187,91 @@ def calculate_sl_tp(entry_price, direction, sl_pct, tp_pct, precision):
         sl = entry_price * (1 + sl_pct)
         tp = entry_price * (1 - tp_pct)
     
-    return round(sl, precision), round(tp, precision)
+    return round_price(sym, sl), round_price(sym, tp)
 
 # --- GUARDIANO VELOCE (Thread Parallelo) ---
+# simbolo -> (monotonic del prossimo tentativo, attesa attuale) dopo uno spostamento SL fallito
+sl_retry = {}
+
+def guardian_pass(positions, client=None, now=None):
+    """Un controllo del guardiano: sposta a pareggio lo SL delle posizioni oltre il trigger.
+    I simboli con uno spostamento appena fallito aspettano il loro backoff.
+    Ritorna la lista degli spostamenti richiesti."""
+    client = client or session
+    now = time.monotonic() if now is None else now
+    # posizione chiusa: la prossima sul simbolo riparte senza backoff
+    for sym in set(sl_retry) - {p['symbol'] for p in positions}:
+        del sl_retry[sym]
+    moves = []
+    for p in positions:
+        sym = p['symbol']
+        side = p['side']
+        entry = p['entry_price']
+        curr_price = p['mark_price']
+        curr_sl = p['stop_loss']
+
+        # LOGICA LONG
+        if side == "Buy":
+            # Se il prezzo è salito sopra il trigger (es. +0.8%)
+            target_trigger = entry * (1 + BE_TRIGGER_PCT)
+            new_sl = round_price(sym, entry * (1 + BE_OFFSET_PCT))
+
+            # Controlla se abbiamo già spostato lo SL (per non spammare API)
+            # Se current SL è 0 o è minore del new_sl, lo alziamo
+            if curr_price <= target_trigger or not (curr_sl == 0 or curr_sl < new_sl):
+                continue
+
+        # LOGICA SHORT
+        elif side == "Sell":
+            # Se il prezzo è sceso sotto il trigger (es. -0.8%)
+            target_trigger = entry * (1 - BE_TRIGGER_PCT)
+            new_sl = round_price(sym, entry * (1 - BE_OFFSET_PCT))
+
+            # Controlla se abbiamo già spostato lo SL
+            # Se current SL è 0 o è maggiore del new_sl, lo abbassiamo
+            if curr_price >= target_trigger or not (curr_sl == 0 or curr_sl > new_sl):
+                continue
+        else:
+            continue
+
+        retry = sl_retry.get(sym)
+        if retry and now < retry[0]:
+            continue
+        add_log(sym, f"Moving SL to Break Even ({new_sl})", "warning")
+        try:
+            client.set_trading_stop(category="linear", symbol=sym, stopLoss=str(new_sl), slTriggerBy="MarkPrice")
+            sl_retry.pop(sym, None)
+            moves.append({"symbol": sym, "stop_loss": new_sl})
+        except Exception as e:
+            delay = min(SL_RETRY_MAX, retry[1] * 2) if retry else SL_RETRY_BASE
+            sl_retry[sym] = (now + delay, delay)
+            logger.error("Failed move SL %s (retry in %ss): %s", sym, delay, e)
+    return moves
+
 def monitor_positions():
-    """Controlla ogni 30s se dobbiamo spostare lo SL a pareggio"""
+    """Controlla ogni 30s (o al mark price dallo stream, al più ogni GUARDIAN_MIN_SPACING s) se dobbiamo spostare lo SL a pareggio"""
     time.sleep(60) # Aspetta 1 minuto all'avvio
     add_log("GUARDIAN", "Break-Even Monitor Active", "success")
+    last_pass = 0.0
     
     while True:
         try:
-            _, positions = get_wallet_data()
-            
-            for p in positions:
-                sym = p['symbol']
-                side = p['side']
-                entry = p['entry_price']
-                curr_price = p['mark_price']
-                curr_sl = p['stop_loss']
-                precision = PRICE_PRECISION.get(sym, 2)
-
-                # LOGICA LONG
-                if side == "Buy":
-                    # Se il prezzo è salito sopra il trigger (es. +0.8%)
-                    target_trigger = entry * (1 + BE_TRIGGER_PCT)
-                    new_sl = round(entry * (1 + BE_OFFSET_PCT), precision)
-                    
-                    if curr_price > target_trigger:
-                        # Controlla se abbiamo già spostato lo SL (per non spammare API)
-                        # Se current SL è 0 o è minore del new_sl, lo alziamo
-                        if curr_sl == 0 or curr_sl < new_sl: 
-                            add_log(sym, f"Moving SL to Break Even ()", "warning")
-                            try:
-                                session.set_trading_stop(category="linear", symbol=sym, stopLoss=str(new_sl), slTriggerBy="MarkPrice")
-                            except Exception as e:
-                                logger.error(f"Failed move SL {sym}: {e}")
-
-                # LOGICA SHORT
-                elif side == "Sell":
-                    # Se il prezzo è sceso sotto il trigger (es. -0.8%)
-                    target_trigger = entry * (1 - BE_TRIGGER_PCT)
-                    new_sl = round(entry * (1 - BE_OFFSET_PCT), precision)
-                    
-                    if curr_price < target_trigger:
-                        # Controlla se abbiamo già spostato lo SL
-                        # Se current SL è 0 o è maggiore del new_sl, lo abbassiamo
-                        if curr_sl == 0 or curr_sl > new_sl: 
-                            add_log(sym, f"Moving SL to Break Even ()", "warning")
-                            try:
-                                session.set_trading_stop(category="linear", symbol=sym, stopLoss=str(new_sl), slTriggerBy="MarkPrice")
-                            except Exception as e:
-                                logger.error(f"Failed move SL {sym}: {e}")
-            
-            time.sleep(FAST_CHECK_INTERVAL)
+            # ogni delta ticker sveglia il guardiano: le passate restano distanziate
+            wait = GUARDIAN_MIN_SPACING - (time.monotonic() - last_pass)
+            if wait > 0:
+                time.sleep(wait)
+            last_pass = time.monotonic()
+            guardian_wake.clear()
+            bal, positions = get_wallet_data()
+            equity_history.add(bal)
+            for move in guardian_pass(positions):
+                # lo stream position confermerà; intanto niente set_trading_stop ripetuti
+                if account is not None:
+                    account.patch_position(move["symbol"], stop_loss=move["stop_loss"])
+            guardian_wake.wait(FAST_CHECK_INTERVAL)
             
         except Exception as e:
-            logger.error(f"Guardian Error: {e}")
+            logger.error("Guardian Error: %s", e)
             time.sleep(60)
 
 def execute_decision(decision):
@@ -160,10 +282,15 @@ def execute_decision(decision):
     size_pct = float(decision.get("target_portion_of_balance", 0.0))
     reason = decision.get("reason", "")
 
-    logger.info(f"EXEC: {sym} -> {op.upper()} ({reason[:40]}...)")
+    logger.info("EXEC: %s -> %s (%s...)", sym, op.upper(), reason[:40])
     
     if op == "hold": return
 
+    spec = _spec(sym)
+    if spec and lev > spec.max_leverage:
+        add_log(sym, f"Leverage x{lev} above max x{spec.max_leverage:g}, capped", "warning")
+        lev = int(spec.max_leverage)
+
     bal, positions = get_wallet_data()
     my_pos = next((p for p in positions if p['symbol'] == sym), None)
 
@@ -185,15 +312,17 @@ def execute_decision(decision):
 
         # 1. Calcola Quantità
         amount = (bal * size_pct * lev * 0.95) / price
-        qty_prec = QTY_PRECISION.get(sym, 3)
-        qty = f"{amount:.{qty_prec}f}"
+        qty = format_qty(sym, amount)
+        invalid = spec.check(float(qty), price) if spec else None
+        if invalid:
+            add_log(sym, f"Open skipped: {invalid}", "error")
+            return
         
         # 2. Calcola SL e TP Dinamici
         adjusted_sl = DEFAULT_SL_PERCENT / (lev / 2) if lev > 2 else DEFAULT_SL_PERCENT
         adjusted_tp = DEFAULT_TP_PERCENT / (lev / 2) if lev > 2 else DEFAULT_TP_PERCENT
         
-        price_prec = PRICE_PRECISION.get(sym, 2)
-        sl_price, tp_price = calculate_sl_tp(price, direct, adjusted_sl, adjusted_tp, price_prec)
+        sl_price, tp_price = calculate_sl_tp(price, direct, adjusted_sl, adjusted_tp, sym)
         
         side = "Buy" if direct == "long" else "Sell"
         
@@ -211,6 +340,7 @@ def execute_decision(decision):
             )
             if r['retCode'] == 0: 
                 add_log(sym, f"OPENED {direct.upper()} with SL/TP", "success")
+                if account is not None: account.invalidate()
             else: 
                 add_log(sym, f"Open Rejected: {r['retMsg']}", "error")
         except Exception as e: 
@@ -221,8 +351,7 @@ def trading_cycle():
     while True:
         try:
             bal, pos = get_wallet_data()
-            equity_history.append({"time": datetime.now().strftime("%H:%M"), "equity": bal})
-            if len(equity_history) > 50: equity_history.pop(0)
+            equity_history.add(bal)
             
             payload = {
                 "symbols": TARGET_SYMBOLS,
@@ -230,7 +359,7 @@ def trading_cycle():
             }
             
             add_log("AI", "Calling Mitragliere Master Brain...", "info")
-            resp = requests.post(f"{MASTER_AI_URL}/execute_batch_strategy", json=payload, timeout=180)
+            resp = ai_http.request("POST", f"{MASTER_AI_URL}/execute_batch_strategy", json=payload, timeout=180)
             
             if resp.status_code == 200:
                 data = resp.json()
@@ -249,6 +378,7 @@ def trading_cycle():
 
 @app.on_event("startup")
 def startup():
+    start_account_stream()
     # Avviamo DUE thread: uno per l'AI (lento) e uno per il Guardiano (veloce)
     Thread(target=trading_cycle, daemon=True).start()
     Thread(target=monitor_positions, daemon=True).start()
@@ -258,7 +388,27 @@ def startup():
 def health(): return {"status": "active"}
 
 @app.get("/management_logs")
-def logs(): return management_logs
+def logs(since: int = None, limit: int = None):
+    """Senza cursore gli ultimi LOG_LATEST eventi (dal più recente); con since=<seq> solo i nuovi e il prossimo cursore"""
+    if since is None: return management_logs.latest(LOG_LATEST)
+    return management_logs.since(since, limit)
+
+@app.get("/management_logs/stream")
+async def logs_stream(request: Request, since: int = 0):
+    """Server-Sent Events: id = seq, quindi EventSource riprende da Last-Event-ID dopo una riconnessione"""
+    last_id = request.headers.get("last-event-id", "")
+    cursor = int(last_id) if last_id.isdigit() else since
+
+    async def events(cursor):
+        while not await request.is_disconnected():
+            batch = management_logs.since(cursor)
+            for e in batch["events"]:
+                yield f"id: {e['seq']}\ndata: {json.dumps(e)}\n\n"
+            cursor = batch["cursor"]
+            if not batch["events"] and not await management_logs.wait_async(cursor, SSE_KEEPALIVE):
+                yield ": keepalive\n\n"
+
+    return StreamingResponse(events(cursor), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 @app.get("/get_wallet_balance")
 def api_balance(): 
@@ -271,7 +421,12 @@ def api_positions():
     return p
 
 @app.get("/equity_history")
-def api_equity(): return equity_history
+def api_equity(resolution: int = None, since: float = None):
+    """Equity per bucket (default 1m; 900 = 15m, 14400 = 4h); since=<ts> solo i bucket da lì in poi"""
+    try:
+        return equity_history.series(resolution, since)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/close_position")
 def manual_close(req: CloseRequest):
@@ -1,8 +1,226 @@
+"""
+Logging condiviso da tutti i servizi.
+
+I logger di setup_logger() non scrivono direttamente su stdout: mettono il
+record in una coda e un unico thread (QueueListener) lo formatta e lo scrive.
+Una richiesta o l'event loop non aspettano mai uno stdout lento: se la coda
+è piena il record viene scartato e il numero di scarti è segnalato appena
+possibile.
+
+- LOG_FORMAT=text|json   testo come prima, oppure una riga JSON per record
+                         (ts, level, logger, msg, trace_id e campi `extra`)
+- LOG_SAMPLING           "logger=frazione,..." quota di record < WARNING tenuti
+- LOG_RATE_LIMITS        "logger=n,..." max record/s per messaggio (< WARNING);
+                         i soppressi sono contati sul record successivo
+- LOG_QUEUE_SIZE         capienza della coda
+
+Il messaggio è formattato nel thread del listener: nei percorsi caldi usare
+lo stile lazy `logger.info("OPEN %s size=%.2f", symbol, size)`, non f-string.
+"""
+import atexit
+import contextvars
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import random
 import sys
+import threading
+import time
+from typing import Dict, Optional, Tuple
 
 _LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+_LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# trace id della richiesta/symbol corrente (lo imposta shared.metrics)
+current_trace: contextvars.ContextVar = contextvars.ContextVar("trace_id", default=None)
+
+
+def _parse_map(raw: str) -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for item in raw.split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip():
+            out[name.strip()] = float(value)
+    return out
+
+
+_SAMPLING = _parse_map(os.getenv("LOG_SAMPLING", ""))
+_RATE_LIMITS = _parse_map(os.getenv("LOG_RATE_LIMITS", ""))
+
+
+# ----------------------------------------------------------------------
+# Formatter
+# ----------------------------------------------------------------------
+
+# attributi standard di LogRecord: tutto il resto arriva da extra=
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "trace_id", "suppressed"}
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__(fmt="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
+                         datefmt="%Y-%m-%d %H:%M:%S")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        return f"{line} (+{suppressed} soppressi)" if suppressed else line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            out["trace_id"] = trace_id
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            out["suppressed"] = suppressed
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key not in out:
+                out[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+# ----------------------------------------------------------------------
+# Campionamento e rate limit (girano nel thread chiamante: devono costare poco)
+# ----------------------------------------------------------------------
+
+class _SamplingFilter(logging.Filter):
+    """Tiene una frazione dei record sotto WARNING di un logger."""
+
+    def __init__(self, keep: float):
+        super().__init__()
+        self.keep = keep
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.keep
+
+
+class _RateLimitFilter(logging.Filter):
+    """
+    Token bucket per template di messaggio (record.msg, quindi con lo stile
+    lazy i messaggi dello stesso punto del codice condividono il bucket).
+    WARNING e oltre passano sempre.
+    """
+
+    def __init__(self, per_second: float):
+        super().__init__()
+        self.rate = per_second
+        self._buckets: Dict[Tuple[int, str], list] = {}  # key -> [tokens, last, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            b = self._buckets.get(key)
+            if b is None:
+                b = self._buckets[key] = [self.rate, now, 0]
+            b[0] = min(self.rate, b[0] + (now - b[1]) * self.rate)
+            b[1] = now
+            if b[0] < 1.0:
+                b[2] += 1
+                return False
+            b[0] -= 1.0
+            record.suppressed, b[2] = b[2], 0
+        return True
+
+
+# ----------------------------------------------------------------------
+# Coda e listener
+# ----------------------------------------------------------------------
+
+_IMMUTABLE = (str, int, float, bool, type(None))
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler che non blocca mai e rimanda la formattazione al listener.
+    Gli argomenti vengono formattati subito solo se mutabili (potrebbero
+    cambiare prima che il listener li legga).
+    """
+
+    def __init__(self, q: "queue.Queue"):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.trace_id = current_trace.get()
+        args = record.args
+        if args and not (isinstance(args, tuple) and all(isinstance(a, _IMMUTABLE) for a in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            # il traceback va reso ora: il frame può cambiare dopo
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _DropReporter(logging.Handler):
+    """Nel thread del listener: segnala i record scartati per coda piena."""
+
+    def __init__(self, target: logging.Handler, source: _NonBlockingQueueHandler):
+        super().__init__()
+        self.target = target
+        self.source = source
+
+    def emit(self, record: logging.LogRecord) -> None:
+        dropped, self.source.dropped = self.source.dropped, 0
+        if dropped:
+            self.target.handle(logging.makeLogRecord({
+                "name": "logging", "levelno": logging.WARNING, "levelname": "WARNING",
+                "msg": "Coda dei log piena: scartati %d record", "args": (dropped,),
+            }))
+        self.target.handle(record)
+
+
+_queue_handler: Optional[_NonBlockingQueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+def _shared_handler() -> _NonBlockingQueueHandler:
+    global _queue_handler, _listener
+    with _setup_lock:
+        if _queue_handler is None:
+            stream = logging.StreamHandler(sys.stdout)
+            stream.setFormatter(JsonFormatter() if _LOG_FORMAT == "json" else TextFormatter())
+            _queue_handler = _NonBlockingQueueHandler(queue.Queue(maxsize=_QUEUE_SIZE))
+            _listener = logging.handlers.QueueListener(_queue_handler.queue, _DropReporter(stream, _queue_handler))
+            _listener.start()
+            atexit.register(shutdown)
+        return _queue_handler
+
+
+def shutdown() -> None:
+    """Svuota la coda e ferma il listener (chiamato anche all'uscita del processo)."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
 
 
 def setup_logger(name: str) -> logging.Logger:
@@ -11,12 +229,10 @@ def setup_logger(name: str) -> logging.Logger:
         return logger
 
     logger.setLevel(_LOG_LEVEL)
-    handler = logging.StreamHandler(sys.stdout)
-    formatter = logging.Formatter(
-        fmt="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-    )
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    if name in _SAMPLING:
+        logger.addFilter(_SamplingFilter(_SAMPLING[name]))
+    if name in _RATE_LIMITS:
+        logger.addFilter(_RateLimitFilter(_RATE_LIMITS[name]))
+    logger.addHandler(_shared_handler())
     logger.propagate = False
     return logger
@@ -0,0 +1,289 @@
+"""
+Strumentazione condivisa: metriche in stile Prometheus e trace id.
+
+- istogrammi di latenza delle richieste HTTP di ogni servizio (install_metrics)
+- span per stadio (fetch, indicators, llm, execution, ...) con il trace id
+  corrente, propagato tra servizi nell'header x-trace-id
+- hit rate delle cache e conteggio delle chiamate alle API upstream
+
+Il registry è per processo: in monolith mode tutti gli agenti scrivono nello
+stesso e il label `service` li distingue. GET /metrics espone il formato
+testuale di Prometheus (text/plain; version=0.0.4).
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+
+from .logging_config import current_trace as _trace_id, setup_logger
+
+logger = setup_logger("metrics")
+
+TRACE_HEADER = "x-trace-id"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# secondi; coprono sia gli handler da ms che le chiamate LLM da decine di secondi
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+# ----------------------------------------------------------------------
+# Metriche
+# ----------------------------------------------------------------------
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_fmt(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [conteggi per bucket (non cumulativi) + overflow, somma]
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][idx] += 1
+            series[1][0] += value
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, (list(c), s[0])) for k, (c, s) in self._series.items())
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = f'le="{_fmt(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metrica {name} già registrata come {type(metric).__name__}")
+            return metric
+
+    def counter(self, name: str, doc: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get(Counter, name, doc, labelnames)
+
+    def histogram(self, name: str, doc: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, doc, labelnames, buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = [self._metrics[k] for k in sorted(self._metrics)]
+        lines: List[str] = []
+        for m in metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.histogram(
+    "http_request_duration_seconds", "Latenza delle richieste HTTP servite",
+    ("service", "method", "route", "status"),
+)
+STAGES = REGISTRY.histogram(
+    "stage_duration_seconds", "Durata degli stadi della pipeline",
+    ("service", "stage"),
+)
+CACHE = REGISTRY.counter(
+    "cache_requests_total", "Accessi alle cache per esito (hit/miss)",
+    ("cache", "result"),
+)
+UPSTREAM = REGISTRY.counter(
+    "upstream_requests_total", "Chiamate alle API upstream per esito",
+    ("upstream", "call", "status"),
+)
+UPSTREAM_LATENCY = REGISTRY.histogram(
+    "upstream_request_duration_seconds", "Latenza delle chiamate alle API upstream",
+    ("upstream", "call"),
+)
+
+
+# ----------------------------------------------------------------------
+# Trace id e span
+# ----------------------------------------------------------------------
+
+def new_trace() -> str:
+    """Apre un nuovo trace nel contesto corrente (task asyncio / thread)."""
+    tid = os.urandom(8).hex()
+    _trace_id.set(tid)
+    return tid
+
+
+def current_trace() -> Optional[str]:
+    return _trace_id.get()
+
+
+def trace_headers() -> Dict[str, str]:
+    """Header da aggiungere alle chiamate in uscita per propagare il trace."""
+    tid = _trace_id.get()
+    return {TRACE_HEADER: tid} if tid else {}
+
+
+@contextmanager
+def span(service: str, stage: str) -> Iterator[None]:
+    """Misura uno stadio; usabile anche attorno a codice async (`with`, non `async with`)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        STAGES.observe(elapsed, service, stage)
+        logger.debug("%s.%s %.1fms", service, stage, elapsed * 1000.0)
+
+
+def cache_access(cache: str, hit: bool) -> None:
+    CACHE.inc(cache, "hit" if hit else "miss")
+
+
+def observe_upstream(upstream: str, call: str, seconds: float, status: str) -> None:
+    UPSTREAM.inc(upstream, call, status)
+    UPSTREAM_LATENCY.observe(seconds, upstream, call)
+
+
+@contextmanager
+def upstream_call(upstream: str, call: str) -> Iterator[None]:
+    """Conta e cronometra una chiamata ad un'API esterna (SDK, REST)."""
+    t0 = time.perf_counter()
+    status = "error"
+    try:
+        yield
+        status = "ok"
+    finally:
+        observe_upstream(upstream, call, time.perf_counter() - t0, status)
+
+
+def cache_hit_rates() -> Dict[str, float]:
+    """cache -> hit rate, per /health o report."""
+    totals: Dict[str, List[float]] = {}
+    for (cache, result), n in list(CACHE._values.items()):
+        t = totals.setdefault(cache, [0.0, 0.0])
+        t[0 if result == "hit" else 1] += n
+    return {c: round(h / (h + m), 4) for c, (h, m) in totals.items() if h + m}
+
+
+# ----------------------------------------------------------------------
+# FastAPI
+# ----------------------------------------------------------------------
+
+class _MetricsMiddleware:
+    """
+    Middleware ASGI (senza BaseHTTPMiddleware, per non aggiungere un task
+    per richiesta): adotta il trace id in ingresso o ne apre uno nuovo,
+    lo rimanda nella risposta e registra la latenza per route.
+    """
+
+    def __init__(self, app, service: str):
+        self.app = app
+        self.service = service
+        self._header = TRACE_HEADER.encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        tid = next((v.decode("latin-1") for k, v in scope["headers"] if k == self._header), None)
+        token = _trace_id.set(tid or os.urandom(8).hex())
+        status = 500
+
+        async def send_with_trace(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((self._header, _trace_id.get().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            # template della route (es. /analyze), non il path grezzo: cardinalità limitata
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_REQUESTS.observe(time.perf_counter() - t0, self.service, scope["method"], route, str(status))
+            _trace_id.reset(token)
+
+
+def install_metrics(app: FastAPI, service: str) -> None:
+    """Middleware di latenza/trace e GET /metrics. Da chiamare dopo install_codecs."""
+    app.add_middleware(_MetricsMiddleware, service=service)
+
+    def metrics_endpoint() -> PlainTextResponse:
+        return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+    app.add_api_route("/metrics", metrics_endpoint, methods=["GET"],
+                      response_class=PlainTextResponse, include_in_schema=False)
@@ -0,0 +1,67 @@
+"""
+Stand-in locale dell'API /info di Hyperliquid, con candele sintetiche
+deterministiche, più un LLM stub in formato chat/completions.
+Usato dal load test al posto di Hyperliquid e del provider LLM:
+
+    STANDIN_SYMBOLS=SYM000,SYM001 uvicorn info_standin:app --port 9100
+
+Tipi /info supportati: candleSnapshot, allMids, meta, clearinghouseState.
+"""
+import os
+from typing import Any, Dict, List
+
+from fastapi import FastAPI, HTTPException
+
+from shared import clock, fake_llm
+from shared.config import SYMBOLS
+from shared.hyperliquid_data import RecordedCandles, interval_seconds
+
+_symbols = [s for s in os.getenv("STANDIN_SYMBOLS", ",".join(SYMBOLS)).split(",") if s]
+_history_days = float(os.getenv("STANDIN_HISTORY_DAYS", "25"))
+_now = clock.now()
+candles = RecordedCandles.synthetic(
+    _symbols, _now - _history_days * 86400, _now + 2 * 86400,
+    os.getenv("STANDIN_BASE_INTERVAL", "15m"), seed=int(os.getenv("STANDIN_SEED", "0")),
+)
+
+app = FastAPI(title="Hyperliquid Info stand-in")
+
+
+def _candle_snapshot(req: Dict[str, Any]) -> List[Dict[str, Any]]:
+    coin, interval = req["coin"], req.get("interval", "15m")
+    step = interval_seconds(interval)
+    limit = max(1, int((int(req["endTime"]) - int(req["startTime"])) / 1000 // step))
+    df = candles(coin, interval, limit)
+    if df is None:
+        return []
+    step_ms = step * 1000
+    return [
+        {"t": t, "T": t + step_ms - 1, "s": coin, "i": interval,
+         "o": str(o), "h": str(h), "l": str(l), "c": str(c), "v": str(v)}
+        for t, o, h, l, c, v in zip(df["timestamp"].tolist(), df["open"].tolist(), df["high"].tolist(),
+                                    df["low"].tolist(), df["close"].tolist(), df["volume"].tolist())
+    ]
+
+
+@app.post("/info")
+def info(body: Dict[str, Any]) -> Any:
+    kind = body.get("type")
+    if kind == "candleSnapshot":
+        return _candle_snapshot(body.get("req") or {})
+    if kind == "allMids":
+        return {s: str(candles.last_price(s)) for s in candles.symbols}
+    if kind == "meta":
+        return {"universe": [{"name": s, "szDecimals": 4, "maxLeverage": 50} for s in candles.symbols]}
+    if kind == "clearinghouseState":
+        return {"assetPositions": [], "marginSummary": {"accountValue": "0"}, "withdrawable": "0"}
+    raise HTTPException(status_code=400, detail=f"type non supportato: {kind}")
+
+
+@app.post("/v1/chat/completions")
+def chat_completions(body: Dict[str, Any]) -> Dict[str, Any]:
+    return fake_llm.chat_completion(body)
+
+
+@app.get("/health")
+def health() -> Dict[str, Any]:
+    return {"ok": True, "symbols": len(candles.symbols)}
@@ -0,0 +1,319 @@
+"""
+Load test: scala l'universo dei symbol e individua il primo collo di bottiglia.
+
+Avvia lo stand-in /info + LLM stub (info_standin.py) e gli agenti come
+processi uvicorn su 127.0.0.1 (stesso codice dei container, position_manager
+con EXCHANGE_BACKEND=fake). Per ogni step (es. 8, 50, 150, 300 symbol)
+l'orchestrator, in-process, esegue alcuni round in cui analizza TUTTI i
+symbol in parallelo. Per step registra:
+
+- durata del round e costo per symbol
+- latenza (p50/p95) ed errori per stage (endpoint chiamato dall'orchestrator)
+- CPU% e RSS di ogni processo (agenti, stand-in, orchestrator)
+
+Il primo step che sfora il budget di ciclo, supera il tasso d'errore o
+satura la CPU di un processo è il collo di bottiglia; il report indica lo
+stage con più tempo cumulato e il processo più carico.
+
+Uso: python loadtest.py --steps 8,50,150,300 --rounds 2 [--out report.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+HOST = "127.0.0.1"
+
+# servizio -> variabile d'ambiente con l'URL usato dall'orchestrator
+SERVICE_URL_ENV = {
+    "technical_analyzer": "TECHNICAL_ANALYZER_URL",
+    "fibonacci_agent": "FIBONACCI_AGENT_URL",
+    "gann_agent": "GANN_AGENT_URL",
+    "sentiment_agent": "SENTIMENT_AGENT_URL",
+    "forecaster_agent": "FORECASTER_AGENT_URL",
+    "master_ai_agent": "MASTER_AI_AGENT_URL",
+    "position_manager": "POSITION_MANAGER_URL",
+}
+
+_CLK_TCK = os.sysconf("SC_CLK_TCK")
+
+
+# ----------------------------------------------------------------------
+# Processi
+# ----------------------------------------------------------------------
+
+def _cpu_seconds(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / _CLK_TCK  # utime + stime
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+class Proc:
+    def __init__(self, name: str, cmd: List[str], cwd: str, env: Dict[str, str], port: int, log_dir: str):
+        self.name = name
+        self.port = port
+        self.url = f"http://{HOST}:{port}"
+        self.log_path = os.path.join(log_dir, f"{name}.log")
+        self.popen = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=open(self.log_path, "w"),
+                                      stderr=subprocess.STDOUT)
+        self.available = False
+
+    @property
+    def pid(self) -> int:
+        return self.popen.pid
+
+    def stop(self) -> None:
+        if self.popen.poll() is None:
+            self.popen.terminate()
+            try:
+                self.popen.wait(5)
+            except subprocess.TimeoutExpired:
+                self.popen.kill()
+
+
+def _uvicorn(app: str, port: int) -> List[str]:
+    return [sys.executable, "-m", "uvicorn", app, "--host", HOST, "--port", str(port),
+            "--log-level", "warning", "--no-access-log"]
+
+
+async def _wait_ready(procs: List[Proc], timeout: float) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=2) as client:
+        pending = list(procs)
+        while pending and time.monotonic() < deadline:
+            for p in list(pending):
+                if p.popen.poll() is not None:
+                    pending.remove(p)  # uscito: non disponibile (vedi log)
+                    continue
+                try:
+                    if (await client.get(f"{p.url}/health")).status_code == 200:
+                        p.available = True
+                        pending.remove(p)
+                except Exception:
+                    pass
+            await asyncio.sleep(0.3)
+
+
+def start_processes(workdir: str, symbols: List[str], base_port: int) -> Dict[str, Proc]:
+    from shared.inprocess import AGENT_DIRS
+
+    # layout come nei container: `shared` = root del progetto, agente come package
+    os.symlink(ROOT, os.path.join(workdir, "shared"))
+    for service, rel in AGENT_DIRS.items():
+        os.symlink(os.path.join(ROOT, rel), os.path.join(workdir, f"agent_{service}"))
+
+    standin_url = f"http://{HOST}:{base_port}"
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": workdir,
+        "SYMBOLS": ",".join(symbols),
+        "STANDIN_SYMBOLS": ",".join(symbols),
+        "HYPERLIQUID_INFO_URL": f"{standin_url}/info",
+        "LLM_BASE_URL": f"{standin_url}/v1/chat/completions",
+        "LLM_API_KEY": "loadtest",
+        "EXCHANGE_BACKEND": "fake",
+        "FEATURE_BUS_DIR": os.path.join(workdir, "feature_bus"),
+        "SENTIMENT_CACHE_FILE": os.path.join(workdir, "sentiment_cache.json"),
+        "LOG_LEVEL": "WARNING",
+    })
+    logs = os.path.join(workdir, "logs")
+    os.makedirs(logs, exist_ok=True)
+
+    procs = {"info_standin": Proc("info_standin", _uvicorn("info_standin:app", base_port), HERE, env,
+                                  base_port, logs)}
+    for i, service in enumerate(SERVICE_URL_ENV, start=1):
+        procs[service] = Proc(service, _uvicorn(f"agent_{service}.main:app", base_port + i), workdir, env,
+                              base_port + i, logs)
+    return procs
+
+
+# ----------------------------------------------------------------------
+# Step
+# ----------------------------------------------------------------------
+
+async def run_step(orch, procs: Dict[str, Proc], symbols: List[str], rounds: int) -> Dict[str, Any]:
+    from shared.models import Position
+
+    url_to_service = {p.url: name for name, p in procs.items()}
+    orch.http.reset_stats()
+    cpu0 = {name: _cpu_seconds(p.pid) for name, p in procs.items()}
+    cpu0["orchestrator"] = _cpu_seconds(os.getpid())
+    wall0 = time.perf_counter()
+
+    round_s: List[float] = []
+    for _ in range(rounds):
+        pos = await orch.http.get_json(f"{procs['position_manager'].url}/positions")
+        open_positions = [Position(**p) for p in pos.get("positions", [])]
+        t0 = time.perf_counter()
+        await asyncio.gather(*(orch.process_symbol(s, 1000.0, open_positions) for s in symbols))
+        round_s.append(time.perf_counter() - t0)
+        await orch.http.post_json(f"{procs['position_manager'].url}/tick_trailing")
+
+    wall = time.perf_counter() - wall0
+    processes: Dict[str, Dict[str, Any]] = {}
+    pids = {name: p.pid for name, p in procs.items() if p.available}
+    pids["orchestrator"] = os.getpid()
+    for name, pid in pids.items():
+        c1 = _cpu_seconds(pid)
+        c0 = cpu0.get(name)
+        processes[name] = {
+            "cpu_pct": round((c1 - c0) / wall * 100.0, 1) if c0 is not None and c1 is not None else None,
+            "rss_mb": round(_rss_mb(pid) or 0.0, 1),
+        }
+
+    stages: Dict[str, Dict[str, Any]] = {}
+    for endpoint, st in orch.http.latency_stats().items():
+        upstream = endpoint.split("/", 3)
+        service = url_to_service.get("/".join(upstream[:3]), endpoint)
+        name = f"{service}/{upstream[3] if len(upstream) > 3 else ''}"
+        st["error_rate"] = round(st["errors"] / st["calls"], 4) if st["calls"] else 0.0
+        st["total_s"] = round((st["avg_ms"] or 0.0) * st["calls"] / 1000.0, 2)
+        stages[name] = st
+
+    return {
+        "symbols": len(symbols),
+        "round_s": [round(r, 2) for r in round_s],
+        "per_symbol_ms": round(max(round_s) / len(symbols) * 1000.0, 1),
+        "stages": stages,
+        "processes": processes,
+    }
+
+
+def find_bottleneck(step: Dict[str, Any], budget_s: float, max_error_rate: float,
+                    cpu_saturation: float, unavailable: List[str]) -> Optional[Dict[str, Any]]:
+    reasons: List[str] = []
+    if max(step["round_s"]) > budget_s:
+        reasons.append(f"round {max(step['round_s']):.1f}s > budget {budget_s:.0f}s")
+    for name, st in step["stages"].items():
+        if name.split("/", 1)[0] in unavailable:
+            continue
+        if st["error_rate"] > max_error_rate:
+            reasons.append(f"errori {st['error_rate']:.1%} su {name}")
+    for name, p in step["processes"].items():
+        if p["cpu_pct"] is not None and p["cpu_pct"] >= cpu_saturation:
+            reasons.append(f"CPU {p['cpu_pct']:.0f}% su {name}")
+    if not reasons:
+        return None
+    stages = {k: v for k, v in step["stages"].items() if k.split("/", 1)[0] not in unavailable}
+    dominant = max(stages, key=lambda k: stages[k]["total_s"]) if stages else None
+    hottest = max(step["processes"], key=lambda k: step["processes"][k]["cpu_pct"] or 0.0)
+    return {"symbols": step["symbols"], "reasons": reasons, "dominant_stage": dominant,
+            "hottest_process": hottest}
+
+
+async def run(args, symbols_all: List[str], workdir: str) -> Dict[str, Any]:
+    from shared.decision_journal import DecisionJournal
+    import main as orch
+
+    orch.journal = DecisionJournal(os.path.join(workdir, "ai_decisions.db"))
+    procs = start_processes(workdir, symbols_all, args.base_port)
+    try:
+        await _wait_ready(list(procs.values()), args.startup_timeout)
+        unavailable = [name for name, p in procs.items() if not p.available]
+        if "info_standin" in unavailable or "position_manager" in unavailable:
+            raise RuntimeError(f"Servizi essenziali non partiti: {unavailable} (log in {workdir}/logs)")
+
+        steps: List[Dict[str, Any]] = []
+        bottleneck = None
+        for n in args.steps:
+            step = await run_step(orch, procs, symbols_all[:n], args.rounds)
+            steps.append(step)
+            print(f"  {n:>4} symbol: round max {max(step['round_s']):7.2f}s, "
+                  f"{step['per_symbol_ms']:7.1f} ms/symbol")
+            bottleneck = find_bottleneck(step, args.budget, args.max_error_rate, args.cpu_saturation,
+                                         unavailable)
+            if bottleneck is not None:
+                break
+    finally:
+        for p in procs.values():
+            p.stop()
+        orch.journal.close()
+        await orch.http.aclose()
+
+    last = steps[-1]
+    return {
+        "budget_s": args.budget,
+        "unavailable": unavailable,
+        "steps": steps,
+        "bottleneck": bottleneck,
+        # stima lineare dal costo per symbol dell'ultimo step
+        "estimated_max_symbols": int(args.budget * 1000.0 / last["per_symbol_ms"]) if last["per_symbol_ms"] else None,
+        "workdir": workdir,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--steps", default="8,50,150,300", help="dimensioni dell'universo da provare")
+    ap.add_argument("--rounds", type=int, default=2, help="round per step")
+    ap.add_argument("--budget", type=float, help="budget di un round in secondi (default HOT_INTERVAL_SECONDS)")
+    ap.add_argument("--max-error-rate", type=float, default=0.01)
+    ap.add_argument("--cpu-saturation", type=float, default=90.0, help="CPU%% oltre cui un processo è saturo")
+    ap.add_argument("--base-port", type=int, default=9100)
+    ap.add_argument("--startup-timeout", type=float, default=60.0)
+    ap.add_argument("--workdir")
+    ap.add_argument("--out")
+    args = ap.parse_args()
+    args.steps = sorted(int(s) for s in args.steps.split(","))
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="loadtest_")
+    symbols_all = [f"SYM{i:03d}" for i in range(max(args.steps))]
+    os.environ.update({
+        "SYMBOLS": ",".join(symbols_all),
+        "FEATURE_BUS_DIR": os.path.join(workdir, "feature_bus"),
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+    })
+    for i, (service, var) in enumerate(SERVICE_URL_ENV.items(), start=1):
+        os.environ[var] = f"http://{HOST}:{args.base_port + i}"
+
+    from shared.config import HOT_INTERVAL_SECONDS
+
+    args.budget = args.budget or float(HOT_INTERVAL_SECONDS)
+    print(f"Load test {args.steps} symbol, {args.rounds} round/step, budget {args.budget:.0f}s (workdir {workdir})")
+    report = asyncio.run(run(args, symbols_all, workdir))
+
+    if report["unavailable"]:
+        print(f"  non disponibili (esclusi dai criteri): {', '.join(report['unavailable'])}")
+    b = report["bottleneck"]
+    if b is None:
+        print(f"Nessun collo di bottiglia fino a {args.steps[-1]} symbol; "
+              f"stima ~{report['estimated_max_symbols']} symbol nel budget")
+    else:
+        print(f"Primo collo di bottiglia a {b['symbols']} symbol: {'; '.join(b['reasons'])}")
+        print(f"  stage dominante: {b['dominant_stage']}  processo più carico: {b['hottest_process']}")
+    last = report["steps"][-1]
+    for name, st in sorted(last["stages"].items(), key=lambda kv: -kv[1]["total_s"]):
+        print(f"  {name:<36} calls={st['calls']:<5} err={st['error_rate']:<7} "
+              f"p50={st['p50_ms']}ms p95={st['p95_ms']}ms tot={st['total_s']}s")
+    for name, p in last["processes"].items():
+        print(f"  {name:<20} cpu={p['cpu_pct']}%  rss={p['rss_mb']}MB")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,126 +1,187 @@
 from fastapi import FastAPI
-import asyncio, os, time, json
+import asyncio, time
 from typing import Dict, Any, List, Optional
-import httpx
 
-from shared.config import SYMBOLS, MAX_POSITIONS, ANALYSIS_INTERVAL_SECONDS
+from shared.config import (
+    SYMBOLS, MAX_POSITIONS, ANALYSIS_INTERVAL_SECONDS,
+    HOT_INTERVAL_SECONDS, IDLE_INTERVAL_SECONDS, ATR_HOT_PCT, ATR_IDLE_PCT,
+    AGENT_CALLS_PER_MINUTE, AGENT_CALLS_PER_SYMBOL, SCHEDULER_TICK_SECONDS, RUN_MODE,
+    ORCHESTRATOR_SHARDING, NODE_ID, CLUSTER_DB, SHARD_LEASE_TTL_SECONDS, SHARD_HEARTBEAT_SECONDS,
+    FEATURE_BUS_CONTEXT, FEATURE_BUS_MAX_AGE_SECONDS,
+    TECHNICAL_ANALYZER_URL, FIBONACCI_AGENT_URL, GANN_AGENT_URL, SENTIMENT_AGENT_URL,
+    FORECASTER_AGENT_URL, MASTER_AI_AGENT_URL, POSITION_MANAGER_URL, BULK_EXECUTION,
+)
 from shared.models import AIDecisionRecord, Position, ServiceStatus, AIDecision
 from shared.logging_config import setup_logger
-
-DATA_FILE = "/data/ai_decisions.json"
+from shared.scheduler import SymbolScheduler
+from shared.sharding import ShardCoordinator
+from shared.decision_journal import DecisionJournal
+from shared.http_client import ServiceClient
+from shared.inprocess import InProcessClient
+from shared import clock
+from shared import feature_bus
+from shared import metrics
+from shared import profiling
+
+LEGACY_DATA_FILE = "/data/ai_decisions.json"
+JOURNAL_FILE = "/data/ai_decisions.db"
 
 app = FastAPI(title="Orchestrator")
+metrics.install_metrics(app, "orchestrator")
+profiling.install_profiling(app, "orchestrator")
 logger = setup_logger("orchestrator")
 
+scheduler = SymbolScheduler(
+    SYMBOLS,
+    base_interval=ANALYSIS_INTERVAL_SECONDS,
+    hot_interval=HOT_INTERVAL_SECONDS,
+    idle_interval=IDLE_INTERVAL_SECONDS,
+    atr_hot_pct=ATR_HOT_PCT,
+    atr_idle_pct=ATR_IDLE_PCT,
+    calls_per_minute=AGENT_CALLS_PER_MINUTE,
+    calls_per_symbol=AGENT_CALLS_PER_SYMBOL,
+)
+
+journal: Optional[DecisionJournal] = None
+coordinator: Optional[ShardCoordinator] = None
+shard_task: Optional["asyncio.Task[None]"] = None
+# In monolith mode gli agenti sono importati e chiamati in-process (stessi URL)
+http = InProcessClient() if RUN_MODE == "monolith" else ServiceClient(timeout=40)
+
 
 @app.get("/health", response_model=ServiceStatus)
 def health() -> ServiceStatus:
-    return ServiceStatus(ok=True, details={"service": "orchestrator"})
-
-
-async def _safe_post(client: httpx.AsyncClient, url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
-    for attempt in range(3):
-        try:
-            r = await client.post(url, json=payload)
-            if r.status_code == 200:
-                return r.json()
-            logger.warning(f"{url} -> status {r.status_code}: {r.text[:200]}")
-        except Exception as e:
-            logger.error(f"Error calling {url}: {e}")
-        await asyncio.sleep(1 + attempt)
-    return {"ok": False, "error": f"Failed after retries: {url}"}
-
-
-async def _safe_get(client: httpx.AsyncClient, url: str) -> Dict[str, Any]:
-    for attempt in range(3):
-        try:
-            r = await client.get(url)
-            if r.status_code == 200:
-                return r.json()
-            logger.warning(f"{url} -> status {r.status_code}: {r.text[:200]}")
-        except Exception as e:
-            logger.error(f"Error calling {url}: {e}")
-        await asyncio.sleep(1 + attempt)
-    return {"ok": False, "error": f"Failed after retries: {url}"}
-
-
-def _load_decisions() -> List[Dict[str, Any]]:
-    if not os.path.exists(DATA_FILE):
-        return []
-    try:
-        with open(DATA_FILE, "r") as f:
-            return json.load(f)
-    except Exception:
-        return []
+    return ServiceStatus(ok=True, details={
+        "service": "orchestrator",
+        "run_mode": RUN_MODE,
+        "node_id": NODE_ID if coordinator is not None else None,
+        "symbols": len(scheduler.symbols),
+    })
 
 
-def _save_decision(record: AIDecisionRecord) -> None:
-    history = _load_decisions()
-    history.append(record.dict())
-    history = history[-500:]
-    os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
-    with open(DATA_FILE, "w") as f:
-        json.dump(history, f, ensure_ascii=False, indent=2)
+@app.get("/schedule")
+def schedule() -> Dict[str, Any]:
+    return scheduler.snapshot()
 
 
-async def _apply_decision(client: httpx.AsyncClient, symbol: str, decision: Dict[str, Any],
-                          equity: float, open_positions: List[Position]) -> None:
+@app.get("/http_stats")
+def http_stats() -> Dict[str, Any]:
+    return http.latency_stats()
+
+
+async def _plan_order(symbol: str, decision: Dict[str, Any], equity: float, open_positions: List[Position],
+                      decision_ts: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """
+    Controlli (side, equity, MAX_POSITIONS) e ordine da eseguire, o None.
+    decision_ts (epoch s, wall clock) viaggia con l'ordine per il log di esecuzione del position manager.
+    """
     d = AIDecision(**decision)
 
     cur_total = len(open_positions)
 
     if d.action == "OPEN":
-        if cur_total >= MAX_POSITIONS:
-            logger.info(f"Max positions {MAX_POSITIONS} reached, skip OPEN for {symbol}")
-            return
         if d.side not in {"long", "short"}:
-            logger.info(f"No valid side for OPEN {symbol}")
-            return
+            logger.info("No valid side for OPEN %s", symbol)
+            return None
         if equity <= 0:
-            logger.info(f"No equity, skipping OPEN {symbol}")
-            return
+            logger.info("No equity, skipping OPEN %s", symbol)
+            return None
+        if coordinator is not None:
+            # MAX_POSITIONS globale tra tutti i nodi
+            open_symbols = {p.symbol for p in open_positions}
+            refused = await asyncio.to_thread(coordinator.reserve_position, symbol, MAX_POSITIONS, open_symbols)
+            if refused:
+                logger.info("Skip OPEN for %s: %s", symbol, refused)
+                return None
+        elif cur_total >= MAX_POSITIONS:
+            logger.info("Max positions %d reached, skip OPEN for %s", MAX_POSITIONS, symbol)
+            return None
 
         size_usd = equity * d.size_pct_balance / 100.0
-        logger.info(f"OPEN {symbol} {d.side} size={size_usd:.2f} usd ({d.size_pct_balance}%)")
-        await client.post(
-            "http://position_manager:8000/open_position",
-            json={
-                "symbol": symbol,
-                "side": d.side,
-                "size_usd": size_usd,
-                "max_risk_pct": 2.0,
-            },
-        )
+        logger.info("OPEN %s %s size=%.2f usd (%s%%)", symbol, d.side, size_usd, d.size_pct_balance)
+        return {"symbol": symbol, "action": "open", "side": d.side, "size_usd": size_usd, "max_risk_pct": 2.0,
+                "decision_ts": decision_ts}
 
     elif d.action == "CLOSE":
-        logger.info(f"CLOSE {symbol}")
-        await client.post(
-            "http://position_manager:8000/close_position",
-            json={"symbol": symbol},
-        )
+        logger.info("CLOSE %s", symbol)
+        return {"symbol": symbol, "action": "close", "decision_ts": decision_ts}
     else:
-        logger.info(f"HOLD {symbol}")
-
+        logger.info("HOLD %s", symbol)
+        return None
 
-async def process_symbol(client: httpx.AsyncClient, symbol: str, equity: float,
-                         open_positions: List[Position]) -> Optional[AIDecisionRecord]:
-    logger.info(f"Processing {symbol}")
 
-    tech = await _safe_post(client, "http://technical_analyzer:8000/analyze",
-                            {"symbol": symbol})
-    fib = await _safe_post(client, "http://fibonacci_agent:8000/analyze",
-                           {"symbol": symbol})
-    gann = await _safe_post(client, "http://gann_agent:8000/analyze",
-                            {"symbol": symbol})
-    sent = await _safe_post(client, "http://sentiment_agent:8000/analyze",
-                            {"symbol": symbol})
-    fcst = await _safe_post(client, "http://forecaster_agent:8000/forecast",
-                            {"symbol": symbol})
+async def _order_done(order: Dict[str, Any], res: Dict[str, Any]) -> None:
+    """Esito di un ordine: rilascia la prenotazione del cluster se serve."""
+    symbol, action = order["symbol"], order["action"]
+    if not res.get("ok"):
+        logger.warning("%s %s failed: %s", action.upper(), symbol, res)
+        if action == "open" and coordinator is not None:
+            await asyncio.to_thread(coordinator.release_position, symbol)
+    elif action == "close" and coordinator is not None:
+        await asyncio.to_thread(coordinator.release_position, symbol)
+
+
+async def _apply_decision(symbol: str, decision: Dict[str, Any], equity: float, open_positions: List[Position],
+                          decision_ts: Optional[float] = None) -> None:
+    order = await _plan_order(symbol, decision, equity, open_positions, decision_ts)
+    if order is None:
+        return
+    if order["action"] == "open":
+        res = await http.post_json(
+            f"{POSITION_MANAGER_URL}/open_position",
+            {k: order[k] for k in ("symbol", "side", "size_usd", "max_risk_pct", "decision_ts")},
+            idempotent=False,
+        )
+    else:
+        res = await http.post_json(
+            f"{POSITION_MANAGER_URL}/close_position",
+            {"symbol": symbol, "decision_ts": order["decision_ts"]},
+        )
+    await _order_done(order, res)
+
+
+async def _execute_bulk(orders: List[Dict[str, Any]]) -> None:
+    """Tutti gli OPEN/CLOSE del ciclo in una richiesta (una sola azione firmata sull'exchange)."""
+    logger.info("Bulk execute %d orders: %s", len(orders),
+                ", ".join(f"{o['action'].upper()} {o['symbol']}" for o in orders))
+    with metrics.span("orchestrator", "execution"):
+        res = await http.post_json(f"{POSITION_MANAGER_URL}/bulk_execute", {"orders": orders}, idempotent=False)
+    results = res.get("results") or [res] * len(orders)
+    for order, r in zip(orders, results):
+        await _order_done(order, r)
+
+
+async def process_symbol(symbol: str, equity: float, open_positions: List[Position],
+                         orders: Optional[List[Dict[str, Any]]] = None) -> Optional[AIDecisionRecord]:
+    """
+    Analisi e decisione per un symbol. Con `orders` l'ordine risultante viene
+    accodato lì (esecuzione bulk a fine ciclo) invece di essere eseguito subito.
+    """
+    # un trace per symbol: l'id viaggia verso gli agenti nell'header x-trace-id
+    trace_id = metrics.new_trace()
+    logger.info("Processing %s (trace %s)", symbol, trace_id)
+    with metrics.span("orchestrator", "process_symbol"):
+        return await _process_symbol(symbol, equity, open_positions, orders)
+
+
+async def _process_symbol(symbol: str, equity: float, open_positions: List[Position],
+                          orders: Optional[List[Dict[str, Any]]] = None) -> Optional[AIDecisionRecord]:
+    with metrics.span("orchestrator", "analysis"):
+        tech = await http.post_json(f"{TECHNICAL_ANALYZER_URL}/analyze", {"symbol": symbol})
+        fib = await http.post_json(f"{FIBONACCI_AGENT_URL}/analyze", {"symbol": symbol})
+        gann = await http.post_json(f"{GANN_AGENT_URL}/analyze", {"symbol": symbol})
+        sent = await http.post_json(f"{SENTIMENT_AGENT_URL}/analyze", {"symbol": symbol})
+        fcst = await http.post_json(f"{FORECASTER_AGENT_URL}/forecast", {"symbol": symbol})
 
     if not tech.get("ok"):
-        logger.warning(f"Skipping {symbol}: tech not ok")
+        logger.warning("Skipping %s: tech not ok", symbol)
+        # il master non viene chiamato: la sua chiamata torna nel budget
+        scheduler.refund(1)
         return None
 
+    ind = tech.get("indicators", {})
+    scheduler.update_volatility(symbol, ind.get("atr"), ind.get("pivot"))
+
     ctx = {
         "symbol": symbol,
         "technical": tech,
@@ -133,42 +194,148 @@ async def process_symbol(client: httpx.AsyncClient, symbol: str, equity: float,
         "max_positions": MAX_POSITIONS,
     }
 
-    decision_resp = await _safe_post(client, "http://master_ai_agent:8000/decide", ctx)
+    body = ctx
+    if FEATURE_BUS_CONTEXT:
+        # le sezioni ok sono appena state pubblicate sul bus: nel body restano solo
+        # i campi non numerici, i valori il master li rilegge dal bus
+        body = dict(ctx)
+        for key in feature_bus.SCHEMAS:
+            if isinstance(ctx.get(key), dict) and ctx[key].get("ok"):
+                body[key] = feature_bus.strip_section(key, ctx[key])
+
+    with metrics.span("orchestrator", "llm"):
+        decision_resp = await http.post_json(f"{MASTER_AI_AGENT_URL}/decide", body)
+    # wall clock, non clock.now(): serve a misurare la latenza reale fino al fill
+    decision_ts = time.time()
     if not decision_resp.get("ok"):
-        logger.warning(f"Decision not ok for {symbol}: {decision_resp}")
+        logger.warning("Decision not ok for %s: %s", symbol, decision_resp)
         return None
 
     decision = decision_resp["decision"]
     record = AIDecisionRecord(
-        ts=int(time.time()),
+        ts=int(clock.now()),
         symbol=symbol,
         context=ctx,
         decision=AIDecision(**decision),
     )
-    _save_decision(record)
-
-    await _apply_decision(client, symbol, decision, equity, open_positions)
+    journal.append(record.dict())
+
+    if orders is not None:
+        order = await _plan_order(symbol, decision, equity, open_positions, decision_ts)
+        if order is not None:
+            orders.append(order)
+        return record
+    with metrics.span("orchestrator", "execution"):
+        await _apply_decision(symbol, decision, equity, open_positions, decision_ts)
     return record
 
 
-async def main_loop():
+def _refresh_volatility() -> None:
+    """ATR dal feature bus per tutti i symbol, anche quelli non ancora analizzati da questo nodo."""
+    try:
+        snap = feature_bus.reader("technical").snapshot()
+    except Exception as e:
+        logger.warning("Feature bus non leggibile: %s", e)
+        return
+    now = clock.now()
+    for symbol in scheduler.symbols:
+        rec = snap.get(symbol)
+        if rec is not None and now - rec["ts"] <= FEATURE_BUS_MAX_AGE_SECONDS:
+            scheduler.update_volatility(symbol, rec["atr"], rec["pivot"])
+
+
+async def _refresh_shard() -> None:
+    """Heartbeat, rinnovo dei lease e ricalcolo dei symbol di competenza di questo nodo."""
+    try:
+        await asyncio.to_thread(coordinator.heartbeat)
+        owned = await asyncio.to_thread(coordinator.owned_symbols, SYMBOLS)
+    except Exception as e:
+        # senza coordinamento meglio non processare nulla che rischiare doppioni
+        logger.error("Shard coordination failed on %s: %s", NODE_ID, e)
+        owned = []
+    if set(owned) != set(scheduler.symbols):
+        logger.info("Shard %s: %d/%d symbols -> %s", NODE_ID, len(owned), len(SYMBOLS), ", ".join(owned))
+        scheduler.set_symbols(owned)
+
+
+async def shard_loop():
+    """
+    Heartbeat a cadenza fissa, in un task separato dal loop di analisi: un
+    run_cycle più lungo del lease non deve far passare i symbol a un altro nodo.
+    """
     while True:
-        equity = 1000.0  # TODO: sostituire con equity reale (DB/Hyperliquid)
-
-        async with httpx.AsyncClient(timeout=40) as client:
-            pos_resp = await _safe_get(client, "http://position_manager:8000/positions")
-            raw_positions = pos_resp.get("positions", [])
-            open_positions = [Position(**p) for p in raw_positions]
+        await asyncio.sleep(SHARD_HEARTBEAT_SECONDS)
+        await _refresh_shard()
+
+
+async def run_cycle(equity: float = 1000.0) -> float:
+    """
+    Un giro del loop: posizioni, symbol in scadenza, analisi e trailing.
+    Ritorna i secondi da attendere prima del giro successivo.
+    Il tempo è quello di shared.clock (reale, o simulato nel replay).
+    Con lo sharding i symbol di scheduler li aggiorna shard_loop.
+    """
+    pos_resp = await http.get_json(f"{POSITION_MANAGER_URL}/positions")
+    raw_positions = pos_resp.get("positions", [])
+    open_positions = [Position(**p) for p in raw_positions]
+    scheduler.update_positions(p.symbol for p in open_positions)
+    _refresh_volatility()
+
+    now = clock.now()
+    due = scheduler.due(now)
+    for s in due:
+        scheduler.mark_run(s, now)
+    if due:
+        logger.info("Scheduled %d/%d symbols: %s", len(due), len(scheduler.symbols), ", ".join(due))
+
+    orders: Optional[List[Dict[str, Any]]] = [] if BULK_EXECUTION else None
+    tasks = [process_symbol(s, equity, open_positions, orders) for s in due]
+    await asyncio.gather(*tasks)
+    if orders:
+        await _execute_bulk(orders)
+
+    await http.post_json(f"{POSITION_MANAGER_URL}/tick_trailing")
+
+    now = clock.now()
+    sleep_s = max(scheduler.seconds_until_next(now), scheduler.seconds_until_budget())
+    return max(1.0, min(float(SCHEDULER_TICK_SECONDS), sleep_s))
 
-            tasks = [process_symbol(client, s, equity, open_positions) for s in SYMBOLS]
-            await asyncio.gather(*tasks)
 
-            await client.post("http://position_manager:8000/tick_trailing")
-
-        logger.info(f"Sleeping {ANALYSIS_INTERVAL_SECONDS} seconds")
-        await asyncio.sleep(ANALYSIS_INTERVAL_SECONDS)
+async def main_loop():
+    while True:
+        equity = 1000.0  # TODO: sostituire con equity reale (DB/Hyperliquid)
+        sleep_s = await run_cycle(equity)
+        logger.info("Sleeping %.0f seconds", sleep_s)
+        await asyncio.sleep(sleep_s)
 
 
 @app.on_event("startup")
 async def on_startup():
+    global journal, coordinator, shard_task
+    journal = DecisionJournal(JOURNAL_FILE)
+    if ORCHESTRATOR_SHARDING:
+        if SHARD_HEARTBEAT_SECONDS >= SHARD_LEASE_TTL_SECONDS:
+            raise ValueError(
+                f"SHARD_HEARTBEAT_SECONDS ({SHARD_HEARTBEAT_SECONDS}) deve essere minore "
+                f"di SHARD_LEASE_TTL_SECONDS ({SHARD_LEASE_TTL_SECONDS})"
+            )
+        coordinator = ShardCoordinator(CLUSTER_DB, NODE_ID, lease_ttl=SHARD_LEASE_TTL_SECONDS)
+        # i symbol arrivano dal primo heartbeat, non tutti subito
+        scheduler.set_symbols([])
+        await _refresh_shard()
+        shard_task = asyncio.create_task(shard_loop())
+    await asyncio.to_thread(journal.import_legacy_json, LEGACY_DATA_FILE)
     asyncio.create_task(main_loop())
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    if journal is not None:
+        await asyncio.to_thread(journal.flush)
+        journal.close()
+    if shard_task is not None:
+        # niente heartbeat dopo leave(): il nodo rientrerebbe nel ring
+        shard_task.cancel()
+    if coordinator is not None:
+        await asyncio.to_thread(coordinator.leave)
+    await http.aclose()
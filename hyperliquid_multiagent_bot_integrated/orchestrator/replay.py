@@ -0,0 +1,168 @@
+"""
+Replay accelerato e deterministico dell'intera pipeline.
+
+Candele registrate (o sintetiche) -> orchestrator -> agenti -> master AI
+(LLM mock) -> position_manager (exchange fake), in monolith mode e con un
+clock simulato: ogni giro di run_cycle() fa avanzare il tempo simulato di
+quanto il loop live dormirebbe, senza dormire davvero.
+
+Uso:
+    python replay.py --candles /data/candles --days 7
+    python replay.py --synthetic --symbols BTC,ETH,SOL --days 3 --out report.json
+
+I file registrati sono `<SYMBOL>_<base>.csv` con colonne
+timestamp(ms),open,high,low,close,volume.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+SYNTHETIC_START = 1704067200  # 2024-01-01 UTC
+
+
+async def mock_llm(system_prompt: str, user_prompt: str) -> str:
+    from shared import fake_llm
+
+    return fake_llm.complete(system_prompt, user_prompt)
+
+
+def setup_environment(workdir: str) -> None:
+    """Va chiamata prima di importare config/orchestrator: le env sono lette all'import."""
+    os.makedirs(workdir, exist_ok=True)
+    os.environ["RUN_MODE"] = "monolith"
+    os.environ["EXCHANGE_BACKEND"] = "fake"
+    os.environ["FEATURE_BUS_DIR"] = os.path.join(workdir, "feature_bus")
+    # il trailing lo guida il ciclo simulato (/tick_trailing), non il thread del position manager
+    os.environ["TRAILING_ENGINE_ENABLED"] = "false"
+    # i log INFO per ciclo falserebbero il throughput misurato
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+def build_pipeline(workdir: str, symbols: List[str], source: Any, start: float):
+    """
+    Installa sorgente candele e clock simulato, carica orchestrator e agenti
+    e sostituisce LLM, journal e cache su file con versioni locali a workdir.
+    Ritorna (orchestrator, sim_clock, fake_market).
+    """
+    from shared import clock, hyperliquid_data
+    from shared.decision_journal import DecisionJournal
+    from shared.inprocess import load_agent
+
+    hyperliquid_data.set_ohlcv_source(source)
+    sim = clock.use_sim_clock(start)
+
+    import main as orch
+
+    orch.journal = DecisionJournal(os.path.join(workdir, "ai_decisions.db"))
+    orch.scheduler.set_symbols(symbols)
+
+    load_agent("master_ai_agent")._llm_complete = mock_llm
+    load_agent("sentiment_agent").DATA_FILE = os.path.join(workdir, "sentiment_cache.json")
+    pm = load_agent("position_manager")
+    market = pm.trader.info.market
+    market.symbols = list(symbols)
+    return orch, sim, market
+
+
+async def replay(orch, sim, end: float, max_cycles: Optional[int] = None) -> Dict[str, Any]:
+    cycles = 0
+    sim_start = sim()
+    wall_start = time.perf_counter()
+    while sim() < end and (max_cycles is None or cycles < max_cycles):
+        sleep_s = await orch.run_cycle()
+        cycles += 1
+        sim.advance(sleep_s)
+    wall = time.perf_counter() - wall_start
+    return {
+        "cycles": cycles,
+        "wall_seconds": round(wall, 3),
+        "simulated_seconds": round(sim() - sim_start, 1),
+        "cycles_per_second": round(cycles / wall, 2) if wall else None,
+        "speedup": round((sim() - sim_start) / wall, 1) if wall else None,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--candles", help="cartella con <SYMBOL>_<base>.csv")
+    ap.add_argument("--synthetic", action="store_true", help="candele random walk deterministiche")
+    ap.add_argument("--symbols", help="lista separata da virgole (default: config.SYMBOLS / file trovati)")
+    ap.add_argument("--base-interval", default="15m")
+    ap.add_argument("--start", type=float, help="epoch s di inizio replay (default: inizio dati + warmup)")
+    ap.add_argument("--days", type=float, default=3.0, help="durata simulata")
+    ap.add_argument("--warmup-days", type=float, default=3.0, help="storia disponibile prima dell'inizio")
+    ap.add_argument("--max-cycles", type=int)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--workdir", help="cartella per journal, feature bus e cache (default: temporanea)")
+    ap.add_argument("--out", help="scrive il report JSON qui")
+    args = ap.parse_args()
+
+    if not args.candles and not args.synthetic:
+        ap.error("serve --candles DIR oppure --synthetic")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="replay_")
+    setup_environment(workdir)
+
+    from shared.config import SYMBOLS
+    from shared.hyperliquid_data import RecordedCandles
+
+    symbols = [s.strip().upper() for s in args.symbols.split(",")] if args.symbols else None
+    if args.synthetic:
+        symbols = symbols or list(SYMBOLS)
+        start = args.start or SYNTHETIC_START
+        source = RecordedCandles.synthetic(
+            symbols, start - args.warmup_days * 86400, start + args.days * 86400,
+            args.base_interval, seed=args.seed,
+        )
+    else:
+        source = RecordedCandles.from_dir(args.candles, args.base_interval)
+        symbols = [s for s in (symbols or source.symbols) if s in source.frames]
+        first, _ = source.time_range()
+        start = args.start or first + args.warmup_days * 86400
+    _, data_end = source.time_range()
+    end = min(data_end, start + args.days * 86400)
+
+    orch, sim, market = build_pipeline(workdir, symbols, source, start)
+    report = asyncio.run(replay(orch, sim, end, args.max_cycles))
+
+    from shared.inprocess import load_agent
+
+    orch.journal.flush()
+    actions = Counter(r["decision"]["action"] for r in orch.journal.recent(limit=1_000_000))
+    report.update({
+        "symbols": symbols,
+        "start": start,
+        "end": end,
+        "decisions": dict(actions),
+        "analyses_per_second": round(sum(actions.values()) / report["wall_seconds"], 2)
+        if report["wall_seconds"] else None,
+        "market": market.summary(),
+        "execution": load_agent("position_manager").trader.executions.summary(),
+        "latency": orch.http.latency_stats(),
+        "workdir": workdir,
+    })
+    orch.journal.close()
+
+    print(f"Replay {len(symbols)} symbol, {report['simulated_seconds'] / 3600:.1f}h simulate "
+          f"in {report['wall_seconds']:.1f}s (x{report['speedup']})")
+    print(f"  cicli: {report['cycles']}  ({report['cycles_per_second']}/s)  decisioni: {dict(actions)}")
+    print(f"  mercato: {report['market']}")
+    ex = report["execution"]
+    print(f"  esecuzione: ordini={ex['orders']} falliti={ex['failed']} "
+          f"decisione->fill p50={ex['latency_ms']['decision_to_fill'].get('p50')}ms "
+          f"slippage p50={ex['slippage_bps'].get('p50')}bps")
+    for endpoint, st in sorted(report["latency"].items()):
+        print(f"  {endpoint:<50} calls={st['calls']:<5} err={st['errors']:<4} "
+              f"p50={st['p50_ms']}ms p95={st['p95_ms']}ms")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
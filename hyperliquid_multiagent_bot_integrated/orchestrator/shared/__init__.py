@@ -1 +1,30 @@
 # shared package per orchestrator
+import importlib.util
+import os
+import sys
+from types import ModuleType
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# I moduli comuni a tutti i servizi (decision journal, ...) vivono nella root
+# del progetto: li rendiamo importabili anche qui come `shared.<modulo>`.
+# I moduli locali (config, models, ...) hanno la precedenza.
+__path__.append(ROOT)
+
+
+def common_module(name: str) -> ModuleType:
+    """
+    Versione della root di un modulo che qui ha una copia locale (config,
+    models, logging_config), importata come `shared._common_<name>`.
+    Le copie locali la usano come fallback per i nomi che non definiscono:
+    i moduli della root e gli agenti caricati in-process in monolith mode
+    importano `shared.config` & co. e devono trovarci anche le loro voci.
+    """
+    full_name = f"{__name__}._common_{name}"
+    module = sys.modules.get(full_name)
+    if module is None:
+        spec = importlib.util.spec_from_file_location(full_name, os.path.join(ROOT, f"{name}.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[full_name] = module
+        spec.loader.exec_module(module)
+    return module
@@ -1,16 +1,19 @@
 import os
-from typing import List
+from typing import Any, List
+
+from . import common_module
+
+# Il resto della configurazione (URL dei servizi, exchange, feature bus,
+# sharding, ...) è quello comune della root: i nomi non definiti qui
+# vengono letti da lì.
+_common = common_module("config")
 
 # Lista dei simboli che l'orchestrator deve processare
+# (override con SYMBOLS=BTC,ETH,... es. per i load test)
 SYMBOLS: List[str] = [
-    "BTC",
-    "ETH",
-    "SOL",
-    "DOGE",
-    "SUI",
-    "ADA",
-    "AAVE",
-    "AVAX",
+    s.strip().upper()
+    for s in os.getenv("SYMBOLS", "BTC,ETH,SOL,DOGE,SUI,ADA,AAVE,AVAX").split(",")
+    if s.strip()
 ]
 
 # Numero massimo di posizioni aperte contemporaneamente
@@ -24,3 +27,27 @@ ANALYSIS_INTERVAL_SECONDS: int = int(
 
 # Flag se Hyperliquid è in modalità testnet (lo useremo per gli altri servizi)
 HYPERLIQUID_TESTNET: bool = os.getenv("HYPERLIQUID_TESTNET", "true").lower() == "true"
+
+# --- SCHEDULER A PRIORITÀ ---
+# Cadenza per symbol con posizione aperta o volatilità alta (ATR% sopra soglia)
+HOT_INTERVAL_SECONDS: int = int(os.getenv("HOT_INTERVAL_SECONDS", "300"))
+# Cadenza per symbol fermi (ATR% sotto soglia minima, nessuna posizione)
+IDLE_INTERVAL_SECONDS: int = int(os.getenv("IDLE_INTERVAL_SECONDS", "2700"))
+# Soglie ATR/prezzo (0.01 = 1%) sul timeframe del technical_analyzer
+ATR_HOT_PCT: float = float(os.getenv("ATR_HOT_PCT", "0.01"))
+ATR_IDLE_PCT: float = float(os.getenv("ATR_IDLE_PCT", "0.003"))
+# Budget globale di chiamate agli agenti al minuto (5 analisi + master AI per symbol):
+# almeno AGENT_CALLS_PER_SYMBOL, altrimenti l'orchestrator non parte
+AGENT_CALLS_PER_MINUTE: int = int(os.getenv("AGENT_CALLS_PER_MINUTE", "60"))
+AGENT_CALLS_PER_SYMBOL: int = 6
+# Risveglio massimo del loop (anche per il tick del trailing)
+SCHEDULER_TICK_SECONDS: int = int(os.getenv("SCHEDULER_TICK_SECONDS", "60"))
+
+# Modalità di esecuzione:
+# - "microservices": agenti chiamati via HTTP (docker-compose)
+# - "monolith":      agenti importati e chiamati in-process, senza hop HTTP
+RUN_MODE: str = os.getenv("RUN_MODE", "microservices").lower()
+
+
+def __getattr__(name: str) -> Any:
+    return getattr(_common, name)
@@ -1,23 +1,16 @@
 import logging
-import sys
 
+from . import common_module
 
-def setup_logger(name: str) -> logging.Logger:
-    logger = logging.getLogger(name)
-
-    if logger.handlers:
-        return logger  # già configurato
+# Coda, formato (testo/JSON), sampling e rate limit sono quelli comuni della
+# root: così orchestrator e agenti caricati in-process condividono lo stesso
+# handler invece di averne due che scrivono su stdout.
+_common = common_module("logging_config")
 
-    logger.setLevel(logging.INFO)
 
-    handler = logging.StreamHandler(sys.stdout)
-    formatter = logging.Formatter(
-        "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
-    )
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+def setup_logger(name: str) -> logging.Logger:
+    return _common.setup_logger(name)
 
-    # Evita di propagare al root logger (meno doppioni)
-    logger.propagate = False
 
-    return logger
+def __getattr__(name: str):
+    return getattr(_common, name)
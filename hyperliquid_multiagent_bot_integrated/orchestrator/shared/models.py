@@ -1,6 +1,12 @@
 from typing import Any, Dict, List, Optional
 from pydantic import BaseModel
 
+from . import common_module
+
+# Gli altri modelli (snapshot degli agenti, TradeRecord, ...) sono quelli
+# comuni della root: i nomi non definiti qui vengono letti da lì.
+_common = common_module("models")
+
 
 class ServiceStatus(BaseModel):
     ok: bool
@@ -30,3 +36,7 @@ class AIDecisionRecord(BaseModel):
     symbol: str
     context: Dict[str, Any]
     decision: AIDecision
+
+
+def __getattr__(name: str) -> Any:
+    return getattr(_common, name)
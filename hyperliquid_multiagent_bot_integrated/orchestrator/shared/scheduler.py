@@ -0,0 +1,174 @@
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+
+class SymbolScheduler:
+    """
+    Scheduler a priorità per l'orchestrator.
+
+    Ogni symbol ha una cadenza che dipende dal suo "livello":
+    - hot:    posizione aperta oppure ATR% recente sopra soglia -> hot_interval
+    - normal: nessuna posizione, volatilità nella norma          -> base_interval
+    - idle:   nessuna posizione, ATR% sotto la soglia minima     -> idle_interval
+
+    Un budget globale (token bucket) limita le chiamate agli agenti al minuto:
+    ogni analisi di un symbol costa `calls_per_symbol` chiamate. Quando il
+    budget non basta, i symbol più caldi e più in ritardo passano per primi.
+    Le chiamate prenotate e non fatte (analisi interrotta prima del master)
+    tornano nel budget con refund().
+    """
+
+    def __init__(
+        self,
+        symbols: Iterable[str],
+        base_interval: float,
+        hot_interval: float,
+        idle_interval: float,
+        atr_hot_pct: float,
+        atr_idle_pct: float,
+        calls_per_minute: float,
+        calls_per_symbol: int,
+    ):
+        self.base_interval = float(base_interval)
+        self.hot_interval = float(hot_interval)
+        self.idle_interval = float(idle_interval)
+        self.atr_hot_pct = float(atr_hot_pct)
+        self.atr_idle_pct = float(atr_idle_pct)
+        self.calls_per_minute = float(calls_per_minute)
+        self.calls_per_symbol = int(calls_per_symbol)
+        if self.calls_per_symbol < 1 or self.calls_per_minute < self.calls_per_symbol:
+            # il bucket non arriverebbe mai al costo di un'analisi: nessun symbol verrebbe schedulato
+            raise ValueError(
+                f"calls_per_minute ({calls_per_minute}) deve essere >= calls_per_symbol ({calls_per_symbol}) e >= 1"
+            )
+
+        self.symbols: List[str] = []
+        self.last_run: Dict[str, float] = {}
+        self.atr_pct: Dict[str, float] = {}
+        self.open_symbols: set = set()
+        self.set_symbols(symbols)
+
+        # Token bucket: capienza = budget di un minuto
+        self._tokens = self.calls_per_minute
+        self._tokens_ts: Optional[float] = None
+
+    # ------------------------------------------------------------------
+    # Stato
+    # ------------------------------------------------------------------
+
+    def set_symbols(self, symbols: Iterable[str]) -> None:
+        """Aggiorna l'universo dei symbol (i nuovi partono subito)."""
+        self.symbols = list(dict.fromkeys(symbols))
+        keep = set(self.symbols)
+        self.last_run = {s: ts for s, ts in self.last_run.items() if s in keep}
+
+    def update_positions(self, symbols_with_positions: Iterable[str]) -> None:
+        self.open_symbols = set(symbols_with_positions)
+
+    def update_volatility(self, symbol: str, atr: float, price: float) -> None:
+        """Registra l'ATR come % del prezzo (0.01 = 1%)."""
+        if price and price > 0 and atr is not None and atr >= 0:
+            self.atr_pct[symbol] = float(atr) / float(price)
+
+    def mark_run(self, symbol: str, now: Optional[float] = None) -> None:
+        self.last_run[symbol] = time.time() if now is None else now
+
+    # ------------------------------------------------------------------
+    # Priorità
+    # ------------------------------------------------------------------
+
+    def tier(self, symbol: str) -> str:
+        if symbol in self.open_symbols:
+            return "hot"
+        atr_pct = self.atr_pct.get(symbol)
+        if atr_pct is None:
+            return "normal"
+        if atr_pct >= self.atr_hot_pct:
+            return "hot"
+        if atr_pct < self.atr_idle_pct:
+            return "idle"
+        return "normal"
+
+    def interval_for(self, symbol: str) -> float:
+        t = self.tier(symbol)
+        if t == "hot":
+            return self.hot_interval
+        if t == "idle":
+            return self.idle_interval
+        return self.base_interval
+
+    def _overdue(self, symbol: str, now: float) -> Optional[float]:
+        """Secondi di ritardo rispetto alla cadenza (None se mai eseguito)."""
+        last = self.last_run.get(symbol)
+        if last is None:
+            return None
+        return now - last - self.interval_for(symbol)
+
+    def _refill(self, now: float) -> None:
+        elapsed = 0.0 if self._tokens_ts is None else max(0.0, now - self._tokens_ts)
+        self._tokens_ts = now
+        self._tokens = min(
+            self.calls_per_minute,
+            self._tokens + elapsed * self.calls_per_minute / 60.0,
+        )
+
+    def due(self, now: Optional[float] = None) -> List[str]:
+        """
+        Ritorna i symbol da analizzare ora, in ordine di priorità,
+        consumando il budget di chiamate: hot > normal > idle, a parità
+        di livello prima i mai eseguiti e poi i più in ritardo.
+        """
+        now = time.time() if now is None else now
+        rank = {"hot": 0, "normal": 1, "idle": 2}
+
+        candidates = []
+        for s in self.symbols:
+            overdue = self._overdue(s, now)
+            if overdue is not None and overdue < 0:
+                continue
+            lateness = float("inf") if overdue is None else overdue
+            candidates.append((rank[self.tier(s)], -lateness, s))
+        candidates.sort()
+
+        self._refill(now)
+        selected: List[str] = []
+        for _, _, s in candidates:
+            if self._tokens < self.calls_per_symbol:
+                break
+            self._tokens -= self.calls_per_symbol
+            selected.append(s)
+        return selected
+
+    def refund(self, calls: int) -> None:
+        """Restituisce al budget chiamate prenotate da due() ma non fatte."""
+        self._tokens = min(self.calls_per_minute, self._tokens + calls)
+
+    def seconds_until_next(self, now: Optional[float] = None) -> float:
+        """Secondi al prossimo symbol in scadenza (0 se già in ritardo)."""
+        now = time.time() if now is None else now
+        waits = []
+        for s in self.symbols:
+            overdue = self._overdue(s, now)
+            waits.append(0.0 if overdue is None else max(0.0, -overdue))
+        return min(waits) if waits else self.base_interval
+
+    def seconds_until_budget(self) -> float:
+        """Secondi perché il budget copra l'analisi di un symbol."""
+        missing = self.calls_per_symbol - self._tokens
+        if missing <= 0:
+            return 0.0
+        return missing * 60.0 / self.calls_per_minute
+
+    def snapshot(self) -> Dict[str, Any]:
+        out: Dict[str, Dict[str, Any]] = {}
+        for s in self.symbols:
+            last = self.last_run.get(s)
+            out[s] = {
+                "tier": self.tier(s),
+                "interval": self.interval_for(s),
+                "atr_pct": self.atr_pct.get(s),
+                "last_run": last,
+                "next_run": None if last is None else last + self.interval_for(s),
+            }
+        budget = {"tokens": round(self._tokens, 2), "calls_per_minute": self.calls_per_minute}
+        return {"symbols": out, "budget": budget}
@@ -0,0 +1,204 @@
+import bisect
+import hashlib
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Optional, Set
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    node_id     TEXT PRIMARY KEY,
+    heartbeat   REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS symbol_leases (
+    symbol      TEXT PRIMARY KEY,
+    node_id     TEXT NOT NULL,
+    expires     REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS position_reservations (
+    symbol      TEXT PRIMARY KEY,
+    node_id     TEXT NOT NULL,
+    expires     REAL NOT NULL
+);
+"""
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing con nodi virtuali: aggiungere/togliere un nodo sposta ~1/N symbol."""
+
+    def __init__(self, nodes: Iterable[str], vnodes: int = 64):
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        for point, node in sorted((_hash(f"{n}#{i}"), n) for n in nodes for i in range(vnodes)):
+            self._points.append(point)
+            self._owners.append(node)
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self._points:
+            return None
+        idx = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[idx]
+
+
+class ShardCoordinator:
+    """
+    Coordinamento tra più istanze dell'orchestrator tramite SQLite sul
+    volume condiviso /data (stand-in locale di un servizio di lock).
+
+    - heartbeat: ogni nodo aggiorna la sua riga in `nodes`; è vivo finché
+      l'heartbeat è più recente di lease_ttl.
+    - ownership: i symbol sono divisi tra i nodi vivi con consistent hashing.
+      Per evitare doppie analisi durante i cambi di ring, un nodo processa
+      un symbol solo se ne detiene anche il lease in `symbol_leases`.
+      Se un nodo muore, allo scadere del TTL i suoi symbol passano agli altri.
+    - prenotazioni: MAX_POSITIONS è globale. Prima di un OPEN il nodo
+      prenota uno slot in `position_reservations` (transazione IMMEDIATE);
+      la prenotazione si libera quando la posizione compare in /positions
+      (la conta già open_symbols), se l'OPEN fallisce o al suo TTL.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        node_id: str,
+        lease_ttl: float = 180.0,
+        reservation_ttl: float = 300.0,
+        vnodes: int = 64,
+    ):
+        self.db_path = db_path
+        self.node_id = node_id
+        self.lease_ttl = float(lease_ttl)
+        self.reservation_ttl = float(reservation_ttl)
+        self.vnodes = vnodes
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(db_path, timeout=10.0)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _tx(self, immediate: bool = False) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=10.0, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------------
+    # Nodi e ownership
+    # ------------------------------------------------------------------
+
+    def heartbeat(self, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        with self._tx(immediate=True) as conn:
+            conn.execute(
+                "INSERT INTO nodes (node_id, heartbeat) VALUES (?, ?) "
+                "ON CONFLICT(node_id) DO UPDATE SET heartbeat = excluded.heartbeat",
+                (self.node_id, now),
+            )
+
+    def live_nodes(self, now: Optional[float] = None) -> List[str]:
+        now = time.time() if now is None else now
+        with self._tx() as conn:
+            rows = conn.execute(
+                "SELECT node_id FROM nodes WHERE heartbeat >= ? ORDER BY node_id",
+                (now - self.lease_ttl,),
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def owned_symbols(self, symbols: Iterable[str], now: Optional[float] = None) -> List[str]:
+        """
+        Symbol assegnati a questo nodo dal ring, limitati a quelli di cui
+        riesce ad acquisire/rinnovare il lease. Rilascia i lease persi.
+        """
+        now = time.time() if now is None else now
+        ring = HashRing(self.live_nodes(now) or [self.node_id], self.vnodes)
+        symbols = list(symbols)
+        mine = [s for s in symbols if ring.owner(s) == self.node_id]
+
+        owned: List[str] = []
+        with self._tx(immediate=True) as conn:
+            if mine:
+                marks = ",".join("?" * len(mine))
+                conn.execute(
+                    f"DELETE FROM symbol_leases WHERE node_id = ? AND symbol NOT IN ({marks})",
+                    [self.node_id] + mine,
+                )
+            else:
+                conn.execute("DELETE FROM symbol_leases WHERE node_id = ?", (self.node_id,))
+            for s in mine:
+                cur = conn.execute(
+                    "INSERT INTO symbol_leases (symbol, node_id, expires) VALUES (?, ?, ?) "
+                    "ON CONFLICT(symbol) DO UPDATE SET node_id = excluded.node_id, expires = excluded.expires "
+                    "WHERE symbol_leases.node_id = excluded.node_id OR symbol_leases.expires < ?",
+                    (s, self.node_id, now + self.lease_ttl, now),
+                )
+                if cur.rowcount:
+                    owned.append(s)
+        return owned
+
+    def leave(self) -> None:
+        """
+        Uscita pulita: gli altri nodi prendono subito i symbol di questo.
+        Le prenotazioni restano: un OPEN appena inviato può ancora essere
+        eseguito, e finché la posizione non compare in /positions lo slot
+        va contato (si liberano da sole al TTL).
+        """
+        with self._tx(immediate=True) as conn:
+            conn.execute("DELETE FROM nodes WHERE node_id = ?", (self.node_id,))
+            conn.execute("DELETE FROM symbol_leases WHERE node_id = ?", (self.node_id,))
+
+    # ------------------------------------------------------------------
+    # Prenotazione posizioni (MAX_POSITIONS globale)
+    # ------------------------------------------------------------------
+
+    def reserve_position(
+        self,
+        symbol: str,
+        max_positions: int,
+        open_symbols: Set[str],
+        now: Optional[float] = None,
+    ) -> Optional[str]:
+        """
+        Prenota lo slot per un OPEN su `symbol`. Ritorna None se prenotato,
+        altrimenti il motivo del rifiuto (da loggare).
+        `open_symbols`: posizioni aperte sull'exchange; le loro prenotazioni
+        sono consumate (la posizione ormai si conta da sé) e vengono tolte.
+        """
+        now = time.time() if now is None else now
+        open_symbols = set(open_symbols)
+        with self._tx(immediate=True) as conn:
+            conn.execute("DELETE FROM position_reservations WHERE expires < ?", (now,))
+            if open_symbols:
+                marks = ",".join("?" * len(open_symbols))
+                conn.execute(f"DELETE FROM position_reservations WHERE symbol IN ({marks})", list(open_symbols))
+            reserved = dict(conn.execute("SELECT symbol, node_id FROM position_reservations").fetchall())
+            if symbol in reserved:
+                # già prenotato (da noi o da un altro nodo): niente doppio OPEN
+                return f"OPEN di {symbol} già in corso su {reserved[symbol]}"
+            taken = open_symbols | set(reserved)
+            if symbol not in taken and len(taken) >= max_positions:
+                return (f"max posizioni {max_positions} raggiunto nel cluster "
+                        f"({len(open_symbols)} aperte, {len(reserved)} prenotate)")
+            conn.execute(
+                "INSERT INTO position_reservations (symbol, node_id, expires) VALUES (?, ?, ?)",
+                (symbol, self.node_id, now + self.reservation_ttl),
+            )
+        return None
+
+    def release_position(self, symbol: str) -> None:
+        with self._tx(immediate=True) as conn:
+            conn.execute("DELETE FROM position_reservations WHERE symbol = ?", (symbol,))
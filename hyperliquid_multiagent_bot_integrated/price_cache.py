@@ -0,0 +1,98 @@
+"""
+Snapshot dei prezzi (mid) di tutti i symbol con TTL breve.
+
+Una sola chiamata allMids aggiorna tutti i symbol insieme: il trailing
+di N posizioni costa 1 chiamata upstream per tick invece di N pull di
+candele 1m. Le richieste concorrenti durante un refresh aspettano quello
+in corso invece di farne altri (single flight).
+
+Se allMids fallisce non si riprova prima di `retry_seconds`: nel frattempo
+le letture servono lo snapshot precedente senza chiamate, ma solo finché
+non supera `max_age`; dopo, snapshot() è vuoto e get() None (il trailing
+salta il tick invece di muovere stop su prezzi vecchi).
+
+Il tempo è shared.clock, quindi nel replay il TTL segue il clock simulato.
+"""
+import threading
+from typing import Callable, Dict, Mapping, Optional
+
+from . import clock
+from . import metrics
+from .config import PRICE_CACHE_MAX_AGE_SECONDS, PRICE_CACHE_RETRY_SECONDS, PRICE_CACHE_TTL_SECONDS
+from .logging_config import setup_logger
+
+logger = setup_logger("price_cache")
+
+# () -> {"BTC": "43000.5", ...} come Info.all_mids()
+MidsSource = Callable[[], Mapping[str, str]]
+
+
+class PriceCache:
+    def __init__(self, fetch_mids: MidsSource, ttl: float = PRICE_CACHE_TTL_SECONDS,
+                 retry_seconds: float = PRICE_CACHE_RETRY_SECONDS, max_age: float = PRICE_CACHE_MAX_AGE_SECONDS):
+        self.fetch_mids = fetch_mids
+        self.ttl = float(ttl)
+        self.retry_seconds = float(retry_seconds)
+        self.max_age = float(max_age)
+        self._mids: Dict[str, float] = {}
+        self._ts: Optional[float] = None
+        self._retry_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _fresh(self, now: float) -> bool:
+        return self._ts is not None and now - self._ts < self.ttl
+
+    def _due(self, now: float) -> bool:
+        """Serve un refresh: snapshot scaduto e nessun errore recente da rispettare."""
+        return not self._fresh(now) and (self._retry_at is None or now >= self._retry_at)
+
+    def _usable(self, now: float) -> Dict[str, float]:
+        return self._mids if self._ts is not None and now - self._ts <= self.max_age else {}
+
+    def refresh(self) -> Dict[str, float]:
+        """Scarica un nuovo snapshot; in caso di errore tiene il precedente (entro max_age)."""
+        try:
+            with metrics.upstream_call("hyperliquid", "all_mids"):
+                raw = self.fetch_mids()
+        except Exception as e:
+            self._retry_at = clock.now() + self.retry_seconds
+            logger.warning("allMids non disponibile, riprovo tra %.0fs: %s", self.retry_seconds, e)
+            return self._usable(clock.now())
+        return self.put(raw)
+
+    def put(self, raw: Mapping[str, str]) -> Dict[str, float]:
+        """Sostituisce lo snapshot con mid ricevuti da fuori (es. stream allMids)."""
+        mids: Dict[str, float] = {}
+        for coin, px in (raw or {}).items():
+            try:
+                mids[coin.upper()] = float(px)
+            except (TypeError, ValueError):
+                continue
+        self._mids, self._ts, self._retry_at = mids, clock.now(), None
+        return mids
+
+    def snapshot(self) -> Dict[str, float]:
+        """Tutti i mid, aggiornati se lo snapshot è più vecchio del TTL; vuoto se oltre max_age."""
+        if self._fresh(clock.now()):
+            return self._mids
+        if self._due(clock.now()):
+            with self._lock:
+                # un altro thread può averlo appena aggiornato
+                if self._due(clock.now()):
+                    self.refresh()
+        return self._usable(clock.now())
+
+    def get(self, symbol: str) -> Optional[float]:
+        hit = self._fresh(clock.now())
+        metrics.cache_access("prices", hit)
+        px = (self._mids if hit else self.snapshot()).get(symbol.upper())
+        return px if px is not None and px > 0 else None
+
+    def age(self) -> Optional[float]:
+        return None if self._ts is None else clock.now() - self._ts
+
+    def invalidate(self) -> None:
+        """La prossima lettura rifà allMids; lo snapshot resta usabile se la chiamata fallisce."""
+        ts = self._ts
+        if ts is not None:
+            self._ts = min(ts, clock.now() - self.ttl)
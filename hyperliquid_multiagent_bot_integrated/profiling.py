@@ -0,0 +1,239 @@
+"""
+Profiling on-demand per i servizi FastAPI.
+
+Un profiler a campionamento (sys._current_frames() ogni PROFILE_INTERVAL_MS)
+che gira in un thread solo durante una cattura:
+- POST /debug/profile?seconds=10&mode=wall|cpu  cattura per N secondi
+- header `x-profile: wall|cpu` su una richiesta qualsiasi  profila solo quella
+- GET /debug/profiles  elenca le catture salvate
+
+Le catture sono salvate in PROFILES_DIR in formato "collapsed stacks"
+(una riga `frame;frame;...;frame conteggio`), leggibile da flamegraph.pl,
+speedscope e inferno. In modalità wall il peso è il numero di campioni,
+in modalità cpu i microsecondi di CPU consumati dal thread tra due campioni
+(i thread fermi su I/O o lock non compaiono).
+
+Con PROFILING_ENABLED=false (default) install_profiling() non registra né
+route né middleware: overhead nullo.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, HTTPException
+
+from .logging_config import setup_logger
+
+logger = setup_logger("profiling")
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILES_DIR = os.getenv("PROFILES_DIR", "/data/profiles")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "120"))
+
+PROFILE_HEADER = "x-profile"
+MODES = ("wall", "cpu")
+
+# una cattura alla volta per processo: due sampler si misurerebbero a vicenda
+_capture_lock = threading.Lock()
+
+
+# ----------------------------------------------------------------------
+# Sampler
+# ----------------------------------------------------------------------
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame, thread_name: str) -> str:
+    stack: List[str] = []
+    while frame is not None:
+        stack.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    stack.append(thread_name)
+    return ";".join(reversed(stack))
+
+
+class SamplingProfiler:
+    """Campiona gli stack di tutti i thread (tranne il proprio) fino a stop()."""
+
+    def __init__(self, mode: str = "wall", interval: float = PROFILE_INTERVAL_MS / 1000.0):
+        if mode not in MODES:
+            raise ValueError(f"Modalità non valida: {mode} (attese: {', '.join(MODES)})")
+        if mode == "cpu" and not hasattr(time, "pthread_getcpuclockid"):
+            raise ValueError("Modalità cpu non supportata su questa piattaforma")
+        self.mode = mode
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "SamplingProfiler":
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - (self.started_at or time.perf_counter())
+        return self.stacks
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        cpu_last: Dict[int, float] = {}
+        if self.mode == "cpu":
+            # baseline subito, così anche una richiesta breve produce campioni
+            for tid in sys._current_frames():
+                try:
+                    cpu_last[tid] = time.clock_gettime(time.pthread_getcpuclockid(tid))
+                except (OSError, OverflowError):
+                    pass
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == own:
+                    continue
+                weight = 1
+                if self.mode == "cpu":
+                    try:
+                        cpu = time.clock_gettime(time.pthread_getcpuclockid(tid))
+                    except (OSError, OverflowError):
+                        continue  # thread terminato nel frattempo
+                    prev = cpu_last.get(tid)
+                    cpu_last[tid] = cpu
+                    weight = int((cpu - prev) * 1e6) if prev is not None else 0
+                    if weight <= 0:
+                        continue
+                self.stacks[_collapse(frame, names.get(tid, f"thread-{tid}"))] += weight
+            self.samples += 1
+
+
+# ----------------------------------------------------------------------
+# Output
+# ----------------------------------------------------------------------
+
+def write_collapsed(stacks: Counter, path: str) -> str:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        for stack, weight in stacks.most_common():
+            f.write(f"{stack} {weight}\n")
+    os.replace(tmp, path)
+    return path
+
+
+def top_frames(stacks: Counter, limit: int = 15) -> List[Dict[str, object]]:
+    """Frame foglia più pesanti (self time), per una lettura rapida senza flamegraph."""
+    leaves: Counter = Counter()
+    total = sum(stacks.values()) or 1
+    for stack, weight in stacks.items():
+        leaves[stack.rsplit(";", 1)[-1]] += weight
+    return [{"frame": frame, "weight": w, "pct": round(100.0 * w / total, 1)}
+            for frame, w in leaves.most_common(limit)]
+
+
+def _profile_path(service: str, mode: str, tag: str = "") -> str:
+    # tempo reale anche durante il replay: è il nome di un file su disco
+    now = time.time()
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime(now)) + f".{int(now * 1000) % 1000:03d}"
+    suffix = f"-{tag}" if tag else ""
+    return os.path.join(PROFILES_DIR, f"{service}-{mode}-{stamp}-{os.getpid()}{suffix}.folded")
+
+
+def _summary(prof: SamplingProfiler, path: str) -> Dict[str, object]:
+    return {
+        "ok": True,
+        "file": path,
+        "mode": prof.mode,
+        "seconds": round(prof.duration, 3),
+        "samples": prof.samples,
+        "top": top_frames(prof.stacks),
+    }
+
+
+# ----------------------------------------------------------------------
+# FastAPI
+# ----------------------------------------------------------------------
+
+class _ProfileRequestMiddleware:
+    """Profila la singola richiesta se porta l'header x-profile (e nessun'altra cattura è in corso)."""
+
+    def __init__(self, app, service: str):
+        self.app = app
+        self.service = service
+        self._header = PROFILE_HEADER.encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        mode = next((v.decode("latin-1").lower() for k, v in scope["headers"] if k == self._header), None)
+        if mode not in MODES or not _capture_lock.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            prof = SamplingProfiler(mode).start()
+        except ValueError as e:
+            _capture_lock.release()
+            logger.warning("Profilo richiesta non disponibile: %s", e)
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            prof.stop()
+            _capture_lock.release()
+            tag = scope["path"].strip("/").replace("/", "_") or "root"
+            path = await asyncio.to_thread(write_collapsed, prof.stacks, _profile_path(self.service, mode, tag))
+            logger.info("Profilo richiesta %s (%s, %.0fms) -> %s", scope["path"], mode, prof.duration * 1000, path)
+
+
+def install_profiling(app: FastAPI, service: str) -> None:
+    """Route /debug/profile* e middleware per-richiesta, solo se PROFILING_ENABLED."""
+    if not PROFILING_ENABLED:
+        return
+
+    app.add_middleware(_ProfileRequestMiddleware, service=service)
+
+    async def capture(seconds: float = 10.0, mode: str = "wall") -> Dict[str, object]:
+        if not 0 < seconds <= PROFILE_MAX_SECONDS:
+            raise HTTPException(status_code=400, detail=f"seconds deve essere in (0, {PROFILE_MAX_SECONDS:.0f}]")
+        try:
+            prof = SamplingProfiler(mode)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if not _capture_lock.acquire(blocking=False):
+            raise HTTPException(status_code=409, detail="Cattura già in corso")
+        try:
+            prof.start()
+            await asyncio.sleep(seconds)
+        finally:
+            prof.stop()
+            _capture_lock.release()
+        path = await asyncio.to_thread(write_collapsed, prof.stacks, _profile_path(service, mode))
+        logger.info("Profilo %s di %.1fs (%s campioni) -> %s", mode, prof.duration, prof.samples, path)
+        return _summary(prof, path)
+
+    def list_profiles() -> Dict[str, object]:
+        if not os.path.isdir(PROFILES_DIR):
+            return {"ok": True, "profiles": []}
+        files = sorted((f for f in os.listdir(PROFILES_DIR) if f.endswith(".folded")), reverse=True)
+        return {"ok": True, "profiles": [
+            {"file": os.path.join(PROFILES_DIR, f), "bytes": os.path.getsize(os.path.join(PROFILES_DIR, f))}
+            for f in files
+        ]}
+
+    app.add_api_route("/debug/profile", capture, methods=["POST"], include_in_schema=False)
+    app.add_api_route("/debug/profiles", list_profiles, methods=["GET"], include_in_schema=False)
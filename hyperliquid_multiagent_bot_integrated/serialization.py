@@ -0,0 +1,147 @@
+import contextvars
+import json
+import os
+from typing import Any, Callable, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+
+try:
+    import msgpack
+except ImportError:  # dipendenza opzionale
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:  # dipendenza opzionale
+    orjson = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+
+# Codec usato dal ServiceClient per le chiamate tra servizi: "json" | "msgpack"
+INTERSERVICE_CODEC = os.getenv("INTERSERVICE_CODEC", "json").lower()
+
+_accept: contextvars.ContextVar = contextvars.ContextVar("codec_accept", default=JSON)
+_ORIGINAL_CT = "codec.content_type"
+
+
+# ----------------------------------------------------------------------
+# Codec
+# ----------------------------------------------------------------------
+
+def _is_msgpack(content_type: Optional[str]) -> bool:
+    return bool(content_type) and "msgpack" in content_type
+
+
+def _json_default(obj: Any) -> Any:
+    # pydantic v1/v2 e oggetti con .dict()
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    if hasattr(obj, "dict"):
+        return obj.dict()
+    raise TypeError(f"Type is not serializable: {type(obj).__name__}")
+
+
+def dumps(obj: Any, content_type: str = JSON) -> bytes:
+    """Serializza con il codec più veloce disponibile per il content type."""
+    if _is_msgpack(content_type) and msgpack is not None:
+        return msgpack.packb(obj, default=_json_default, use_bin_type=True)
+    if orjson is not None:
+        return orjson.dumps(obj, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+
+def loads(body: bytes, content_type: Optional[str] = JSON) -> Any:
+    if _is_msgpack(content_type):
+        if msgpack is None:
+            raise ValueError("Body msgpack ricevuto ma msgpack non è installato")
+        return msgpack.unpackb(body, raw=False)
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def request_codec(codec: Optional[str] = None) -> Tuple[str, str]:
+    """(content_type, accept) da usare in uscita per il codec richiesto."""
+    codec = (codec or INTERSERVICE_CODEC).lower()
+    if codec == "msgpack" and msgpack is not None:
+        return MSGPACK, f"{MSGPACK}, {JSON};q=0.5"
+    return JSON, JSON
+
+
+def _negotiate(accept: Optional[str]) -> str:
+    if accept and msgpack is not None and MSGPACK in accept:
+        return MSGPACK
+    return JSON
+
+
+# ----------------------------------------------------------------------
+# Lato server (FastAPI)
+# ----------------------------------------------------------------------
+
+class NegotiatedResponse(JSONResponse):
+    """
+    Response che serializza in msgpack se il client lo accetta (Accept),
+    altrimenti in JSON via orjson quando disponibile.
+    """
+
+    def render(self, content: Any) -> bytes:
+        ct = _accept.get()
+        self.media_type = ct
+        return dumps(content, ct)
+
+
+class _DecodedRequest(Request):
+    """Request il cui .json() decodifica il content type originale (es. msgpack)."""
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            body = await self.body()
+            self._json = loads(body, self.scope.get(_ORIGINAL_CT))
+        return self._json
+
+
+class NegotiatedRoute(APIRoute):
+    """
+    APIRoute che accetta body msgpack/JSON e imposta il formato della
+    risposta in base all'header Accept. I body msgpack vengono presentati
+    a FastAPI come JSON già decodificato, quindi la validazione resta uguale.
+    """
+
+    def get_route_handler(self) -> Callable:
+        original = super().get_route_handler()
+
+        async def handler(request: Request):
+            token = _accept.set(_negotiate(request.headers.get("accept")))
+            try:
+                content_type = request.headers.get("content-type")
+                if _is_msgpack(content_type):
+                    scope = dict(request.scope)
+                    scope[_ORIGINAL_CT] = content_type
+                    scope["headers"] = [
+                        (k, JSON.encode("latin-1") if k == b"content-type" else v)
+                        for k, v in request.scope["headers"]
+                    ]
+                    request = _DecodedRequest(scope, request.receive)
+                return await original(request)
+            finally:
+                _accept.reset(token)
+
+        return handler
+
+
+def install_codecs(app: FastAPI) -> None:
+    """Da chiamare subito dopo FastAPI(...), prima di dichiarare le route."""
+    app.router.route_class = NegotiatedRoute
+    app.router.default_response_class = NegotiatedResponse
+
+
+async def read_body(request: Request) -> Any:
+    """Decodifica il body secondo il suo content type (per endpoint senza modello)."""
+    body = await request.body()
+    if not body:
+        return None
+    ct = request.scope.get(_ORIGINAL_CT) or request.headers.get("content-type")
+    return loads(body, ct)
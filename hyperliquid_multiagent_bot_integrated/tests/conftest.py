@@ -0,0 +1,32 @@
+"""Root del progetto importabile come package `shared`, come nei container e nei benchmark."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from _bootstrap import register_shared  # noqa: E402
+
+register_shared()
+
+
+START = 1704067200
+
+
+@pytest.fixture
+def trader():
+    """HyperliquidTrader sincrono su FakeInfo/FakeExchange (BTC, ETH), stop nativi attivi."""
+    from shared import clock
+    from shared.fake_exchange import FakeExchange, FakeInfo, FakeMarket
+    from shared.hyperliquid_data import RecordedCandles
+    from shared.hyperliquid_trader import HyperliquidTrader
+
+    symbols = ["BTC", "ETH"]
+    clock.use_sim_clock(START)
+    candles = RecordedCandles.synthetic(symbols, START - 3 * 86400, START, "15m", seed=7)
+    market = FakeMarket(candles.last_price, symbols=symbols)
+    trader = HyperliquidTrader(info=FakeInfo(market, candles), exchange=FakeExchange(market), address="test")
+    trader.native_stops = True
+    return trader
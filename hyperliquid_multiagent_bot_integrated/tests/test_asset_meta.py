@@ -0,0 +1,30 @@
+"""AssetIndex: backoff dopo un caricamento dei metadati fallito."""
+import time
+
+from shared.asset_meta import AssetIndex, AssetSpec
+
+
+class Loader:
+    def __init__(self):
+        self.calls = 0
+        self.down = True
+
+    def __call__(self):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("meta timeout")
+        return {"BTC": AssetSpec("BTC", size_step=0.001)}
+
+
+def test_failed_first_load_backs_off():
+    loader = Loader()
+    index = AssetIndex(loader, refresh_seconds=3600, retry_seconds=0.2)
+
+    for _ in range(10):
+        assert index.get("BTC") is None
+    assert loader.calls == 1  # un solo meta() sincrono, non uno per get()
+
+    loader.down = False
+    time.sleep(0.25)
+    assert index.get("BTC") is not None
+    assert loader.calls == 2
@@ -0,0 +1,145 @@
+"""AsyncHyperliquidTrader contro FakeInfo/FakeExchange con latenza fissa (deterministici, niente rete)."""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from shared import clock, fake_exchange
+from shared.async_trader import AsyncHyperliquidTrader
+from shared.fake_exchange import FakeExchange, FakeInfo, FakeMarket
+from shared.hyperliquid_data import RecordedCandles
+from shared.hyperliquid_trader import HyperliquidTrader
+
+START = 1704067200
+LATENCY = 0.05
+SYMBOLS = ["BTC", "ETH", "SOL", "DOGE"]
+
+
+class InflightProbe:
+    """Sostituisce fake_exchange._io: stessa attesa, più il massimo di chiamate in volo."""
+
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, latency: float) -> None:
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+        try:
+            if latency > 0:
+                time.sleep(latency)
+        finally:
+            with self._lock:
+                self.current -= 1
+
+
+@pytest.fixture
+def candles():
+    clock.use_sim_clock(START)
+    return RecordedCandles.synthetic(SYMBOLS, START - 3 * 86400, START, "15m", seed=7)
+
+
+@pytest.fixture
+def market(candles):
+    return FakeMarket(candles.last_price, symbols=SYMBOLS)
+
+
+def make_trader(market, candles, latency=LATENCY, max_inflight=4):
+    trader = HyperliquidTrader(info=FakeInfo(market, candles, latency=latency),
+                               exchange=FakeExchange(market, latency=latency), address="test")
+    # metadati e mid già in cache: si misurano solo le chiamate d'ordine
+    trader.assets.get("BTC")
+    trader.prices.snapshot()
+    return AsyncHyperliquidTrader(trader, max_inflight=max_inflight)
+
+
+def test_open_overlaps_leverage_and_price(market, candles):
+    atrader = make_trader(market, candles)
+    atrader.trader.prices.invalidate()
+    t0 = time.perf_counter()
+    res = asyncio.run(atrader.open_position("BTC", "long", 100.0, 0.02))
+    elapsed = time.perf_counter() - t0
+    assert res["ok"]
+    # update_leverage + allMids insieme, poi market_open e lo stop: 3 round trip, non 4
+    assert elapsed < 3.7 * LATENCY
+
+
+def test_inflight_bounded_by_semaphore(market, candles, monkeypatch):
+    probe = InflightProbe()
+    monkeypatch.setattr(fake_exchange, "_io", probe)
+    atrader = make_trader(market, candles, max_inflight=2)
+
+    async def burst():
+        return await asyncio.gather(*(atrader.open_position(s, "long", 100.0, 0.02) for s in SYMBOLS))
+
+    t0 = time.perf_counter()
+    results = asyncio.run(burst())
+    elapsed = time.perf_counter() - t0
+    assert all(r["ok"] for r in results)
+    assert probe.peak == 2
+    # 4 aperture da 3 round trip ciascuna, 2 alla volta: circa metà del sequenziale
+    assert elapsed < 0.75 * len(SYMBOLS) * 3 * LATENCY
+
+
+def test_open_and_close_success(market, candles):
+    atrader = make_trader(market, candles)
+    trader = atrader.trader
+
+    res = asyncio.run(atrader.open_position("ETH", "short", 100.0, 0.02))
+    assert res["ok"]
+    assert market.positions["ETH"]["szi"] < 0
+    oid = trader.trailing_state["ETH"]["stop_oid"]
+    assert oid in market.triggers
+
+    res = asyncio.run(atrader.close_position("ETH"))
+    assert res["ok"]
+    assert "ETH" not in market.positions
+    assert "ETH" not in trader.trailing_state
+    assert oid not in market.triggers
+
+
+def test_open_failure_leaves_no_state(market, candles, monkeypatch):
+    atrader = make_trader(market, candles)
+
+    def reject(**kwargs):
+        raise RuntimeError("exchange down")
+
+    monkeypatch.setattr(atrader.trader.exchange, "market_open", reject)
+    res = asyncio.run(atrader.open_position("SOL", "long", 100.0, 0.02))
+    assert not res["ok"] and "exchange down" in res["error"]
+    assert "SOL" not in market.positions
+    assert "SOL" not in atrader.trader.trailing_state
+    assert not market.triggers
+
+
+@pytest.mark.parametrize("failure", ["raise", "rejected"])
+def test_close_failure_keeps_native_stop(market, candles, monkeypatch, failure):
+    atrader = make_trader(market, candles)
+    trader = atrader.trader
+    assert asyncio.run(atrader.open_position("BTC", "long", 100.0, 0.02))["ok"]
+    oid = trader.trailing_state["BTC"]["stop_oid"]
+
+    def fail(**kwargs):
+        if failure == "raise":
+            raise RuntimeError("timeout")
+        return {"status": "err", "response": "rejected"}
+
+    monkeypatch.setattr(trader.exchange, "market_close", fail)
+    res = asyncio.run(atrader.close_position("BTC"))
+    assert not res["ok"]
+    # posizione ancora aperta e ancora protetta dallo stesso stop
+    assert "BTC" in market.positions
+    assert trader.trailing_state["BTC"]["stop_oid"] == oid
+    assert oid in market.triggers
+
+
+def test_open_below_exchange_minimum_is_invalid_and_logged(market, candles):
+    atrader = make_trader(market, candles)
+    res = asyncio.run(atrader.open_position("ETH", "short", 1.0, 0.02))
+    assert res["ok"] is False and res["invalid"] is True
+    assert "ETH" not in market.positions
+    row = atrader.trader.executions.recent(1)[0]
+    assert (row["symbol"], row["action"], row["ok"], row["is_buy"]) == ("ETH", "open", False, False)
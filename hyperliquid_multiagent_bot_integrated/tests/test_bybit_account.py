@@ -0,0 +1,175 @@
+"""BybitAccountCache sugli stream (FakeBybitStream) e backoff del guardiano Bybit."""
+import warnings
+
+import pytest
+
+from shared.bybit_account import BybitAccountCache, FakeBybitStream
+
+with warnings.catch_warnings():
+    # il position manager Bybit usa ancora on_event, deprecato nelle FastAPI recenti
+    warnings.simplefilter("ignore", DeprecationWarning)
+    from shared import lcz_position_manager_bybit as bybit_pm
+
+
+class Loader:
+    """Snapshot REST finto: conta le chiamate, può fallire."""
+
+    def __init__(self, balance=1000.0, positions=()):
+        self.balance = balance
+        self.positions = list(positions)
+        self.calls = 0
+        self.fail = False
+
+    def __call__(self):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("retCode 10006")
+        return self.balance, [dict(p) for p in self.positions]
+
+
+def rest_position(symbol="BTCUSDT", side="Buy", size=0.01, entry=50000.0, mark=50000.0, stop_loss=0.0):
+    return {"symbol": symbol, "side": side, "size": size, "entry_price": entry, "leverage": 1.0,
+            "pnl": 0.0, "stop_loss": stop_loss, "take_profit": 0.0, "mark_price": mark}
+
+
+@pytest.fixture
+def streamed():
+    loader = Loader(positions=[rest_position()])
+    cache = BybitAccountCache(loader, rest_ttl=30, reconcile_seconds=300)
+    stream = FakeBybitStream()
+    cache.attach(stream, stream, ["BTCUSDT", "ETHUSDT"])
+    return cache, stream, loader
+
+
+def test_stream_updates_positions_and_wallet_without_rest(streamed):
+    cache, stream, loader = streamed
+    assert cache.snapshot()[0] == 1000.0 and loader.calls == 1
+
+    stream.push_wallet(1234.5)
+    stream.push_position("ETHUSDT", "Sell", 0.5, 3000.0, 2990.0, stop_loss=3060.0)
+    stream.push_position("BTCUSDT", "Buy", 0, 0, 0)  # size 0: posizione chiusa
+
+    balance, positions = cache.snapshot()
+    assert balance == 1234.5 and loader.calls == 1
+    [eth] = positions
+    assert (eth["symbol"], eth["side"], eth["size"], eth["entry_price"], eth["stop_loss"]) == (
+        "ETHUSDT", "Sell", 0.5, 3000.0, 3060.0,
+    )
+    assert cache.stream_events == 3
+
+
+def test_ticker_updates_mark_pnl_and_wakes_listeners(streamed):
+    cache, stream, _ = streamed
+    cache.snapshot()
+    woken = []
+    cache.add_listener(woken.append)
+
+    stream.push_ticker("BTCUSDT", 51000.0)
+    stream.push_ticker("ETHUSDT", 3000.0)  # nessuna posizione: solo il mark
+    stream._push("tickers.BTCUSDT", {"symbol": "BTCUSDT", "lastPrice": "51001"})  # delta senza mark
+
+    [btc] = cache.snapshot()[1]
+    assert btc["mark_price"] == 51000.0
+    assert btc["pnl"] == pytest.approx(0.01 * 1000.0)
+    assert cache.price("ETHUSDT") == 3000.0
+    assert woken == ["BTCUSDT"]
+
+    # la posizione aperta dopo il mark lo eredita
+    stream.push_position("ETHUSDT", "Sell", 1.0, 3100.0, 3100.0)
+    eth = next(p for p in cache.snapshot()[1] if p["symbol"] == "ETHUSDT")
+    assert eth["mark_price"] == 3000.0 and eth["pnl"] == pytest.approx(100.0)
+
+
+def test_reconcile_replaces_stream_state_but_keeps_marks(streamed, monkeypatch):
+    cache, stream, loader = streamed
+    cache.snapshot()
+    stream.push_position("ETHUSDT", "Sell", 0.5, 3000.0, 3000.0)  # messaggio che REST non conosce
+    stream.push_ticker("BTCUSDT", 52000.0)
+    cache.patch_position("BTCUSDT", stop_loss=50050.0)
+    assert cache.snapshot()[1][0]["stop_loss"] == 50050.0
+
+    # scaduto reconcile_seconds: lo snapshot REST è la verità, i mark dello stream restano
+    loader.balance = 990.0
+    cache._loaded_at -= 301
+    balance, positions = cache.snapshot()
+    assert loader.calls == 2 and balance == 990.0
+    assert [p["symbol"] for p in positions] == ["BTCUSDT"]
+    assert positions[0]["mark_price"] == 52000.0 and positions[0]["stop_loss"] == 0.0
+
+
+def test_failed_refresh_keeps_last_snapshot(streamed):
+    cache, _, loader = streamed
+    cache.snapshot()
+    loader.fail = True
+    cache.invalidate()
+    balance, positions = cache.snapshot()
+    assert loader.calls == 2
+    assert balance == 1000.0 and [p["symbol"] for p in positions] == ["BTCUSDT"]
+
+
+def test_without_stream_rest_ttl_applies():
+    loader = Loader(positions=[rest_position()])
+    cache = BybitAccountCache(loader, rest_ttl=30, reconcile_seconds=300)
+    cache.snapshot()
+    cache.snapshot()
+    assert loader.calls == 1
+    cache._loaded_at -= 31
+    cache.snapshot()
+    assert loader.calls == 2
+
+
+# ----------------------------------------------------------------------
+# Guardiano
+# ----------------------------------------------------------------------
+
+class Client:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    def set_trading_stop(self, **kwargs):
+        self.calls.append(kwargs["symbol"])
+        if self.fail:
+            raise RuntimeError("ErrCode: 10001")
+
+
+@pytest.fixture
+def guardian(monkeypatch):
+    monkeypatch.setattr(bybit_pm, "sl_retry", {})
+    return bybit_pm.guardian_pass
+
+
+def test_guardian_backs_off_per_symbol_after_failure(guardian):
+    # BTC oltre il trigger di pareggio, ETH no
+    positions = [rest_position(mark=50500.0), rest_position("ETHUSDT", mark=3000.0, entry=3000.0)]
+    client = Client(fail=True)
+
+    assert guardian(positions, client, now=0.0) == []
+    # ogni tick ticker risveglia il guardiano: niente nuovi tentativi finché dura il backoff
+    for now in (1.0, 10.0, bybit_pm.SL_RETRY_BASE - 1):
+        guardian(positions, client, now=now)
+    assert client.calls == ["BTCUSDT"]
+
+    guardian(positions, client, now=bybit_pm.SL_RETRY_BASE)
+    assert client.calls == ["BTCUSDT"] * 2
+    # secondo fallimento: attesa raddoppiata
+    assert bybit_pm.sl_retry["BTCUSDT"] == (3 * bybit_pm.SL_RETRY_BASE, 2 * bybit_pm.SL_RETRY_BASE)
+
+    client.fail = False
+    assert guardian(positions, client, now=3 * bybit_pm.SL_RETRY_BASE) == [
+        {"symbol": "BTCUSDT", "stop_loss": bybit_pm.round_price("BTCUSDT", 50000.0 * (1 + bybit_pm.BE_OFFSET_PCT))},
+    ]
+    assert "BTCUSDT" not in bybit_pm.sl_retry
+
+
+def test_guardian_backoff_is_capped_and_reset_when_position_closes(guardian):
+    positions = [rest_position(mark=50500.0)]
+    client = Client(fail=True)
+    now = 0.0
+    for _ in range(10):
+        guardian(positions, client, now=now)
+        now = bybit_pm.sl_retry["BTCUSDT"][0]
+    assert bybit_pm.sl_retry["BTCUSDT"][1] == bybit_pm.SL_RETRY_MAX
+
+    guardian([], client, now=now)
+    assert bybit_pm.sl_retry == {}
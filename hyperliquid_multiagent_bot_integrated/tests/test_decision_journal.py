@@ -0,0 +1,104 @@
+"""DecisionJournal: scrittura in coda, ordine delle letture, sola lettura e retention per id."""
+import pytest
+
+from shared.decision_journal import DecisionJournal
+
+
+@pytest.fixture
+def journal(tmp_path):
+    j = DecisionJournal(str(tmp_path / "journal.db"), compact_interval=3600)
+    yield j
+    j.close()
+
+
+def record(ts, symbol="BTC", action="HOLD", **context):
+    return {"ts": ts, "symbol": symbol, "decision": {"action": action}, "context": context}
+
+
+def test_append_flush_recent_newest_first(journal):
+    # stesso ts: a parità vince l'ordine di inserimento (id)
+    for ts, n in [(100, 0), (300, 1), (200, 2), (300, 3)]:
+        journal.append(record(ts, n=n))
+    assert journal.flush()
+
+    assert [r["context"]["n"] for r in journal.recent()] == [3, 1, 2, 0]
+    assert [r["context"]["n"] for r in journal.recent(limit=2)] == [3, 1]
+    assert [r["context"]["n"] for r in journal.recent(since=150, until=250)] == [2]
+    assert journal.count() == 4
+
+
+def test_recent_filters_by_symbol(journal):
+    journal.append(record(1, "BTC", "OPEN_LONG"))
+    journal.append(record(2, "ETH", "HOLD"))
+    journal.append(record(3, "BTC", "CLOSE"))
+    journal.flush()
+
+    assert [r["decision"]["action"] for r in journal.recent(symbol="BTC")] == ["CLOSE", "OPEN_LONG"]
+    assert journal.action_counts() == {"OPEN_LONG": 1, "HOLD": 1, "CLOSE": 1}
+
+
+def test_readonly_sees_writer_records_and_rejects_append(journal):
+    reader = DecisionJournal(journal.path, readonly=True)
+    journal.append(record(1, n=1))
+    journal.flush()
+
+    assert [r["context"]["n"] for r in reader.recent()] == [1]
+    with pytest.raises(RuntimeError):
+        reader.append(record(2))
+
+
+def test_readonly_before_schema_exists_reads_empty(tmp_path):
+    reader = DecisionJournal(str(tmp_path / "missing.db"), readonly=True)
+    assert reader.recent() == []
+    assert reader.count() == 0
+    assert not (tmp_path / "missing.db").exists()
+
+
+def test_retention_keeps_last_ids_not_latest_ts(tmp_path):
+    j = DecisionJournal(str(tmp_path / "journal.db"), retention=3, compact_interval=3600)
+    try:
+        # ts fuori ordine: la retention conta gli id (ordine di scrittura)
+        for ts, n in [(500, 0), (400, 1), (300, 2), (200, 3), (100, 4)]:
+            j.append(record(ts, n=n))
+        j.flush()
+
+        assert j.compact() == 2
+        assert sorted(r["context"]["n"] for r in j.recent()) == [2, 3, 4]
+        assert j.compact() == 0
+    finally:
+        j.close()
+
+
+def test_identical_context_components_share_one_blob(journal):
+    tech = {"rsi": 55.1, "trend": "up"}
+    journal.append(record(1, technical=tech, price=100.0))
+    journal.append(record(2, technical=dict(reversed(list(tech.items()))), price=101.0))
+    journal.append(record(3, technical=tech, fibonacci={"level": 0.618}, price=102.0))
+    journal.flush()
+
+    assert journal.storage_stats()["blobs"] == 2
+    raw = journal.recent()
+    assert len({r["context"]["technical"]["$ref"] for r in raw}) == 1
+    # i valori scalari restano inline
+    assert [r["context"]["price"] for r in raw] == [102.0, 101.0, 100.0]
+    full = journal.recent(include_context=True)
+    assert all(r["context"]["technical"] == tech for r in full)
+    assert full[0]["context"]["fibonacci"] == {"level": 0.618}
+
+
+def test_compact_deletes_only_unreferenced_blobs(tmp_path):
+    j = DecisionJournal(str(tmp_path / "journal.db"), retention=2, compact_interval=3600)
+    try:
+        a, b, c = {"v": "a"}, {"v": "b"}, {"v": "c"}
+        # id 1..4; restano 3 e 4: A è ancora referenziato da id 3 (last_id=3), B no (last_id=2)
+        for ts, ctx in [(1, a), (2, b), (3, a), (4, c)]:
+            j.append(record(ts, technical=ctx))
+        j.flush()
+        assert j.storage_stats()["blobs"] == 3
+
+        assert j.compact() == 2
+        assert j.storage_stats()["blobs"] == 2
+        j._blob_cache.clear()
+        assert [r["context"]["technical"] for r in j.recent(include_context=True)] == [c, a]
+    finally:
+        j.close()
@@ -0,0 +1,43 @@
+"""EventRing: letture con cursore e attesa async svegliata da append in altri thread."""
+import asyncio
+import threading
+
+from shared.event_ring import EventRing
+
+
+def test_since_reports_gap():
+    ring = EventRing(capacity=3)
+    for i in range(5):
+        ring.append(n=i)
+    batch = ring.since(1)
+    assert batch["gap"] == 1
+    assert [e["n"] for e in batch["events"]] == [2, 3, 4]
+    assert batch["cursor"] == 5
+
+
+def test_wait_async_woken_from_thread():
+    ring = EventRing()
+
+    async def run():
+        threading.Timer(0.05, ring.append, kwargs={"n": 1}).start()
+        woke = await ring.wait_async(0, timeout=5)
+        return woke, ring._waiters
+
+    woke, waiters = asyncio.run(run())
+    assert woke
+    assert not waiters
+
+
+def test_wait_async_timeout_and_cancel_leave_no_waiter():
+    ring = EventRing()
+
+    async def run():
+        assert not await ring.wait_async(0, timeout=0.01)
+        task = asyncio.ensure_future(ring.wait_async(0, timeout=60))
+        await asyncio.sleep(0.01)
+        assert len(ring._waiters) == 1
+        task.cancel()  # client SSE disconnesso
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert not ring._waiters
@@ -0,0 +1,44 @@
+"""ExecutionLog: finestra ricaricata dal file e retention delle righe."""
+import pytest
+
+from shared import clock
+from shared.execution_log import ExecutionLog
+
+START = 1704067200.0
+
+
+@pytest.fixture
+def sim():
+    return clock.use_sim_clock(START)
+
+
+def _record(log, px):
+    stamps = {"decision": 1.0, "received": 1.01, "sent": 1.02, "ack": 1.05, "fill": 1.05}
+    return log.record("BTC", "open", True, stamps, expected_px=100.0, fill_px=px)
+
+
+def test_window_reloaded_after_restart(sim, tmp_path):
+    path = str(tmp_path / "executions.db")
+    log = ExecutionLog(path, window=3)
+    for px in (100.1, 100.2, 100.3, 100.4):
+        _record(log, px)
+    before = log.summary()
+    log.close()
+
+    log = ExecutionLog(path, window=3)
+    assert [r["fill_px"] for r in log.recent()] == [100.2, 100.3, 100.4]
+    assert log.recent()[0]["is_buy"] is True and log.recent()[0]["ok"] is True
+    assert log.summary() == before
+
+
+def test_rows_past_retention_are_deleted(sim, tmp_path):
+    path = str(tmp_path / "executions.db")
+    log = ExecutionLog(path, retention_days=1)
+    _record(log, 100.1)
+    log.close()
+
+    sim.advance(2 * 86400)
+    log = ExecutionLog(path, retention_days=1)
+    assert log.recent() == []
+    _record(log, 100.2)
+    assert len(log.recent()) == 1
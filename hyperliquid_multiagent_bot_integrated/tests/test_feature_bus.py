@@ -0,0 +1,113 @@
+"""FeatureBus: writer concorrenti da più processi e context ridotto per il master."""
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from shared import clock, feature_bus
+from shared.feature_bus import FeatureBus
+
+WRITERS = 4
+ROUNDS = 3000
+
+
+def _writer(directory: str, worker: int) -> None:
+    bus = FeatureBus("technical", directory=directory, capacity=64)
+    for i in range(ROUNDS):
+        # un symbol condiviso da tutti e uno per writer: seq e claim degli slot in gara
+        bus.publish("BTC", {"rsi": float(i)}, ts=float(i))
+        bus.publish(f"W{worker}", {"rsi": float(i)}, ts=float(i))
+
+
+def test_publish_from_many_processes(tmp_path):
+    FeatureBus("technical", directory=str(tmp_path), capacity=64, create=True)
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_writer, args=(str(tmp_path), w)) for w in range(WRITERS)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(30)
+        assert p.exitcode == 0
+
+    snap = FeatureBus("technical", directory=str(tmp_path)).snapshot()
+    # ogni symbol in un solo slot e nessuna pubblicazione persa nel seq
+    assert sorted(snap) == ["BTC"] + [f"W{w}" for w in range(WRITERS)]
+    assert snap["BTC"]["seq"] == WRITERS * ROUNDS
+    assert all(snap[f"W{w}"]["seq"] == ROUNDS for w in range(WRITERS))
+
+
+def test_first_publish_from_many_threads_creates_bus_once(tmp_path, monkeypatch):
+    created = []
+
+    def slow_bus(agent, create):
+        # allarga la finestra tra il controllo del registry e la creazione del file
+        time.sleep(0.01)
+        created.append(agent)
+        return FeatureBus(agent, directory=str(tmp_path), create=create)
+
+    monkeypatch.setattr(feature_bus, "_publishers", {})
+    monkeypatch.setattr(feature_bus, "FeatureBus", slow_bus)
+    field = feature_bus.SCHEMAS["gann"][0]
+    start = threading.Barrier(WRITERS * 2)
+
+    def first_publish(i: int) -> None:
+        start.wait()
+        feature_bus.publish("gann", f"S{i}", {field: float(i)})
+
+    threads = [threading.Thread(target=first_publish, args=(i,)) for i in range(WRITERS * 2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+
+    # un solo file creato: nessun thread perde la gara sul .tmp e disattiva il bus per tutti
+    assert created == ["gann"]
+    assert feature_bus._publishers["gann"] is not None
+    assert len(FeatureBus("gann", directory=str(tmp_path)).snapshot()) == WRITERS * 2
+
+
+@pytest.fixture
+def bus_dir(tmp_path, monkeypatch):
+    clock.use_sim_clock(1704067200)
+    monkeypatch.setattr(feature_bus, "FEATURE_BUS_DIR", str(tmp_path))
+    monkeypatch.setattr(feature_bus, "_publishers", {})
+    monkeypatch.setattr(feature_bus, "_readers", {})
+    for agent in feature_bus.SCHEMAS:
+        FeatureBus(agent, directory=str(tmp_path), create=True)
+    monkeypatch.setattr(feature_bus, "reader", lambda agent: FeatureBus(agent, directory=str(tmp_path)))
+    return tmp_path
+
+
+RESPONSES = {
+    "technical": {"ok": True, "symbol": "ETH", "interval": "15m",
+                  "indicators": {"rsi": 55.0, "macd": 1.5, "macd_signal": 1.2, "atr": 30.0, "pivot": 2500.0}},
+    "fibonacci": {"ok": True, "symbol": "ETH", "levels": {
+        "level_0": 2600.0, "level_0236": 2570.0, "level_0382": 2550.0, "level_0500": 2530.0,
+        "level_0618": 2510.0, "level_0786": 2480.0, "level_1": 2450.0}},
+    "gann": {"ok": True, "symbol": "ETH", "last_price": 2520.0, "hint": "gann_placeholder"},
+    "sentiment": {"ok": True, "symbol": "ETH", "cached": False,
+                  "sentiment": {"score": 0.25, "label": "bullish", "sources": [{"name": "news"}]}},
+    "forecast": {"ok": True, "symbol": "ETH",
+                 "forecast": {"direction": "down", "start_price": 2520.0, "end_price": 2490.0}},
+}
+
+
+@pytest.mark.parametrize("agent", sorted(RESPONSES))
+def test_stripped_section_merges_back_to_http_response(bus_dir, agent):
+    resp = RESPONSES[agent]
+    payload = feature_bus._SECTION_KEYS[agent]
+    bus = FeatureBus(agent, directory=str(bus_dir))
+    features = dict(resp[payload] if payload else resp)
+    if agent == "forecast":  # come il forecaster: direzione numerica sul bus
+        features["direction"] = -1.0
+    bus.publish("ETH", features)
+
+    stripped = feature_bus.strip_section(agent, resp)
+    for field in feature_bus.SCHEMAS[agent]:
+        if not (agent == "forecast" and field == "direction"):
+            assert field not in (stripped.get(payload) or {} if payload else stripped)
+
+    merged = feature_bus.merge_section(agent, stripped, max_age=60)
+    assert merged["source"] == "feature_bus"
+    assert {k: merged[k] for k in resp} == resp
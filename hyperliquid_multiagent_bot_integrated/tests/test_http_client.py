@@ -0,0 +1,79 @@
+"""SyncServiceClient: retry sui 5xx, statistiche per endpoint e fetch delle candele da /info."""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from shared import hyperliquid_data
+from shared.http_client import SyncServiceClient
+
+
+@pytest.fixture
+def server():
+    """Server locale: risponde con gli status di `replies` in ordine, poi 200 con `body`."""
+    state = {"replies": [], "body": {"ok": True}, "requests": []}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            raw = self.rfile.read(int(self.headers.get("content-length") or 0))
+            state["requests"].append(json.loads(raw) if raw else None)
+            status = state["replies"].pop(0) if state["replies"] else 200
+            data = json.dumps(state["body"] if status == 200 else {"error": status}).encode()
+            self.send_response(status)
+            self.send_header("content-type", "application/json")
+            self.send_header("content-length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    state["url"] = f"http://127.0.0.1:{httpd.server_port}"
+    yield state
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(SyncServiceClient, "_backoff", staticmethod(lambda attempt: 0.0))
+
+
+def test_retries_transient_status_and_records_stats(server):
+    server["replies"] = [503, 502]
+    client = SyncServiceClient(codec="json", retries=3)
+    try:
+        assert client.post_json(f"{server['url']}/info", {"a": 1}) == {"ok": True}
+        stats = client.latency_stats()[f"{server['url']}/info"]
+    finally:
+        client.close()
+    assert len(server["requests"]) == 3
+    assert stats["calls"] == 3
+    assert stats["errors"] == 2
+    assert stats["retries"] == 2
+
+
+def test_non_idempotent_request_is_not_retried(server):
+    server["replies"] = [503]
+    client = SyncServiceClient(codec="json", retries=3)
+    try:
+        r = client.request("POST", f"{server['url']}/exec", json={}, idempotent=False)
+    finally:
+        client.close()
+    assert r.status_code == 503
+    assert len(server["requests"]) == 1
+
+
+def test_fetch_candle_snapshot_goes_through_client(server):
+    server["replies"] = [429]
+    server["body"] = [{"t": 1000 * i, "o": "1", "h": "2", "l": "0.5", "c": "1.5", "v": "10"} for i in range(3)]
+    df = hyperliquid_data.fetch_candle_snapshot(f"{server['url']}/info", "BTC", "15m", 3)
+    assert list(df.columns) == hyperliquid_data.OHLCV_COLUMNS
+    assert len(df) == 3
+    assert server["requests"][-1]["req"]["coin"] == "BTC"
+    assert len(server["requests"]) == 2
+    assert f"{server['url']}/info" in hyperliquid_data._http.latency_stats()
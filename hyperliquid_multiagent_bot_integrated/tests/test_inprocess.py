@@ -0,0 +1,147 @@
+"""InProcessClient: stessi parametri, risposte e hook di startup/shutdown degli agenti sotto uvicorn."""
+import asyncio
+import sys
+import textwrap
+
+import pytest
+
+from shared import inprocess
+from shared.inprocess import InProcessClient, load_agent
+
+# gli agenti usano ancora on_event, deprecato nelle FastAPI recenti
+pytestmark = pytest.mark.filterwarnings("ignore::DeprecationWarning")
+
+AGENT = """
+import asyncio
+from typing import List
+
+from fastapi import Depends, FastAPI, HTTPException, Request
+from pydantic import BaseModel
+
+app = FastAPI()
+events = []
+
+
+@app.on_event("startup")
+async def start():
+    await asyncio.sleep(0.01)
+    events.append("startup")
+
+
+@app.on_event("shutdown")
+def stop():
+    events.append("shutdown")
+
+
+@app.get("/ping")
+def ping():
+    return {"ok": True, "events": list(events)}
+
+
+class Order(BaseModel):
+    symbol: str
+    size: float = 1.0
+
+
+class Public(BaseModel):
+    symbol: str
+    tags: List[str] = []
+
+
+def page(limit: int = 10, offset: int = 0):
+    return {"limit": limit, "offset": offset}
+
+
+@app.get("/items")
+async def items(include_context: bool = False, p: dict = Depends(page)):
+    return {"include_context": include_context, **p}
+
+
+@app.post("/orders")
+def orders(order: Order, dry_run: bool = False):
+    return {"symbol": order.symbol, "size": order.size, "dry_run": dry_run}
+
+
+@app.post("/raw")
+async def raw(request: Request):
+    return {"body": await request.json(), "q": request.query_params.get("q")}
+
+
+@app.get("/public", response_model=Public)
+def public():
+    return {"symbol": "BTC", "tags": ["x"], "secret": "non deve uscire"}
+
+
+@app.get("/missing")
+def missing():
+    raise HTTPException(status_code=404, detail="non c'è")
+"""
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    agent_dir = tmp_path / "probe_agent"
+    agent_dir.mkdir()
+    (agent_dir / "__init__.py").write_text("")
+    (agent_dir / "main.py").write_text(textwrap.dedent(AGENT))
+    monkeypatch.setitem(inprocess.AGENT_DIRS, "probe_agent", str(agent_dir))
+    yield InProcessClient()
+    sys.modules.pop("agent_probe_agent.main", None)
+    sys.modules.pop("agent_probe_agent", None)
+
+
+def call(client, method, path, payload=None):
+    url = f"http://probe_agent:8000{path}"
+
+    async def run():
+        if method == "GET":
+            return await client.get_json(url)
+        return await client.post_json(url, payload)
+
+    return asyncio.run(run())
+
+
+def test_startup_runs_once_before_first_request(client):
+    async def run():
+        # richieste concorrenti alla prima chiamata: lo startup gira una volta sola, prima di tutte
+        first = await asyncio.gather(*(client.get_json("http://probe_agent:8000/ping") for _ in range(3)))
+        await client.aclose()
+        return first
+
+    results = asyncio.run(run())
+    assert all(r["events"] == ["startup"] for r in results)
+    assert load_agent("probe_agent").events == ["startup", "shutdown"]
+
+
+def test_query_params_and_dependencies_are_bound(client):
+    assert call(client, "GET", "/items") == {"include_context": False, "limit": 10, "offset": 0}
+    assert call(client, "GET", "/items?include_context=true&limit=3&offset=6") == {
+        "include_context": True, "limit": 3, "offset": 6,
+    }
+
+
+def test_invalid_query_param_is_422(client):
+    res = call(client, "GET", "/items?limit=tanti")
+    assert res["ok"] is False and res["status"] == 422
+
+
+def test_body_model_and_query_together(client):
+    assert call(client, "POST", "/orders?dry_run=1", {"symbol": "ETH", "size": 2}) == {
+        "symbol": "ETH", "size": 2.0, "dry_run": True,
+    }
+    res = call(client, "POST", "/orders", {"size": 2})
+    assert res["ok"] is False and res["status"] == 422
+
+
+def test_request_sees_body_and_query_string(client):
+    assert call(client, "POST", "/raw?q=x", {"a": 1}) == {"body": {"a": 1}, "q": "x"}
+
+
+def test_response_model_filters_like_http(client):
+    assert call(client, "GET", "/public") == {"symbol": "BTC", "tags": ["x"]}
+
+
+def test_http_errors_become_envelopes(client):
+    assert call(client, "GET", "/missing")["status"] == 404
+    # route che l'agente non ha
+    assert call(client, "GET", "/nope")["status"] == 404
@@ -0,0 +1,86 @@
+"""Endpoint del position manager sul trader con exchange fake."""
+import asyncio
+import sys
+
+import pytest
+
+from shared import config
+from shared.async_trader import AsyncHyperliquidTrader
+from shared.inprocess import load_agent
+
+# gli agenti usano ancora on_event, deprecato nelle FastAPI recenti
+pytestmark = pytest.mark.filterwarnings("ignore::DeprecationWarning")
+
+
+@pytest.fixture
+def pm(trader, monkeypatch):
+    # import con il backend fake (niente SDK né rete), poi il trader della fixture
+    monkeypatch.setattr(config, "EXCHANGE_BACKEND", "fake")
+    monkeypatch.setattr(config, "TRAILING_ENGINE_ENABLED", False)
+    module = load_agent("position_manager")
+    monkeypatch.setattr(module, "trader", trader)
+    monkeypatch.setattr(module, "atrader", AsyncHyperliquidTrader(trader))
+    yield module
+    sys.modules.pop("agent_position_manager.main", None)
+    sys.modules.pop("agent_position_manager", None)
+
+
+def bulk(pm, *orders):
+    req = pm.BulkExecuteRequest(orders=[pm.BulkOrder(**o) for o in orders])
+    return asyncio.run(pm.bulk_execute(req))
+
+
+def test_bulk_execute_mixed_open_close(pm, trader):
+    market = trader.exchange.market
+    assert bulk(pm, {"symbol": "btc", "action": "open", "side": "long", "size_usd": 100.0}).ok
+
+    res = bulk(pm, {"symbol": "BTC", "action": "close"},
+               {"symbol": "ETH", "action": "OPEN", "side": "Short", "size_usd": 100.0})
+    assert res.ok
+    assert [(r["symbol"], r["action"], r["ok"]) for r in res.results] == [
+        ("BTC", "close", True), ("ETH", "open", True),
+    ]
+    assert set(market.positions) == {"ETH"}
+
+
+def test_bulk_execute_reports_each_failure(pm, trader):
+    market = trader.exchange.market
+    bulk(pm, {"symbol": "BTC", "action": "open", "side": "long", "size_usd": 100.0})
+    market.depth["BTC"] = abs(market.positions["BTC"]["szi"]) / 2
+
+    res = bulk(pm, {"symbol": "BTC", "action": "close"},
+               {"symbol": "SOL", "action": "close"},
+               {"symbol": "ETH", "action": "open", "side": "long", "size_usd": 100.0})
+    assert not res.ok
+    assert [r["ok"] for r in res.results] == [False, False, True]
+    assert "parziale" in res.results[0]["error"]
+    assert "Nessuna posizione" in res.results[1]["error"]
+    # il residuo BTC resta protetto
+    assert trader.trailing_state["BTC"]["stop_oid"] in market.triggers
+
+
+def test_bulk_execute_rejects_open_without_size(pm):
+    with pytest.raises(pm.HTTPException) as exc:
+        bulk(pm, {"symbol": "BTC", "action": "open", "side": "long"})
+    assert exc.value.status_code == 400
+
+
+def open_position(pm, **fields):
+    return asyncio.run(pm.open_position(pm.OpenPositionRequest(**fields)))
+
+
+def test_open_position_below_minimum_is_400(pm, trader):
+    with pytest.raises(pm.HTTPException) as exc:
+        open_position(pm, symbol="BTC", side="long", size_usd=1.0)
+    assert exc.value.status_code == 400
+    assert "non valido" in exc.value.detail
+
+
+def test_open_position_exchange_failure_is_500(pm, trader, monkeypatch):
+    def down(**kwargs):
+        raise RuntimeError("exchange down")
+
+    monkeypatch.setattr(trader.exchange, "market_open", down)
+    with pytest.raises(pm.HTTPException) as exc:
+        open_position(pm, symbol="BTC", side="long", size_usd=100.0)
+    assert exc.value.status_code == 500
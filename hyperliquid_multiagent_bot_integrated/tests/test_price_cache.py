@@ -0,0 +1,57 @@
+"""PriceCache: TTL, backoff dopo un allMids fallito ed età massima dei mid."""
+import pytest
+
+from shared import clock
+from shared.price_cache import PriceCache
+
+
+class Mids:
+    def __init__(self):
+        self.calls = 0
+        self.down = False
+
+    def __call__(self):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("allMids timeout")
+        return {"BTC": "43000.5"}
+
+
+@pytest.fixture
+def sim():
+    return clock.use_sim_clock(1704067200)
+
+
+def test_failed_refresh_backs_off_then_expires(sim):
+    source = Mids()
+    cache = PriceCache(source, ttl=2, retry_seconds=5, max_age=30)
+    assert cache.get("BTC") == 43000.5
+
+    source.down = True
+    sim.advance(3)
+    assert cache.get("BTC") == 43000.5  # fallito: snapshot precedente
+    calls = source.calls
+    for _ in range(100):
+        assert cache.get("BTC") == 43000.5
+    assert source.calls == calls  # in backoff nessuna chiamata sincrona
+
+    sim.advance(5)
+    cache.get("BTC")
+    assert source.calls == calls + 1
+
+    sim.advance(30)
+    assert cache.get("BTC") is None  # oltre max_age niente prezzo
+    assert cache.snapshot() == {}
+
+    source.down = False
+    sim.advance(5)
+    assert cache.get("BTC") == 43000.5
+
+
+def test_first_load_failure_does_not_retry_every_read(sim):
+    source = Mids()
+    source.down = True
+    cache = PriceCache(source, ttl=2, retry_seconds=5, max_age=30)
+    for _ in range(10):
+        assert cache.get("BTC") is None
+    assert source.calls == 1
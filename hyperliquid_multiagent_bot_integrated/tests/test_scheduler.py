@@ -0,0 +1,97 @@
+"""SymbolScheduler: livelli hot/normal/idle, ordine di priorità in due(), token bucket e rimborsi."""
+import pytest
+from _bootstrap import load_module
+
+scheduler = load_module("orchestrator/shared/scheduler.py", "orchestrator_scheduler")
+
+PARAMS = dict(base_interval=900, hot_interval=300, idle_interval=2700, atr_hot_pct=0.01, atr_idle_pct=0.003)
+
+
+def make(symbols, calls_per_minute=600, calls_per_symbol=6):
+    return scheduler.SymbolScheduler(symbols, calls_per_minute=calls_per_minute,
+                                     calls_per_symbol=calls_per_symbol, **PARAMS)
+
+
+@pytest.mark.parametrize("calls_per_minute,calls_per_symbol", [(0, 6), (5, 6), (10, 0)])
+def test_budget_that_can_never_schedule_is_rejected(calls_per_minute, calls_per_symbol):
+    with pytest.raises(ValueError):
+        scheduler.SymbolScheduler(["BTC"], calls_per_minute=calls_per_minute,
+                                  calls_per_symbol=calls_per_symbol, **PARAMS)
+
+
+def test_refund_returns_unused_calls():
+    sched = scheduler.SymbolScheduler(["BTC", "ETH"], calls_per_minute=6, calls_per_symbol=6, **PARAMS)
+    assert sched.due(now=0.0) == ["BTC"]
+    assert sched.seconds_until_budget() == 60.0
+    sched.refund(1)
+    assert sched.seconds_until_budget() == 50.0
+
+
+def test_tiers_from_positions_and_atr():
+    sched = make(["BTC", "ETH", "SOL", "DOGE", "XRP"])
+    sched.update_positions(["BTC"])
+    sched.update_volatility("BTC", atr=1.0, price=1000.0)  # posizione aperta: hot anche se calmo
+    sched.update_volatility("ETH", atr=15.0, price=1000.0)  # 1.5%
+    sched.update_volatility("SOL", atr=5.0, price=1000.0)  # 0.5%
+    sched.update_volatility("DOGE", atr=1.0, price=1000.0)  # 0.1%
+    # XRP senza ATR: normal
+
+    assert {s: sched.tier(s) for s in sched.symbols} == {
+        "BTC": "hot", "ETH": "hot", "SOL": "normal", "DOGE": "idle", "XRP": "normal",
+    }
+    assert [sched.interval_for(s) for s in ("BTC", "SOL", "DOGE")] == [300, 900, 2700]
+
+    # chiusa la posizione BTC torna al livello della sua volatilità
+    sched.update_positions([])
+    assert sched.tier("BTC") == "idle"
+
+
+def test_due_respects_each_tier_cadence():
+    sched = make(["HOT", "NORMAL", "IDLE"])
+    sched.update_volatility("HOT", atr=2.0, price=100.0)
+    sched.update_volatility("NORMAL", atr=0.5, price=100.0)
+    sched.update_volatility("IDLE", atr=0.1, price=100.0)
+    for s in sched.symbols:
+        sched.mark_run(s, now=0.0)
+
+    assert sched.due(now=299.0) == []
+    assert sched.seconds_until_next(now=299.0) == 1.0
+    assert sched.due(now=300.0) == ["HOT"]
+    sched.mark_run("HOT", now=300.0)
+    assert sched.due(now=900.0) == ["HOT", "NORMAL"]
+    sched.mark_run("HOT", now=900.0)
+    sched.mark_run("NORMAL", now=900.0)
+    assert sched.due(now=2700.0) == ["HOT", "NORMAL", "IDLE"]
+
+
+def test_due_orders_by_tier_then_never_run_then_lateness():
+    sched = make(["IDLE", "NORMAL_LATE", "NORMAL_NEW", "NORMAL_LATER", "HOT"])
+    sched.update_volatility("IDLE", atr=0.1, price=100.0)
+    sched.update_volatility("HOT", atr=2.0, price=100.0)
+    sched.mark_run("NORMAL_LATE", now=0.0)
+    sched.mark_run("NORMAL_LATER", now=-100.0)
+    sched.mark_run("HOT", now=0.0)
+
+    assert sched.due(now=3000.0) == ["HOT", "NORMAL_NEW", "NORMAL_LATER", "NORMAL_LATE", "IDLE"]
+
+
+def test_budget_limits_and_refills_over_time():
+    # 12 chiamate/minuto, 6 per symbol: bucket pieno = 2 symbol, poi 1 ogni 30s
+    sched = make(["A", "B", "C", "D"], calls_per_minute=12, calls_per_symbol=6)
+    sched.update_positions(["C"])
+
+    def run(now):
+        picked = sched.due(now=now)
+        for s in picked:
+            sched.mark_run(s, now=now)
+        return picked
+
+    assert run(0.0) == ["C", "A"]
+    assert sched.seconds_until_budget() == 30.0
+    assert run(29.0) == []
+    assert run(30.0) == ["B"]
+    assert run(45.0) == []
+    assert run(60.0) == ["D"]
+    # il bucket non supera la capienza di un minuto anche dopo una lunga pausa
+    assert run(10000.0) == ["C", "A"]
+    assert sched.snapshot()["budget"]["tokens"] == 0
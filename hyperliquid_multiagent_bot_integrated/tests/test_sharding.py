@@ -0,0 +1,36 @@
+"""ShardCoordinator: prenotazioni MAX_POSITIONS condivise tra nodi."""
+import pytest
+from _bootstrap import load_module
+
+sharding = load_module("orchestrator/shared/sharding.py", "orchestrator_sharding")
+
+NOW = 1_000_000.0
+
+
+@pytest.fixture
+def nodes(tmp_path):
+    db = str(tmp_path / "cluster.db")
+    return [sharding.ShardCoordinator(db, f"node{i}", reservation_ttl=300.0) for i in (1, 2)]
+
+
+def test_reservation_consumed_when_position_opens(nodes):
+    a, b = nodes
+    assert a.reserve_position("BTC", 2, set(), now=NOW) is None
+    # BTC ora aperta: la sua prenotazione non occupa un secondo slot
+    assert b.reserve_position("ETH", 2, {"BTC"}, now=NOW + 1) is None
+    assert "max posizioni 2" in a.reserve_position("SOL", 2, {"BTC"}, now=NOW + 2)
+
+
+def test_same_symbol_reserved_once(nodes):
+    a, b = nodes
+    assert a.reserve_position("BTC", 3, set(), now=NOW) is None
+    assert b.reserve_position("BTC", 3, set(), now=NOW) == "OPEN di BTC già in corso su node1"
+
+
+def test_leave_keeps_inflight_reservations(nodes):
+    a, b = nodes
+    assert a.reserve_position("BTC", 1, set(), now=NOW) is None
+    a.leave()
+    # l'OPEN di node1 può ancora essere eseguito: lo slot resta occupato fino al TTL
+    assert b.reserve_position("ETH", 1, set(), now=NOW + 1) is not None
+    assert b.reserve_position("ETH", 1, set(), now=NOW + 301) is None
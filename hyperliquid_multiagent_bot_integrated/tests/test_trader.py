@@ -0,0 +1,129 @@
+"""HyperliquidTrader sincrono contro FakeInfo/FakeExchange senza latenza."""
+import threading
+
+import pytest
+
+
+def test_tick_between_fill_and_after_open_keeps_one_stop(trader):
+    market = trader.exchange.market
+    size = trader._usd_to_size("BTC", 100.0, trader._get_last_price("BTC"))
+    resp = trader._market_open("BTC", "long", size, 100.0, 0.02)
+    # il trailing engine vede la posizione prima di _after_open e mette il suo stop
+    trader.update_trailing_stops()
+    assert len(market.triggers) == 1
+
+    assert trader._after_open("BTC", "long", resp)["ok"]
+    # lo stop del tick viene spostato allo SL iniziale, non duplicato
+    assert len(market.triggers) == 1
+    oid = trader.trailing_state["BTC"]["stop_oid"]
+    assert oid in market.triggers
+    assert market.triggers[oid]["trigger_px"] == trader.trailing_state["BTC"]["stop_px"]
+
+
+def test_bulk_error_after_orders_releases_trailing_lock(trader, monkeypatch):
+    def broken(*args, **kwargs):
+        raise KeyError("avgPx")
+
+    monkeypatch.setattr(trader, "_init_trailing", broken)
+    with pytest.raises(KeyError):
+        trader.bulk_execute([{"symbol": "BTC", "action": "open", "side": "long", "size_usd": 100.0}])
+
+    # il trailing engine gira in un altro thread: il lock deve essere libero
+    acquired = []
+    t = threading.Thread(target=lambda: acquired.append(trader._trailing_lock.acquire(timeout=1)))
+    t.start()
+    t.join()
+    assert acquired == [True]
+
+
+def stops(trader, symbol):
+    return [t for t in trader.exchange.market.triggers.values() if t["coin"] == symbol]
+
+
+def open_bulk(trader, *symbols):
+    return trader.bulk_execute([{"symbol": s, "action": "open", "side": "long", "size_usd": 100.0}
+                                for s in symbols])
+
+
+def test_initial_stop_is_default_sl_not_max_risk(trader):
+    assert trader.open_position("BTC", "long", 100.0, sl_pct=0.05)["ok"]
+    state = trader.trailing_state["BTC"]
+    assert state["sl_pct"] == -trader.default_sl_pct
+    assert state["stop_px"] == trader._round_px("BTC", state["entry_px"] * (1.0 - trader.default_sl_pct))
+
+
+def test_bulk_mixed_open_and_close(trader):
+    market = trader.exchange.market
+    assert all(r["ok"] for r in open_bulk(trader, "BTC"))
+    assert len(stops(trader, "BTC")) == 1
+
+    results = trader.bulk_execute([
+        {"symbol": "BTC", "action": "close"},
+        {"symbol": "ETH", "action": "open", "side": "short", "size_usd": 100.0},
+    ])
+    assert [(r["symbol"], r["action"], r["ok"]) for r in results] == [("BTC", "close", True), ("ETH", "open", True)]
+    assert set(market.positions) == {"ETH"} and market.positions["ETH"]["szi"] < 0
+    # stop del BTC chiuso cancellato, uno nuovo (buy) per lo short ETH
+    assert stops(trader, "BTC") == []
+    assert [t["is_buy"] for t in stops(trader, "ETH")] == [True]
+    assert set(trader.trailing_state) == {"ETH"}
+
+
+def test_bulk_rejected_status_only_fails_that_order(trader, monkeypatch):
+    market = trader.exchange.market
+    real = trader.prices.snapshot()
+    # mid BTC sbagliato del 50%: l'IOC buy non è eseguibile entro il limit
+    monkeypatch.setattr(trader.prices, "snapshot", lambda: {**real, "BTC": real["BTC"] * 0.5})
+
+    results = open_bulk(trader, "BTC", "ETH")
+    assert [r["ok"] for r in results] == [False, True]
+    assert "non eseguibile" in results[0]["error"]
+    assert set(market.positions) == {"ETH"}
+    assert "BTC" not in trader.trailing_state and stops(trader, "BTC") == []
+    # anche l'ordine rifiutato finisce nel log di esecuzione
+    assert [(r["symbol"], r["ok"]) for r in trader.executions.recent(2)] == [("BTC", False), ("ETH", True)]
+
+
+def test_bulk_partial_close_keeps_stop_on_remainder(trader):
+    market = trader.exchange.market
+    open_bulk(trader, "BTC")
+    size = abs(market.positions["BTC"]["szi"])
+    oid = trader.trailing_state["BTC"]["stop_oid"]
+    market.depth["BTC"] = size / 2  # book sottile: l'IOC esegue metà
+
+    [res] = trader.bulk_execute([{"symbol": "BTC", "action": "close"}])
+    assert not res["ok"] and "parziale" in res["error"]
+    remaining = abs(market.positions["BTC"]["szi"])
+    assert remaining == pytest.approx(size / 2)
+    # stesso stop, spostato (nuovo oid) sulla size residua
+    [stop] = stops(trader, "BTC")
+    assert stop["sz"] == pytest.approx(remaining)
+    assert trader.trailing_state["BTC"]["stop_oid"] not in (None, oid)
+
+
+def test_close_position_partial_fill_keeps_stop_on_remainder(trader):
+    market = trader.exchange.market
+    assert trader.open_position("BTC", "long", 100.0, sl_pct=0.02)["ok"]
+    size = abs(market.positions["BTC"]["szi"])
+    market.depth["BTC"] = size / 4
+
+    res = trader.close_position("BTC")
+    assert not res["ok"] and "parziale" in res["error"]
+    [stop] = stops(trader, "BTC")
+    assert stop["sz"] == pytest.approx(size * 3 / 4)
+    assert "BTC" in trader.trailing_state
+
+    # il resto si chiude: stop e stato via
+    del market.depth["BTC"]
+    assert trader.close_position("BTC")["ok"]
+    assert stops(trader, "BTC") == [] and "BTC" not in trader.trailing_state
+
+
+def test_open_below_exchange_minimum_is_invalid_and_logged(trader):
+    market = trader.exchange.market
+    res = trader.open_position("BTC", "long", usd_amount=1.0, sl_pct=0.02)
+    assert res["ok"] is False and res["invalid"] is True
+    assert "non valido" in res["error"]
+    assert "BTC" not in market.positions and "BTC" not in trader.trailing_state
+    row = trader.executions.recent(1)[0]
+    assert (row["symbol"], row["action"], row["ok"]) == ("BTC", "open", False)
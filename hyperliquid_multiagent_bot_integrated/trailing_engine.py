@@ -0,0 +1,126 @@
+"""
+Trailing stop vettorizzato.
+
+TrailingBook tiene le posizioni aperte in array paralleli (entry, verso,
+size, sl_pct) e valuta profit, scala dello SL e trigger di tutte le
+posizioni in un solo passaggio NumPy: il costo di un tick resta quasi
+costante al crescere delle posizioni. Gli array vengono ricostruiti solo
+quando cambia l'insieme delle posizioni (open/close/fill).
+
+TrailingEngine fa girare HyperliquidTrader.update_trailing_stops() nel
+position manager ogni TRAILING_ENGINE_INTERVAL_SECONDS, senza aspettare
+il ciclo dell'orchestratore, e subito ad ogni evento prezzo (notify(),
+es. dallo stream allMids).
+"""
+import threading
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+import numpy as np
+
+from .config import TRAILING_ENGINE_INTERVAL_SECONDS
+from .logging_config import setup_logger
+
+logger = setup_logger("trailing_engine")
+
+# scala dello SL: sotto +0.5% di profit resta lo SL iniziale, poi segue a profit - 1%
+LADDER_ACTIVATION = 0.005
+LADDER_OFFSET = 0.01
+
+
+class TrailingBook:
+    """Posizioni aperte in array paralleli, una riga per symbol."""
+
+    def __init__(self):
+        self.symbols: List[str] = []
+        self.sides: List[str] = []
+        self.entry = np.empty(0)
+        self.sign = np.empty(0)     # +1 long, -1 short
+        self.size = np.empty(0)
+        self.sl_pct = np.empty(0)
+        self._key: Optional[tuple] = None
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def sync(self, positions: Iterable[Dict[str, Any]], state: Mapping[str, Dict[str, Any]],
+             default_sl_pct: float) -> bool:
+        """
+        Allinea gli array alle posizioni aperte. Lo sl_pct di partenza viene
+        dallo stato trailing del trader. Ritorna True se ha ricostruito.
+        """
+        rows = [p for p in positions if p["entry_price"] > 0]
+        key = tuple((p["symbol"], p["side"], p["entry_price"], p["size"]) for p in rows)
+        if key == self._key:
+            return False
+        self._key = key
+        self.symbols = [p["symbol"] for p in rows]
+        self.sides = [p["side"] for p in rows]
+        self.entry = np.array([p["entry_price"] for p in rows], dtype=float)
+        self.sign = np.array([1.0 if p["side"] == "long" else -1.0 for p in rows])
+        self.size = np.array([p["size"] for p in rows], dtype=float)
+        self.sl_pct = np.array([(state.get(p["symbol"]) or {}).get("sl_pct", -abs(default_sl_pct))
+                                for p in rows], dtype=float)
+        return True
+
+    def evaluate(self, last: np.ndarray, default_sl_pct: float) -> Dict[str, np.ndarray]:
+        """
+        Un passaggio su tutte le posizioni. `last` è allineato a `symbols`
+        (NaN = prezzo mancante: la riga non si muove e non scatta).
+        Aggiorna sl_pct (mai all'indietro) e ritorna gli array del tick.
+        """
+        valid = np.isfinite(last)
+        pnl_pct = self.sign * (last - self.entry) / self.entry
+        target = np.where(pnl_pct < LADDER_ACTIVATION, -abs(default_sl_pct), pnl_pct - LADDER_OFFSET)
+        new_sl = np.where(valid, np.maximum(self.sl_pct, target), self.sl_pct)
+        improved = new_sl > self.sl_pct
+        sl_price = self.entry * (1.0 + self.sign * new_sl)
+        # long: last <= sl_price, short: last >= sl_price
+        stop_hit = valid & (self.sign * (last - sl_price) <= 0.0)
+        self.sl_pct = new_sl
+        return {"valid": valid, "pnl_pct": pnl_pct, "sl_pct": new_sl, "sl_price": sl_price,
+                "improved": improved, "stop_hit": stop_hit}
+
+    def invalidate(self) -> None:
+        self._key = None
+
+
+class TrailingEngine:
+    """Thread del position manager che esegue il trailing a intervallo fisso o su evento prezzo."""
+
+    def __init__(self, trader, interval: float = TRAILING_ENGINE_INTERVAL_SECONDS):
+        self.trader = trader
+        self.interval = float(interval)
+        self.ticks = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "TrailingEngine":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="trailing-engine", daemon=True)
+            self._thread.start()
+            logger.info("Trailing engine avviato (intervallo %.1fs)", self.interval)
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def notify(self, *_: Any) -> None:
+        """Evento prezzo: anticipa il prossimo tick."""
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.trader.update_trailing_stops()
+                self.ticks += 1
+            except Exception as e:
+                logger.error("Errore nel tick del trailing engine: %s", e)
@@ -0,0 +1,79 @@
+"""
+Snapshot durevole dello stato trailing (SQLite, WAL).
+
+Una riga per symbol con sl_pct, stop nativo (oid, prezzo) e la posizione
+a cui si riferisce (verso, entry). Il trader ci scrive ad ogni modifica
+(write-through, poche righe e solo quando lo SL migliora), così dopo un
+riavvio gli SL già portati in profitto non tornano a -default_sl_pct:
+HyperliquidTrader.restore_trailing_state() li ricarica e li riconcilia
+con le posizioni aperte.
+"""
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Tuple
+
+from . import clock
+from .logging_config import setup_logger
+
+logger = setup_logger("trailing_store")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS trailing_state (
+    symbol      TEXT PRIMARY KEY,
+    sl_pct      REAL NOT NULL,
+    stop_oid    INTEGER,
+    stop_px     REAL,
+    side        TEXT,
+    entry_px    REAL,
+    updated_at  REAL NOT NULL
+);
+"""
+
+_FIELDS = ("sl_pct", "stop_oid", "stop_px", "side", "entry_px")
+
+
+class TrailingStore:
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # una sola connessione condivisa (trailing engine + richieste HTTP), serializzata dal lock
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT symbol, sl_pct, stop_oid, stop_px, side, entry_px FROM trailing_state"
+            ).fetchall()
+        return {row[0]: dict(zip(_FIELDS, row[1:])) for row in rows}
+
+    def put_many(self, items: Iterable[Tuple[str, Dict[str, Any]]]) -> None:
+        """Scrive (upsert) gli stati dati in una transazione."""
+        now = clock.now()
+        params = [(symbol, *(state.get(f) for f in _FIELDS), now) for symbol, state in items]
+        if not params:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO trailing_state "
+                "(symbol, sl_pct, stop_oid, stop_px, side, entry_px, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                params,
+            )
+
+    def put(self, symbol: str, state: Dict[str, Any]) -> None:
+        self.put_many([(symbol, state)])
+
+    def delete(self, *symbols: str) -> None:
+        if not symbols:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM trailing_state WHERE symbol = ?", [(s,) for s in symbols])
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()